@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Confines the benchmark to a set of CPUs without hotplugging the others.
+
+Two backends are supported:
+ - 'cgroup': moves the process into a cgroup v2 cpuset.
+ - 'affinity': sets the CPU affinity of the process with
+   sched_setaffinity().
+In both cases, the children of the process inherit the CPU set.
+"""
+
+from __future__ import print_function
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'pyro'))
+from pyro import osutil
+
+BACKENDS = ['cgroup', 'affinity']
+CGROUP_ROOT = '/sys/fs/cgroup'
+CGROUP_NAME = 'mfsbench'
+
+
+def cgroup_available(root=CGROUP_ROOT):
+    """Returns True if the cgroup v2 cpuset controller is available.
+    """
+    controllers = os.path.join(root, 'cgroup.controllers')
+    if not os.path.exists(controllers):
+        return False
+    with open(controllers) as fobj:
+        return 'cpuset' in fobj.read().split()
+
+
+def write_cgroup(path, name, value):
+    with open(os.path.join(path, name), 'w') as fobj:
+        fobj.write(value)
+
+
+class CpuSet:
+    """Confines the current process (and its children) to a CPU set.
+    """
+    def __init__(self, cpus, backend='cgroup', mems=''):
+        """Constructs a CpuSet.
+
+        @param cpus the CPUs, e.g., '0-3,8-11'.
+        @param backend one of BACKENDS. 'cgroup' falls back to 'affinity' if
+        the cgroup v2 cpuset controller is not available.
+        @param mems the memory nodes of the cgroup cpuset, e.g., '0-1'. Empty
+        to use all memory nodes.
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown CPU backend: {}'.format(backend))
+        self.cpus = cpus
+        self.mems = mems
+        self.backend = backend
+        self.path = os.path.join(CGROUP_ROOT, CGROUP_NAME)
+        self.old_affinity = None
+
+    def confine(self):
+        """Moves the current process into the CPU set.
+
+        @return the backend actually used.
+        """
+        if self.backend == 'cgroup' and not cgroup_available():
+            print('cgroup v2 cpuset is not available, use sched_setaffinity.')
+            self.backend = 'affinity'
+        if self.backend == 'cgroup':
+            write_cgroup(CGROUP_ROOT, 'cgroup.subtree_control', '+cpuset')
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            write_cgroup(self.path, 'cpuset.cpus', self.cpus)
+            if self.mems:
+                write_cgroup(self.path, 'cpuset.mems', self.mems)
+            write_cgroup(self.path, 'cgroup.procs', str(os.getpid()))
+        else:
+            self.old_affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, osutil.parse_cpus(self.cpus))
+        return self.backend
+
+    def release(self):
+        """Moves the current process out of the CPU set.
+        """
+        if self.backend == 'cgroup':
+            write_cgroup(CGROUP_ROOT, 'cgroup.procs', str(os.getpid()))
+        elif self.old_affinity:
+            os.sched_setaffinity(0, self.old_affinity)
+
+
+def read_cpu_times():
+    """Reads the kernel time (system, irq and softirq) and the total time of
+    each CPU from /proc/stat.
+
+    @return a dict of {cpu: (kernel, total)} in jiffies.
+    """
+    times = {}
+    with open('/proc/stat') as fobj:
+        for line in fobj:
+            if not line.startswith('cpu') or line.startswith('cpu '):
+                continue
+            fields = line.split()
+            values = [int(x) for x in fields[1:9]]
+            # user nice system idle iowait irq softirq steal
+            times[int(fields[0][3:])] = (values[2] + values[5] + values[6],
+                                         sum(values))
+    return times
+
+
+def outside_kernel_share(before, after, cpus):
+    """Calculates the share of the kernel time that lands outside the CPU
+    set, e.g., the interrupts and the kernel threads on the other CPUs.
+
+    @param before the read_cpu_times() before the run.
+    @param after the read_cpu_times() after the run.
+    @param cpus the CPU set, e.g., '0-3'.
+    @return a dict of the kernel time (in jiffies) inside and outside the set,
+    and the share of the outside one.
+    """
+    cpuset = osutil.parse_cpus(cpus)
+    inside = 0
+    outside = 0
+    for cpu in after:
+        delta = after[cpu][0] - before.get(cpu, (0, 0))[0]
+        if cpu in cpuset:
+            inside += delta
+        else:
+            outside += delta
+    total = inside + outside
+    return {'inside': inside, 'outside': outside,
+            'share': float(outside) / total if total else 0.0}
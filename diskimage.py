@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""A cache of golden disk images.
+
+A golden image is a formatted file system with the filesets of one workload
+already populated. Restoring it onto a RAM disk is a bulk copy, which is much
+faster than running mkfs and preallocating the filesets on every iteration.
+"""
+
+from __future__ import print_function
+from subprocess import check_call
+import hashlib
+import os
+
+# The size of the chunk to copy and checksum the images.
+CHUNK_SIZE = 4 * 1024 * 1024
+# The commands to give a file system a new random UUID. The disks restored
+# from the same image share its UUID, and xfs and btrfs refuse to mount a
+# second file system with the same UUID.
+UUID_COMMANDS = {
+    'ext2': ['tune2fs', '-U', 'random'],
+    'ext3': ['tune2fs', '-U', 'random'],
+    'ext4': ['tune2fs', '-U', 'random'],
+    'xfs': ['xfs_admin', '-U', 'generate'],
+    'btrfs': ['btrfstune', '-f', '-u'],
+}
+
+
+class ChecksumError(IOError):
+    """The restored disk does not match the checksum of the golden image.
+    """
+    pass
+
+
+def device_size(device):
+    """Returns the size of a block device in bytes.
+
+    @param device the path of the device, e.g., '/dev/ram0'.
+    """
+    name = os.path.basename(device)
+    with open('/sys/block/{}/size'.format(name)) as fobj:
+        return int(fobj.read()) * 512
+
+
+def copy_device(src, dst, size, digest=True):
+    """Copies the first size bytes from src to dst.
+
+    @param digest if False, skips the checksum of the copied data.
+    @return the SHA-1 of the copied data, or None if digest is False.
+    """
+    sha1 = hashlib.sha1() if digest else None
+    with open(src, 'rb') as infile, open(dst, 'r+b') as outfile:
+        remaining = size
+        while remaining > 0:
+            chunk = infile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            outfile.write(chunk)
+            if sha1:
+                sha1.update(chunk)
+            remaining -= len(chunk)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    return sha1.hexdigest() if sha1 else None
+
+
+def new_uuid(device, fs):
+    """Gives the unmounted file system on a device a new random UUID.
+
+    @param fs the file system type, e.g., 'xfs'. The file systems that are
+    not in UUID_COMMANDS are left as they are.
+    @exception CalledProcessError if the command fails.
+    """
+    if fs in UUID_COMMANDS:
+        with open(os.devnull, 'w') as devnull:
+            check_call(UUID_COMMANDS[fs] + [device], stdout=devnull)
+
+
+def checksum(path, size):
+    """Returns the SHA-1 of the first size bytes of a file or a device.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fobj:
+        remaining = size
+        while remaining > 0:
+            chunk = fobj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            sha1.update(chunk)
+            remaining -= len(chunk)
+    return sha1.hexdigest()
+
+
+class ImageCache:
+    """A directory of golden images, keyed by the configurations used to
+    build them, e.g., the file system, the mount options and the shape of
+    the filesets.
+    """
+    def __init__(self, path):
+        """Opens (or creates) an image cache.
+
+        @param path the directory to store the images.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(**conf):
+        """Returns the key of the image built with conf.
+
+        @param conf the configurations to build the image, e.g., fs,
+        no_journal, options, workload, nfiles, ndirs and size.
+        """
+        desc = ','.join('{}={}'.format(k, conf[k]) for k in sorted(conf))
+        return '{}_{}'.format(conf.get('fs', 'disk'),
+                              hashlib.sha1(desc.encode()).hexdigest()[:16])
+
+    def image_path(self, key):
+        return os.path.join(self.path, key + '.img')
+
+    def checksum_path(self, key):
+        return os.path.join(self.path, key + '.sha1')
+
+    def has(self, key):
+        """Returns True if the image of key has been saved.
+        """
+        return os.path.exists(self.image_path(key)) and \
+            os.path.exists(self.checksum_path(key))
+
+    def save(self, key, device):
+        """Saves the content of a device as the golden image of key.
+
+        The device must not be mounted.
+        """
+        image = self.image_path(key)
+        size = device_size(device)
+        print('Saving golden image {} from {}...'.format(image, device))
+        tmpfile = image + '.tmp'
+        with open(tmpfile, 'wb') as fobj:
+            fobj.truncate(size)
+        digest = copy_device(device, tmpfile, size)
+        os.rename(tmpfile, image)
+        with open(self.checksum_path(key), 'w') as fobj:
+            fobj.write('{} {}\n'.format(digest, size))
+
+    def read_checksum(self, key):
+        """Returns the (checksum, size) of the image of key.
+        """
+        with open(self.checksum_path(key)) as fobj:
+            digest, size = fobj.read().split()
+        return digest, int(size)
+
+    def restore(self, key, device, verify=False):
+        """Restores the golden image of key onto a device.
+
+        @param verify if True, checks the image against its checksum while
+        copying it, and reads the device back to compare it with the
+        checksum. It reads the image size twice more, which can be slower
+        than formatting a large RAM disk, so it is off by default.
+        @exception ChecksumError if the restored device does not match the
+        image.
+        """
+        image = self.image_path(key)
+        digest, size = self.read_checksum(key)
+        if device_size(device) < size:
+            raise IOError('{} is smaller than the image {}'.format(
+                device, image))
+        copied = copy_device(image, device, size, digest=verify)
+        if not verify:
+            return
+        if copied != digest:
+            raise ChecksumError('The image {} is corrupted'.format(image))
+        if checksum(device, size) != digest:
+            raise ChecksumError('Failed to restore {} onto {}'.format(
+                image, device))
@@ -6,13 +6,17 @@ from __future__ import print_function
 
 import argparse
 import glob
+import itertools
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
 import sys
+sys.path.append('..')
 sys.path.append('../pyro')
-from pyro import analysis, perftest, plot
+from pyro import analysis, osutil, perftest, plot
+from resultstore import ResultStore, RESULT_DB
+import mfsbase
 import numpy as np
 
 
@@ -30,6 +34,149 @@ def read_result_file(filepath):
     return map(float, line.split())
 
 
+# The positions of the test configurations in the legacy result filenames,
+# i.e., '{test}_{fs}_{workload}_{ndisks}_{ndirs}_{x}_{iteration}_results.txt'.
+LEGACY_FIELDS = {'ndisks': 3, 'ndirs': 4, 'nprocs': 5, 'ncpus': 5, 'cpus': 5}
+# The I/O size of the runs, unless the test sweeps the I/O sizes.
+DEFAULT_IOSIZE = 4096
+
+
+def series_name(workload, contention, concurrency=None, iosize=None,
+                filesize=None):
+    """Returns the name of the curve of a workload in a contention topology,
+    a concurrency model, an I/O size and a mean file size.
+    """
+    fields = [workload]
+    if contention not in (None, 'dir'):
+        fields.append(contention)
+    if concurrency not in (None, 'procs'):
+        fields.append(concurrency)
+    if iosize not in (None, DEFAULT_IOSIZE):
+        fields.append('io' + mfsbase.format_size(iosize))
+    if filesize:
+        fields.append('file' + mfsbase.format_size(filesize))
+    return '-'.join(fields)
+
+
+def short_label(workload):
+    """Returns the short label of a curve, i.e., the initial of the workload
+    followed by the contention topology and the concurrency model, e.g.,
+    'v-shared-threads'.
+    """
+    name, sep, contention = workload.partition('-')
+    return name[0] + sep + contention
+
+
+def load_results(dirpath, x_field, measures=('iops', 'throughput')):
+    """Loads the filebench results of one test campaign.
+
+    It queries the result store of the campaign if it exists, otherwise
+    falls back to scanning the '*_results.txt' files.
+
+    The results of a contention topology, a concurrency model, an I/O size
+    or a file size other than the default one are put under their own
+    workload, e.g., 'varmail-shared' or 'varmail-io64k', so that they are
+    plotted as their own curves.
+
+    @param x_field the configuration to use as the x values, e.g., 'nprocs'.
+    For 'nprocs', the x values are the total numbers of threads, so that the
+    processes and threads of the same concurrency are plotted together.
+    @param measures the names of IOPS and throughput in the returned result.
+    @return analysis.Result of {fs: {workload: {x: {measure: [values]}}}}.
+    """
+    db_path = os.path.join(dirpath, RESULT_DB)
+    if os.path.exists(db_path):
+        store = ResultStore(db_path)
+        rows = [(fs, series_name(workload, contention, concurrency, iosize,
+                                 filesize),
+                 x_value * (nthreads or 1) if x_field == 'nprocs'
+                 else x_value, iops, throughput)
+                for fs, workload, contention, concurrency, iosize, filesize,
+                nthreads, x_value, iops, throughput in
+                store.select(['fs', 'workload', 'contention', 'concurrency',
+                              'iosize', 'filesize', 'nthreads', x_field,
+                              'iops', 'throughput'])]
+        store.close()
+    else:
+        rows = []
+        for filename in glob.glob(dirpath + '/*_results.txt'):
+            fields = parse_filename(os.path.basename(filename))
+            if fields[7] != 'results.txt':
+                continue
+            x_value = fields[LEGACY_FIELDS[x_field]]
+            if x_field != 'cpus':
+                x_value = int(x_value)
+            iops, throughput = read_result_file(filename)
+            rows.append((fields[1], fields[2], x_value, iops, throughput))
+
+    result = analysis.Result()
+    for fs, workload, x_value, iops, throughput in rows:
+        if not result[fs, workload, x_value]:
+            result[fs, workload, x_value] = {measures[0]: [],
+                                             measures[1]: []}
+        result[fs, workload, x_value, measures[0]].append(iops)
+        result[fs, workload, x_value, measures[1]].append(throughput)
+    return result
+
+
+# The configuration that each test sweeps, i.e., the x values of its plots.
+TEST_X_FIELDS = {'scale': 'nprocs', 'cpuscale': 'ncpus', 'numa': 'cpus',
+                 'multifs': 'ndisks', 'dataset': 'nfiles'}
+
+
+def load_outputs(dirpath, suffix):
+    """Finds the output files of one kind in a test campaign, e.g., the perf
+    reports, with the curves and the x values of their cells.
+
+    It maps each file to its cell by the output prefix in the result store
+    if it exists, otherwise it parses the legacy filenames. The curves are
+    named as in load_results().
+
+    @param suffix the suffix of the output files, e.g., '_perf.txt'.
+    @return a list of (filename, test, fs, series, x).
+    """
+    outputs = []
+    db_path = os.path.join(dirpath, RESULT_DB)
+    if os.path.exists(db_path):
+        store = ResultStore(db_path)
+        rows = store.select(['output', 'test', 'fs', 'workload', 'contention',
+                             'concurrency', 'iosize', 'filesize', 'nthreads',
+                             'ndisks', 'nprocs', 'ncpus', 'cpus', 'nfiles'])
+        store.close()
+        for row in rows:
+            output, test, fs = row[:3]
+            filename = os.path.join(dirpath, (output or '') + suffix)
+            if not output or not os.path.exists(filename):
+                continue
+            config = dict(zip(['ndisks', 'nprocs', 'ncpus', 'cpus',
+                               'nfiles'], row[9:]))
+            x_field = TEST_X_FIELDS.get(test, 'nprocs')
+            x_value = config[x_field]
+            if x_field == 'nprocs':
+                x_value *= row[8] or 1
+            outputs.append((filename, test, fs,
+                            series_name(*row[3:8]), x_value))
+        return outputs
+
+    for filename in glob.glob(dirpath + '/*' + suffix):
+        fields = parse_filename(os.path.basename(filename))
+        test = fields[0]
+        if test == 'ncpu':
+            fields = fields[1:]
+        x_field = TEST_X_FIELDS.get(test, 'nprocs')
+        # The values of the cell other than the defaults follow the label,
+        # e.g., '48-shared-io64k'.
+        label = fields[5].split('-')
+        x_value = label[0]
+        if x_field in LEGACY_FIELDS and LEGACY_FIELDS[x_field] != 5:
+            x_value = fields[LEGACY_FIELDS[x_field]]
+        if x_field != 'cpus':
+            x_value = int(x_value)
+        series = '-'.join([fields[2]] + label[1:])
+        outputs.append((filename, test, fields[1], series, x_value))
+    return outputs
+
+
 def output_dir(input_dir):
     """Returns the path of output directory.
     If the output directory is not existed, it creates a new directory.
@@ -41,34 +188,40 @@ def output_dir(input_dir):
     return output_dir
 
 
+# The CPU sets of the NUMA tests on the 48-core machine, before the result
+# store recorded the memory nodes of each CPU set.
+LEGACY_NUMA_CPUS = ['0-23', '0-11,24-35', '0-5,12-17,24-29,36-41',
+                    '0-2,6-8,12-14,18-20,24-26,30-32,36-38,42-44']
+
+
+def numa_configs(dirpath):
+    """Returns the CPU sets of a NUMA test and their labels, ordered by the
+    number of NUMA nodes they spread over.
+    """
+    db_path = os.path.join(dirpath, RESULT_DB)
+    rows = []
+    if os.path.exists(db_path):
+        store = ResultStore(db_path)
+        rows = set(store.select(['cpus', 'mems']))
+        store.close()
+    if not rows or any(mems is None for _, mems in rows):
+        return LEGACY_NUMA_CPUS, ['a', 'b', 'c', 'd']
+    nodes = {cpus: len(osutil.parse_cpus(mems)) for cpus, mems in rows}
+    numa_cpus = sorted(nodes, key=lambda cpus: (nodes[cpus], cpus))
+    labels = ['{} node{}'.format(nodes[cpus], 's' if nodes[cpus] > 1 else '')
+              for cpus in numa_cpus]
+    return numa_cpus, labels
+
+
 def plot_numa_result(args):
     """Plot NUMA results.
     """
     outdir = output_dir(args.dir)
-    files = glob.glob(args.dir + '/*_results.txt')
-    fb_result = analysis.Result()  # filebench result
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        fs = fields[1]
-        workload = fields[2]
-        cpus = fields[5]
-        # iteration = int(fields[6])
-        result = fields[7]
-        # print(test, fs, workload, cpus, iteration, result)
-        if result == 'results.txt':
-            with open(filename) as fobj:
-                line = fobj.readline()
-            iops, throughput = map(float, line.split())
-            # print(iops, throughput)
-            if not fb_result[fs, workload, cpus]:
-                fb_result[fs, workload, cpus] = {"iops": [], "throughput": []}
-            fb_result[fs, workload, cpus, "iops"].append(iops)
-            fb_result[fs, workload, cpus, "throughput"].append(throughput)
+    fb_result = load_results(args.dir, 'cpus')  # filebench result
     # print(fb_result)
     # print(fb_result.keys())
 
-    numa_cpus = ['0-23', '0-11,24-35', '0-5,12-17,24-29,36-41',
-                 '0-2,6-8,12-14,18-20,24-26,30-32,36-38,42-44']
+    numa_cpus, labels = numa_configs(args.dir)
     for fs in fb_result:
         for measure in ['iops', 'throughput']:
             bars = []
@@ -85,8 +238,7 @@ def plot_numa_result(args):
             num_wl = len(fb_result[fs])
             x_values = np.array([0.1 + i for i in range(num_wl)])
             width = 0.2
-            hatches = ['', '/', 'x', '-']
-            labels = ['a', 'b', 'c', 'd']
+            hatches = ['', '/', 'x', '-', '\\', '+', 'o', '.']
             for i, h, l in zip(range(len(numa_cpus)), hatches, labels):
                 plt.bar(x_values, bars[i::len(numa_cpus)], width=width,
                         color='w', hatch=h, label=l)
@@ -111,20 +263,7 @@ def plot_multifs_result(args):
     """Plot Multi-filesystem results.
     """
     outdir = output_dir(args.dir)
-    files = glob.glob(args.dir + '/*_results.txt')
-    result = analysis.Result()
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        fs = fields[1]
-        workload = fields[2]
-        ndisks = int(fields[3])
-        with open(filename) as fobj:
-            line = fobj.readline()
-        iops, throughput = map(float, line.split())
-        if not result[fs, workload, ndisks]:
-            result[fs, workload, ndisks] = {'iops': [], 'throughput': []}
-        result[fs, workload, ndisks, 'iops'].append(iops)
-        result[fs, workload, ndisks, 'throughput'].append(throughput)
+    result = load_results(args.dir, 'ndisks')
 
     for fs in result:
         for measure in ['iops', 'throughput']:
@@ -148,24 +287,80 @@ def plot_multifs_result(args):
             plt.close()
 
 
+def plot_dataset_result(args):
+    """Plots the IOPS and throughput over the number of files, with the
+    memory of the dentry and inode caches on the right axis.
+    """
+    outdir = output_dir(args.dir)
+    output_prefix = os.path.join(outdir, os.path.basename(args.dir))
+    store = ResultStore(os.path.join(args.dir, RESULT_DB))
+    rows = store.select(['fs', 'workload', 'contention', 'concurrency',
+                         'iosize', 'filesize', 'dirwidth', 'nfiles', 'iops',
+                         'throughput', 'dentry_slab', 'inode_slab'])
+    store.close()
+    result = analysis.Result()
+    for fs, wl, contention, concurrency, iosize, filesize, dirwidth, \
+            nfiles, iops, throughput, dentry, inode in rows:
+        name = series_name(wl, contention, concurrency, iosize, filesize)
+        if dirwidth:
+            name += ' (width {})'.format(dirwidth)
+        if not result[fs, name, nfiles]:
+            result[fs, name, nfiles] = {'iops': [], 'throughput': [],
+                                        'slab': []}
+        result[fs, name, nfiles, 'iops'].append(iops)
+        result[fs, name, nfiles, 'throughput'].append(throughput)
+        result[fs, name, nfiles, 'slab'].append(
+            ((dentry or 0) + (inode or 0)) / (1024.0 * 1024))
+
+    linestyles = ['-', '--', '-.', ':']
+    for fs in result:
+        for measure in ['iops', 'throughput']:
+            fig, ax = plt.subplots()
+            slab_ax = ax.twinx()
+            for wl, ls in zip(sorted(result[fs].keys()),
+                              itertools.cycle(linestyles)):
+                x_values = sorted(result[fs, wl].keys())
+                ax.plot(x_values,
+                        [np.mean(result[fs, wl, x, measure])
+                         for x in x_values],
+                        ls, marker='+', label=wl, color='k')
+                slab_ax.plot(x_values,
+                             [np.mean(result[fs, wl, x, 'slab'])
+                              for x in x_values],
+                             ls, marker='o', color='r')
+            ax.set_xscale('log')
+            ax.set_ylim(0)
+            slab_ax.set_ylim(0)
+            ax.set_xlabel('Number of Files')
+            ax.set_ylabel('IOPS' if measure == 'iops'
+                          else 'Throughput (MB/s)')
+            slab_ax.set_ylabel('Dentry + Inode Cache (MB)', color='r')
+            ax.legend(loc='best')
+            ax.set_title('Dataset Scaling Test (%s)' % fs)
+            fig.savefig('%s_%s_%s.%s' % (output_prefix, fs, measure,
+                                         args.ext))
+            plt.close(fig)
+
+
 def plot_scale_figure(dirpath, result, field, xlabel, ext='pdf'):
     """
     @param field "iops" or "throughput"
     """
     outdir = output_dir(dirpath)
     output_prefix = os.path.join(outdir, os.path.basename(dirpath))
-    workload_linestyles = ['-', '--', '-+', '*']
+    workload_linestyles = ['-', '--', '-+', '*', '-.', ':', '-o', '-x']
     colors = ['b', 'r', 'k', 'y']
     plt.figure()
     for fs, color in zip(result, colors):
-        for wl, ls in zip(sorted(result[fs].keys()), workload_linestyles):
+        for wl, ls in zip(sorted(result[fs].keys()),
+                          itertools.cycle(workload_linestyles)):
             x_values = sorted(result[fs, wl].keys())
             y_values = []
             for xval in x_values:
                 y_values.append(result[fs, wl, xval, field])
             # print(result[fs, wl])
-            plt.plot(x_values, y_values, ls, label='%s (%s)' % (wl[0], fs),
-                     color=color)
+            plt.plot(x_values, y_values, ls,
+                     label='%s (%s)' % (short_label(wl), fs), color=color)
 
     plt.ylim(0)
     plt.legend(ncol=2)
@@ -210,44 +405,78 @@ def plot_per_workload_scale_figure(dirpath, result, wl, field, xlabel, ext):
     plt.close()
 
 
+def plot_heatmaps(dirpath, ext='pdf'):
+    """Plots the heatmaps of the IOPS and throughput over the I/O sizes and
+    the numbers of threads, for each file system and workload swept over
+    more than one I/O size.
+    """
+    db_path = os.path.join(dirpath, RESULT_DB)
+    if not os.path.exists(db_path):
+        return
+    store = ResultStore(db_path)
+    rows = store.select(['fs', 'workload', 'contention', 'concurrency',
+                         'filesize', 'iosize', 'nprocs', 'nthreads', 'iops',
+                         'throughput'])
+    store.close()
+    result = analysis.Result()
+    for fs, wl, contention, concurrency, filesize, iosize, nprocs, \
+            nthreads, iops, throughput in rows:
+        name = series_name(wl, contention, concurrency, filesize=filesize)
+        iosize = iosize or DEFAULT_IOSIZE
+        threads = nprocs * (nthreads or 1)
+        if not result[fs, name, iosize, threads]:
+            result[fs, name, iosize, threads] = {'iops': [], 'throughput': []}
+        result[fs, name, iosize, threads, 'iops'].append(iops)
+        result[fs, name, iosize, threads, 'throughput'].append(throughput)
+
+    outdir = output_dir(dirpath)
+    output_prefix = os.path.join(outdir, os.path.basename(dirpath))
+    for fs in result:
+        for wl in result[fs]:
+            iosizes = sorted(result[fs, wl].keys())
+            if len(iosizes) < 2:
+                continue
+            threads = sorted(set(x for iosize in iosizes
+                                 for x in result[fs, wl, iosize].keys()))
+            for measure in ['iops', 'throughput']:
+                grid = np.full((len(iosizes), len(threads)), np.nan)
+                for row, iosize in enumerate(iosizes):
+                    for col, x in enumerate(threads):
+                        if result[fs, wl, iosize, x]:
+                            grid[row, col] = np.mean(
+                                result[fs, wl, iosize, x, measure])
+                fig, ax = plt.subplots()
+                image = ax.imshow(grid, origin='lower', aspect='auto',
+                                  interpolation='nearest')
+                fig.colorbar(image, ax=ax,
+                             label='IOPS' if measure == 'iops'
+                             else 'Throughput (MB/s)')
+                ax.set_xticks(range(len(threads)))
+                ax.set_xticklabels(threads)
+                ax.set_yticks(range(len(iosizes)))
+                ax.set_yticklabels([mfsbase.format_size(x) for x in iosizes])
+                ax.set_xlabel('Threads')
+                ax.set_ylabel('I/O Size')
+                ax.set_title('Filebench I/O Size Test (%s, %s)' % (fs, wl))
+                fig.savefig('%s_%s_%s_%s_heatmap.%s' % (
+                    output_prefix, fs, wl, measure, ext))
+                plt.close(fig)
+
+
 def plot_scale_result(args):
     """Plots performance results for scalability test.
     """
-    files = glob.glob(args.dir + '/*_results.txt')
-    fb_result = analysis.Result()
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        fs = fields[1]
-        workload = fields[2]
-        nproc = int(fields[5])
-        result = fields[7]
-        if result == 'results.txt':
-            iops, throughput = read_result_file(filename)
-            if not fb_result[fs, workload, nproc]:
-                fb_result[fs, workload, nproc] = {"IOPS": [], "Throughput": []}
-            fb_result[fs, workload, nproc, "IOPS"].append(iops)
-            fb_result[fs, workload, nproc, "Throughput"].append(throughput)
+    fb_result = load_results(args.dir, 'nprocs', ('IOPS', 'Throughput'))
 
     plot_scale_figure(args.dir, fb_result, 'IOPS', 'Threads', args.ext)
     plot_scale_figure(args.dir, fb_result, 'Throughput', 'Threads', args.ext)
+    plot_heatmaps(args.dir, args.ext)
 
 
 def plot_cpuscale_result(args):
     """Plot CPU-scale performance
     """
-    files = glob.glob(args.dir + '/*_results.txt')
-    fb_result = analysis.Result()
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        # print(fields)
-        fs = fields[1]
-        workload = fields[2]
-        ncpus = int(fields[5])
-        iops, throughput = read_result_file(filename)
-        if not fb_result[fs, workload, ncpus]:
-            fb_result[fs, workload, ncpus] = {"IOPS": [], "Throughput": []}
-        fb_result[fs, workload, ncpus, "IOPS"].append(iops)
-        fb_result[fs, workload, ncpus, "Throughput"].append(throughput)
+    fb_result = load_results(args.dir, 'ncpus', ('IOPS', 'Throughput'))
 
     plot_scale_figure(args.dir, fb_result, 'IOPS', 'CPUs', ext=args.ext)
     plot_scale_figure(args.dir, fb_result, 'Throughput', 'CPUs', ext=args.ext)
@@ -257,20 +486,10 @@ def plot_perf_result(args):
     """Plot outputs generated from perf (linux kernel performance tool).
     """
     outdir = output_dir(args.dir)
-    files = glob.glob(args.dir + '/*_perf.txt')
     result = analysis.Result()
     test = ''
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        if fields[7] != 'perf.txt':
-            continue
-        test = fields[0]
-        fs = fields[1]
-        workload = fields[2]
-        if test == 'multifs':
-            x_value = int(fields[3])  # ndisks
-        else:
-            x_value = int(fields[5])  # nproc
+    for filename, test, fs, workload, x_value in \
+            load_outputs(args.dir, '_perf.txt'):
         perf_data = perftest.parse_perf_data(filename)
         for event in perf_data:
             result[fs, workload, event, x_value] = \
@@ -292,6 +511,32 @@ def plot_perf_result(args):
                     xlabel=xlabel)
 
 
+def top_lock_curves(lock_data, field, top_n=5, candidates=10):
+    """Finds the top locks of one lock_stat field across all x values.
+
+    @param lock_data a dict of {x: lock_stat array}, see mfsbase.load_lockstat.
+    @param field the lock_stat field, e.g., 'contentions'.
+    @param top_n the number of curves to return.
+    @param candidates the number of top locks to consider on each x value.
+    @return a list of (x_values, y_values, lock_name) curves.
+    """
+    x_values = sorted(lock_data.keys())
+    names = set()
+    for x_value in x_values:
+        data = lock_data[x_value]
+        top_idx = np.argsort(data[field])[-candidates:]
+        names.update(data['name'][top_idx])
+    curves = []
+    for name in names:
+        y_values = np.array(
+            [lock_data[x][field][lock_data[x]['name'] == name].sum()
+             for x in x_values])
+        curves.append((x_values, y_values,
+                       name.decode('utf-8').lstrip('&(')))
+    curves.sort(key=lambda curve: curve[1].max(), reverse=True)
+    return curves[:top_n]
+
+
 def plot_lock_result(args):
     """Plot lockstat results
     """
@@ -302,31 +547,16 @@ def plot_lock_result(args):
             curves_by_name[key] = (lc[0], curves_by_name[key][1] + lc[1], key)
 
     outdir = output_dir(args.dir)
-    files = glob.glob(args.dir + '/*_lockstat.txt')
     result = analysis.Result()
     test = ''
-    for filename in files:
-        fields = parse_filename(os.path.basename(filename))
-        test = fields[0]
-        # print(fields)
-        if test == 'ncpu':
-            fs = fields[2]
-            workload = fields[3]
-            x_value = int(fields[6])
-        else:
-            fs = fields[1]
-            workload = fields[2]
-            if test == 'multifs':
-                x_value = int(fields[3])
-            else:
-                x_value = int(fields[5])
-        lock_data = perftest.parse_lockstat_data(filename)
-        result[fs, workload, x_value] = lock_data
+    for filename, test, fs, workload, x_value in \
+            load_outputs(args.dir, '_lockstat.txt'):
+        result[fs, workload, x_value] = mfsbase.load_lockstat(filename)
 
     xlabel = '# of cores'
     ylabel = 'Samples'
     xticks = None
-    ylim = None
+    xlim = None
     if test == 'multifs':
         xlabel = '# of Disks'
         xticks = [[1, 2, 3, 4], [1, 2, 3, 4]]
@@ -334,26 +564,13 @@ def plot_lock_result(args):
     output_prefix = os.path.join(outdir, os.path.basename(args.dir))
     for fs in result:
         for wl in result[fs]:
-            plot_data = {}
-            first_nproc = list(result[fs, wl].keys())[0]
-            first_func = list(result[fs, wl, first_nproc].keys())[0]
-            fields = list(result[fs, wl, first_nproc, first_func].keys())
-            for nproc in result[fs, wl]:
-                for field in fields:
-                    if field not in plot_data:
-                        plot_data[field] = {}
-                    top_n = 10
-                    top_lock_data = perftest.get_top_n_locks(
-                        result[fs, wl, nproc], field, top_n)
-                    # print(top_lock_data)
-                    plot_data[field][nproc] = top_lock_data
-            for field in plot_data:
-                top_lock_curves = perftest.trans_top_data_to_curves(
-                    plot_data[field], top_n=5)
-                # if not top_lock_curves:
-                #    continue
+            lock_data = {nproc: result[fs, wl, nproc]
+                         for nproc in result[fs, wl]}
+            first_nproc = list(lock_data.keys())[0]
+            fields = lock_data[first_nproc].dtype.names[1:]
+            for field in fields:
                 top_curves_by_name = {}
-                for lc in top_lock_curves:
+                for lc in top_lock_curves(lock_data, field):
                     if lc[2].startswith('cpufreq_'):
                         continue
                     if ')' in lc[2]:
@@ -377,6 +594,127 @@ def plot_lock_result(args):
                           xlabel, ylabel, outfile, xticks=xticks, xlim=xlim)
 
 
+def read_timeseries_file(filepath):
+    """Read the time series of all filebench instances in one test.
+
+    @return (time, iops, throughput) arrays, where iops and throughput are
+    summed over all instances on each interval.
+    """
+    data = np.loadtxt(filepath, ndmin=2)
+    if not data.size:
+        return None
+    instances = np.unique(data[:, 0])
+    per_instance = [data[data[:, 0] == inst] for inst in instances]
+    length = min(len(x) for x in per_instance)
+    time = per_instance[0][:length, 1]
+    time = time - time[0]
+    iops = sum(x[:length, 2] for x in per_instance)
+    throughput = sum(x[:length, 3] for x in per_instance)
+    return time, iops, throughput
+
+
+def plot_timeseries_result(args):
+    """Plot the throughput over time on each x value (e.g., # of cores).
+    """
+    outdir = output_dir(args.dir)
+    files = glob.glob(args.dir + '/*_timeseries.txt')
+    result = analysis.Result()
+    for filename in files:
+        fields = parse_filename(os.path.basename(filename))
+        test = fields[0]
+        fs = fields[1]
+        workload = fields[2]
+        iteration = int(fields[6])
+        if test == 'multifs':
+            x_value = int(fields[3])
+        else:
+            x_value = fields[5]
+            if x_value.isdigit():
+                x_value = int(x_value)
+        if iteration != 0:
+            # Only plots the first iteration to keep figures readable.
+            continue
+        series = read_timeseries_file(filename)
+        if series:
+            result[fs, workload, x_value] = series
+
+    output_prefix = os.path.join(outdir, os.path.basename(args.dir))
+    for fs in result:
+        for wl in result[fs]:
+            for measure, idx in [('iops', 1), ('throughput', 2)]:
+                plt.figure()
+                for x_value in sorted(result[fs, wl].keys()):
+                    series = result[fs, wl, x_value]
+                    plt.plot(series[0], series[idx], label=str(x_value))
+                plt.ylim(0)
+                plt.xlabel('Time (seconds)')
+                if measure == 'iops':
+                    plt.ylabel('IOPS')
+                else:
+                    plt.ylabel('Throughput (MB/s)')
+                plt.legend(ncol=2, loc='best', prop={'size': 8})
+                plt.title('Filebench Time Series (%s, %s)' % (fs, wl))
+                plt.savefig(output_prefix + '_%s_%s_%s_timeseries.%s' %
+                            (fs, wl, measure, args.ext))
+                plt.close()
+
+
+def read_flowops_file(filepath):
+    """Read the merged per-operation results of one test.
+
+    @return a dict of {flowop: {'iops', 'throughput', 'latency'}}, where
+    latency is the mean latency (ms/op).
+    """
+    flowops = {}
+    with open(filepath) as fobj:
+        for line in fobj:
+            if line.startswith('#'):
+                continue
+            fields = line.split()
+            flowops[fields[0]] = {'iops': float(fields[2]),
+                                  'throughput': float(fields[3]),
+                                  'latency': float(fields[4])}
+    return flowops
+
+
+def plot_flowop_result(args):
+    """Plot the latency of each filebench operation (flowop).
+    """
+    outdir = output_dir(args.dir)
+    result = analysis.Result()
+    test = ''
+    for filename, test, fs, workload, x_value in \
+            load_outputs(args.dir, '_flowops.txt'):
+        if test == 'numa':
+            continue
+        for name, record in read_flowops_file(filename).items():
+            if not result[fs, workload, name, x_value]:
+                result[fs, workload, name, x_value] = {'latency': []}
+            result[fs, workload, name, x_value, 'latency'].append(
+                record['latency'])
+
+    xlabel = '# of Cores'
+    if test == 'multifs':
+        xlabel = '# of Disks'
+    output_prefix = os.path.join(outdir, os.path.basename(args.dir))
+    for fs in result:
+        for wl in result[fs]:
+            plt.figure()
+            for name in sorted(result[fs, wl].keys()):
+                x_values = sorted(result[fs, wl, name].keys())
+                y_values = [np.average(result[fs, wl, name, x, 'latency'])
+                            for x in x_values]
+                plt.plot(x_values, y_values, label=name, marker='+')
+            plt.ylim(0)
+            plt.xlabel(xlabel)
+            plt.ylabel('Mean Latency (ms/op)')
+            plt.legend(ncol=2, loc='best', prop={'size': 8})
+            plt.title('Filebench Per-Operation Latency (%s, %s)' % (fs, wl))
+            plt.savefig(output_prefix + '_%s_%s_flowop_latency.%s' %
+                        (fs, wl, args.ext))
+            plt.close()
+
+
 def main():
     """Plots the results from filebench.
     """
@@ -398,10 +736,14 @@ def main():
         plot_cpuscale_result(args)
     elif fields[1] == 'multifs':
         plot_multifs_result(args)
+    elif fields[1] == 'dataset':
+        plot_dataset_result(args)
     else:
         print('Unknown test: %s' % fields[1])
         return
 
+    plot_timeseries_result(args)
+    plot_flowop_result(args)
     plot_perf_result(args)
     plot_lock_result(args)
 
@@ -11,18 +11,69 @@ sys.path.append('..')
 sys.path.append('../pyro')
 from collections import Counter
 from datetime import datetime
-from multiprocessing import Process, Queue
+from matrix import Dimension, Matrix
+from multiprocessing import Barrier, Process, Queue, cpu_count
+from multiprocessing.pool import ThreadPool
 from pyro import osutil, checkpoint
-from subprocess import Popen, PIPE
+from queue import Empty
+from resultstore import ResultCache, ResultStore, RESULT_DB
+from subprocess import call, Popen, PIPE, STDOUT
 import argparse
+import cpuset
+import diskimage
+import hashlib
+import math
 import mfsbase
+import platform
 import re
 import set_cpus
 import shutil
+import threading
+import time
+import topology
+import zlib
 
 FILE_SYSTEMS = 'ext2,ext4,btrfs,xfs'
 WORKLOADS = None
 PERF = 'perf'
+# The file of the deferred post-processing jobs in the output directory.
+POST_PROCESS_JOBS = 'postprocess_jobs.txt'
+# The number of files in the fileset of each filebench instance.
+NFILES = 10000
+# The options that do not change the results of a cell, which are left out
+# of the key of the result cache.
+CACHE_IGNORED = ['perf_jobs', 'disk_jobs', 'ci_level', 'vmlinux', 'kallsyms',
+                 'keep_disks']
+# The estimated costs (in seconds) of changing the value of a dimension of a
+# test, used to order the cells before the real costs are measured.
+TRANSITION_COSTS = {
+    'cpus': 30,
+    'fs': 20,
+    'workload': 10,
+    'ndisks': 5,
+    'dirwidth': 5,
+}
+# The estimated space (in bytes) of the metadata of each file on the disk,
+# i.e., the inode, the directory entry and the rounding of the blocks.
+FILE_OVERHEAD = 4096
+# The estimated memory (in bytes) of the dentry and inode caches of each
+# file.
+CACHE_OVERHEAD = 1024
+# The dimensions of all tests that are passed to run_filebench() as they
+# are, with their default values. A value other than the default is added to
+# the label of the cell.
+CELL_PARAMS = {
+    'contention': 'dir',
+    'concurrency': 'procs',
+    'iosize': 4096,
+    # 0 for the mean file size of the workload.
+    'filesize': 0,
+}
+# The formats of the CELL_PARAMS in the label, e.g., 'io64k'.
+CELL_LABELS = {
+    'iosize': lambda size: 'io' + mfsbase.format_size(size),
+    'filesize': lambda size: 'file' + mfsbase.format_size(size),
+}
 
 
 def avail_workloads():
@@ -35,42 +86,460 @@ def avail_workloads():
 WORKLOADS = avail_workloads()
 
 
+def prepare_disk(mntdir, nram, ndirs, kwargs):
+    """Prepares one RAM disk: restores it from the golden image (or formats
+    it), mounts it and creates the test directories. A restored disk gets a
+    new UUID, so that the disks restored from the same image can be mounted
+    together.
+
+    @param kwargs the options of prepare_disks(). 'key' is the key of the
+    golden image to restore, or None to format the disk.
+    @return a dict of the disk, the error if failed, and the list of
+    (phase, seconds) spent on preparing the disk.
+    """
+    fs = kwargs.get('fs', 'ext4')
+    key = kwargs.get('key', None)
+    options = kwargs.get('options', '')
+    disk_path = '/dev/ram{}'.format(nram)
+    mntpnt = os.path.join(mntdir, 'ram{}'.format(nram))
+    timings = []
+    result = {'disk': nram, 'error': None, 'timings': timings}
+    start = time.time()
+    try:
+        if not os.path.exists(mntpnt):
+            os.makedirs(mntpnt)
+        if key:
+            kwargs['image_cache'].restore(key, disk_path,
+                                          verify=kwargs.get('verify', False))
+            timings.append(('restore', time.time() - start))
+            start = time.time()
+            diskimage.new_uuid(disk_path, fs)
+            timings.append(('uuid', time.time() - start))
+            start = time.time()
+            osutil.mount(disk_path, mntpnt, options=options)
+            timings.append(('mount', time.time() - start))
+            return result
+        osutil.mount(disk_path, mntpnt, format=fs,
+                     no_journal=kwargs.get('no_journal', False),
+                     options=options)
+        timings.append(('format', time.time() - start))
+        start = time.time()
+        for dir_num in range(ndirs):
+            dirpath = os.path.join(mntpnt, 'test{}'.format(dir_num))
+            os.makedirs(dirpath)
+        timings.append(('mkdir', time.time() - start))
+    except Exception as err:
+        # Reports the failure of this disk, instead of failing the other
+        # disks in the pool.
+        result['error'] = '{}: {}'.format(type(err).__name__, err)
+    return result
+
+
+def mounted_disks(mntdir):
+    """Returns the mount points under mntdir.
+    """
+    mntdir = os.path.abspath(mntdir)
+    mntpnts = []
+    with open('/proc/mounts') as fobj:
+        for line in fobj:
+            fields = line.split()
+            if len(fields) > 1 and \
+                    fields[1].startswith(mntdir + os.sep):
+                mntpnts.append(fields[1])
+    return mntpnts
+
+
+def umount_disk(mntpnt):
+    """Unmounts one disk.
+
+    @return a dict of the mount point, the error if failed, and the list of
+    (phase, seconds).
+    """
+    start = time.time()
+    error = None
+    if call(['umount', mntpnt]):
+        error = 'Failed to umount {}'.format(mntpnt)
+    return {'disk': os.path.basename(mntpnt), 'error': error,
+            'timings': [('umount', time.time() - start)]}
+
+
+def teardown_disks(mntdir, jobs=0):
+    """Unmounts all disks under mntdir in parallel.
+
+    @param jobs the max number of disks to unmount at the same time, 0 to
+    unmount all disks at once.
+    @return a list of the results of umount_disk().
+    """
+    if not os.path.exists(mntdir):
+        return []
+    mntpnts = mounted_disks(mntdir)
+    results = []
+    if mntpnts:
+        pool = ThreadPool(min(jobs or len(mntpnts), len(mntpnts)))
+        results = pool.map(umount_disk, mntpnts)
+        pool.close()
+        pool.join()
+    # Cleans up whatever is still mounted, e.g., the failed ones.
+    osutil.umount_all(mntdir)
+    return results
+
+
+def write_disk_timings(outfile, results, mode='w'):
+    """Writes the time spent on each phase of preparing and tearing down the
+    disks.
+    """
+    with open(outfile, mode) as fobj:
+        if mode == 'w':
+            fobj.write('disk phase seconds\n')
+        for rst in results:
+            for phase, seconds in rst['timings']:
+                fobj.write('{} {} {:.3f}\n'.format(rst['disk'], phase,
+                                                   seconds))
+            if rst['error']:
+                fobj.write('{} failed 0\n'.format(rst['disk']))
+
+
+def mount_options(fs):
+    """Returns the mount options of a file system.
+    """
+    if fs == 'ext4':
+        return 'noatime,nodiratime'
+    return ''
+
+
 def prepare_disks(mntdir, ndisks, ndirs, **kwargs):
     """Prepare disks
+
+    The disks are formatted (or restored) and mounted in parallel by a pool
+    of up to 'jobs' threads.
+
+    Optional params
+    @param fs the file system to format the disks.
+    @param no_journal if True, formats the file system without journal.
+    @param image_cache if set, the ImageCache of golden images. The disks
+    are restored from the golden image of the configuration instead of
+    running mkfs on each disk. The image is built on the first use.
+    @param verify_images if True, verifies the checksum of every restored
+    disk. Otherwise only the disks restored right after building the image
+    are verified.
+    @param workload the workload to populate the filesets in the golden
+    image.
+    @param nfiles the number of files in each fileset.
+    @param dirwidth the mean number of entries in each directory of the
+    filesets, 0 for the default of the workload.
+    @param filesize the mean file size (in bytes) of the filesets, 0 for the
+    default of the workload.
+    @param jobs the max number of disks to prepare at the same time, 0 to
+    prepare all disks at once.
+    @param output if set, the time spent on each phase is written to
+    '{output}_disks.txt'.
+
+    @return True if the disks are restored from a golden image, in which the
+    filesets of the workload are already populated.
+    @exception IOError if any disk failed to be prepared.
     """
     fs = kwargs.get('fs', 'ext4')
     no_journal = kwargs.get('no_journal', False)
-    # mount options.
-    options = ''
-    if fs == 'ext4':
-        options = 'noatime,nodiratime'
+    image_cache = kwargs.get('image_cache', None)
+    verify = kwargs.get('verify_images', False)
+    workload = kwargs.get('workload', '')
+    nfiles = kwargs.get('nfiles', NFILES)
+    dirwidth = kwargs.get('dirwidth', 0)
+    filesize = kwargs.get('filesize', 0)
+    jobs = kwargs.get('jobs', 0)
+    output = kwargs.get('output', '')
+    options = mount_options(fs)
 
     print('Preparing directories...{}'.format(mntdir))
     if not os.path.exists(mntdir):
         os.makedirs(mntdir)
+    results = teardown_disks(mntdir, jobs)
+    if not ndisks:
+        return False
+
+    key = None
+    if image_cache:
+        start = time.time()
+        try:
+            key = diskimage.ImageCache.key(
+                fs=fs, no_journal=no_journal, options=options,
+                workload=workload, nfiles=nfiles, dirwidth=dirwidth,
+                filesize=filesize, ndirs=ndirs,
+                size=diskimage.device_size('/dev/ram0'))
+            if not image_cache.has(key):
+                build_golden_image(image_cache, key, mntdir, ndirs, fs=fs,
+                                   no_journal=no_journal, options=options,
+                                   workload=workload, nfiles=nfiles,
+                                   dirwidth=dirwidth, filesize=filesize)
+                verify = True
+                results.append({'disk': 'image', 'error': None,
+                                'timings': [('build',
+                                             time.time() - start)]})
+        except (IOError, OSError) as err:
+            print('Failed to build the golden image: {}'.format(err))
+            key = None
+
+    conf = {'fs': fs, 'no_journal': no_journal, 'options': options,
+            'image_cache': image_cache, 'key': key, 'verify': verify}
+    pool = ThreadPool(min(jobs or ndisks, ndisks))
+    prepared = pool.map(lambda nram: prepare_disk(mntdir, nram, ndirs, conf),
+                        range(ndisks))
+    restore_failed = [rst['disk'] for rst in prepared if rst['error']]
+    if key and restore_failed:
+        # Falls back to format the disks that failed to restore.
+        print('Failed to restore the golden image onto ram{}'.format(
+            ', ram'.join(map(str, restore_failed))))
+        osutil.umount_all(mntdir)
+        conf['key'] = None
+        prepared = pool.map(
+            lambda nram: prepare_disk(mntdir, nram, ndirs, conf),
+            range(ndisks))
+    pool.close()
+    pool.join()
+    results += prepared
+
+    if output:
+        write_disk_timings(output + '_disks.txt', results)
+    failed = [rst for rst in prepared if rst['error']]
+    for rst in failed:
+        print('Failed to prepare ram{}: {}'.format(rst['disk'], rst['error']))
+    if failed:
+        raise IOError('Failed to prepare {} of {} disks'.format(
+            len(failed), ndisks))
+    return conf['key'] is not None
+
+
+def build_golden_image(image_cache, key, mntdir, ndirs, **kwargs):
+    """Builds the golden image on /dev/ram0 and saves it to the image cache.
+
+    The image has ndirs test directories, each of which has the filesets of
+    the workload populated by filebench.
+    """
+    fs = kwargs.get('fs', 'ext4')
+    workload = kwargs.get('workload', '')
+    nfiles = kwargs.get('nfiles', NFILES)
+    dirwidth = kwargs.get('dirwidth', 0)
+    filesize = kwargs.get('filesize', 0)
+
+    disk_path = '/dev/ram0'
+    mntpnt = os.path.join(mntdir, 'ram0')
+    if not os.path.exists(mntpnt):
+        os.makedirs(mntpnt)
+    print('Building golden image of {} on {}...'.format(fs, disk_path))
+    osutil.mount(disk_path, mntpnt, format=fs,
+                 no_journal=kwargs.get('no_journal', False),
+                 options=kwargs.get('options', ''))
+    for dir_num in range(ndirs):
+        dirpath = os.path.join(mntpnt, 'test{}'.format(dir_num))
+        os.makedirs(dirpath)
+        if workload and not create_filesets(workload, dirpath, nfiles,
+                                            dirwidth, filesize):
+            osutil.umount_all(mntdir)
+            raise IOError('Failed to populate the filesets in {}'.format(
+                dirpath))
     osutil.umount_all(mntdir)
+    image_cache.save(key, disk_path)
 
-    for nram in range(ndisks):
-        disk_path = '/dev/ram{}'.format(nram)
-        mntpnt = os.path.join(mntdir, 'ram{}'.format(nram))
-        if not os.path.exists(mntpnt):
-            os.makedirs(mntpnt)
-        osutil.mount(disk_path,
-                     os.path.join(mntdir, 'ram{}'.format(nram)),
-                     format=fs, no_journal=no_journal, options=options)
-        for dir_num in range(ndirs):
-            dirpath = os.path.join(mntdir, 'ram{}'.format(nram),
-                                   'test{}'.format(dir_num))
-            os.makedirs(dirpath)
 
+def create_filesets(workload, testdir, nfiles, dirwidth=0, filesize=0):
+    """Populates the filesets of the workload in testdir with filebench.
 
-def filebench_task(queue, workload, testdir, nfiles, nproc, nthread, iosize,
-                   kwargs):
-    """Run filebench in a separate process.
+    @param dirwidth if set, the mean number of entries in each directory of
+    the filesets, otherwise the default of the workload is used.
+    @param filesize if set, the mean file size (in bytes) of the filesets.
+    @return True if filebench successfully finished.
     """
-    runtime = kwargs.get('runtime', 60)
-    cpus = kwargs.get('cpus', '')
+    conf = """
+load workloads/{}
+set $dir={}
+set $nfiles={}
+""".format(workload, testdir, nfiles)
+    if dirwidth:
+        conf += 'set $meandirwidth={}\n'.format(dirwidth)
+    if filesize:
+        conf += 'set $meanfilesize={}\n'.format(filesize)
+    conf += 'create filesets\nquit\n'
+    proc = Popen('filebench', shell=True, stdin=PIPE, stdout=PIPE,
+                 stderr=STDOUT)
+    proc.communicate(conf.encode('utf-8'))
+    return proc.returncode == 0
+
+
+def fileset_footprint(workload, nfiles, filesize=0):
+    """Estimates the space (in bytes) used by the filesets of a workload with
+    nfiles files, from the mean file size and the preallocated percentage in
+    the workload file.
+
+    @param filesize if set, overrides the mean file size of the workload.
+    """
+    prealloc = 100
+    with open(os.path.join('workloads', workload + '.f')) as fobj:
+        for line in fobj:
+            match = re.match(r'set \$meanfilesize=(\S+)', line)
+            if match:
+                filesize = filesize or mfsbase.parse_size(match.group(1))
+            match = re.search(r'name=bigfileset,.*prealloc=(\d+)', line)
+            if match:
+                prealloc = int(match.group(1))
+    return nfiles * (filesize * prealloc // 100 + FILE_OVERHEAD)
+
+
+def available_memory():
+    """Returns the available memory (in bytes) from /proc/meminfo.
+    """
+    with open('/proc/meminfo') as fobj:
+        for line in fobj:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def check_capacity(workload, nfiles, ndisks, ndirs, filesize=0):
+    """Checks whether the filesets of nfiles files in each of the ndirs
+    directories of ndisks RAM disks fit in the RAM disks and in the
+    available memory, together with their dentry and inode caches.
+
+    @param filesize if set, overrides the mean file size of the workload.
+    @return True if the filesets fit.
+    """
+    per_disk = fileset_footprint(workload, nfiles, filesize) * ndirs
+    try:
+        disk_size = diskimage.device_size('/dev/ram0')
+    except (IOError, OSError):
+        disk_size = None
+    if disk_size is not None and per_disk > disk_size:
+        print('{} files of {} need {} MB, larger than the RAM disk ({} MB)'
+              .format(nfiles, workload, per_disk >> 20, disk_size >> 20))
+        return False
+    memory = (per_disk + nfiles * ndirs * CACHE_OVERHEAD) * ndisks
+    available = available_memory()
+    if memory > available:
+        print('{} files of {} need {} MB, more than the available memory '
+              '({} MB)'.format(nfiles, workload, memory >> 20,
+                               available >> 20))
+        return False
+    return True
+
+
+def disk_options(args):
+    """Returns the options of prepare_disks() from the command line.
+    """
+    return {
+        'no_journal': args.no_journal,
+        'jobs': args.disk_jobs,
+        'image_cache': diskimage.ImageCache(args.image_cache)
+        if args.image_cache else None,
+        'verify_images': args.verify_images,
+    }
+
+
+SUMMARY_PATTERN = re.compile(
+    r'([\d.]+):\s+IO Summary:\s+(\d+) ops,?\s+([\d.]+) ops/s.*?'
+    r'([\d.]+)mb/s.*?([\d.]+)ms')
+
 
+def parse_summary(line):
+    """Parses one 'IO Summary' line of filebench output.
+
+    @return a dict of {time, ops, iops, throughput, latency}, or None if the
+    line is not a summary line.
+    """
+    match = SUMMARY_PATTERN.search(line)
+    if not match:
+        return None
+    return {'time': float(match.group(1)),
+            'ops': int(match.group(2)),
+            'iops': float(match.group(3)),
+            'throughput': float(match.group(4)),
+            'latency': float(match.group(5))}
+
+
+FLOWOP_PATTERN = re.compile(
+    r'^\s*(\S+)\s+(?:(\d+)ops\s+)?([\d.]+)ops/s\s+([\d.]+)mb/s\s+'
+    r'([\d.]+)ms/op(?:.*\[([\d.]+)ms\s*-\s*([\d.]+)ms\])?')
+
+
+def parse_flowop(line):
+    """Parses one line of the per-operation breakdown of filebench output.
+
+    @return a dict of {name, ops, iops, throughput, latency, min, max}, or None
+    if the line is not a flowop line.
+    """
+    match = FLOWOP_PATTERN.match(line)
+    if not match:
+        return None
+    iops = float(match.group(3))
+    latency = float(match.group(5))
+    return {'name': match.group(1),
+            'ops': int(match.group(2)) if match.group(2) else int(iops),
+            'iops': iops,
+            'throughput': float(match.group(4)),
+            'latency': latency,
+            'min': float(match.group(6)) if match.group(6) else latency,
+            'max': float(match.group(7)) if match.group(7) else latency}
+
+
+def add_flowop(flowops, flowop):
+    """Adds a parsed flowop into the per-operation records.
+
+    @param flowops a dict of {name: {ops, iops, throughput, latency}}, where
+    latency is a mfsbase.LatencyHistogram of the mean latencies reported by
+    filebench for each instance (or interval), weighted by their ops. It
+    tells the mean, min and max latency, but not the latency percentiles,
+    which filebench does not report.
+    """
+    name = flowop['name']
+    if name not in flowops:
+        flowops[name] = {'ops': 0, 'iops': 0.0, 'throughput': 0.0,
+                         'latency': mfsbase.LatencyHistogram()}
+    record = flowops[name]
+    record['ops'] += flowop['ops']
+    record['iops'] += flowop['iops']
+    record['throughput'] += flowop['throughput']
+    if flowop['ops']:
+        record['latency'].add(flowop['latency'], flowop['ops'])
+        record['latency'].update_range(flowop['min'], flowop['max'])
+
+
+def merge_flowops(flowops, other):
+    """Merges the per-operation records from another filebench instance.
+    """
+    for name, record in other.items():
+        if name not in flowops:
+            flowops[name] = {'ops': 0, 'iops': 0.0, 'throughput': 0.0,
+                             'latency': mfsbase.LatencyHistogram()}
+        flowops[name]['ops'] += record['ops']
+        flowops[name]['iops'] += record['iops']
+        flowops[name]['throughput'] += record['throughput']
+        flowops[name]['latency'].merge(record['latency'])
+
+
+READY_MARK = 'mfsbench-filesets-ready'
+
+
+def filebench_conf(workload, testdir, nfiles, nproc, nthread, iosize,
+                   runtime, interval=0, sync=False, reuse=False,
+                   steady=False, dirwidth=0, filesize=0):
+    """Generates the filebench script for one instance.
+
+    If interval is given, the single 'run' command is replaced by a sequence
+    of 'stats snap' on every interval seconds, so that the intermediate
+    results are printed while filebench is running.
+
+    If sync is True, filebench echos READY_MARK after preallocating the
+    filesets. The script after READY_MARK must be sent to filebench only
+    after all instances are ready (see stream_filebench()).
+
+    If reuse is True, filebench reuses the filesets already populated in
+    testdir, e.g., restored from a golden image (see prepare_disks()).
+
+    If steady is True, the script stops after starting the processes. The
+    intervals and the shutdown are sent by stream_filebench() until the run
+    reaches the steady state.
+
+    If dirwidth or filesize is set, it overrides the mean directory width
+    or the mean file size of the filesets of the workload.
+    """
     conf = """
 load workloads/{}
 set $dir={}
@@ -79,40 +548,378 @@ set $nprocesses={}
 set $nthreads={}
 set $iosize={}
 set $meanappendsize=4k
-run {}\n""".format(workload, testdir, nfiles, nproc, nthread, iosize, runtime)
+""".format(workload, testdir, nfiles, nproc, nthread, iosize)
+    if dirwidth:
+        conf += 'set $meandirwidth={}\n'.format(dirwidth)
+    if filesize:
+        conf += 'set $meanfilesize={}\n'.format(filesize)
+    if reuse:
+        conf += 'set $reuse=true\n'
+    if not interval and not sync:
+        return conf + 'run {}\n'.format(runtime)
+    if not interval:
+        interval = runtime
+    conf += 'create filesets\n'
+    if sync:
+        conf += 'echo "{}"\n'.format(READY_MARK)
+    conf += 'create processes\nstats clear\n'
+    if steady:
+        return conf
+    for _ in range(max(1, runtime // interval)):
+        conf += 'sleep {}\nstats snap\nstats clear\n'.format(interval)
+    conf += 'shutdown processes\nquit\n'
+    return conf
+
+
+def filebench_task(queue, workload, testdir, nfiles, nproc, nthread, iosize,
+                   kwargs):
+    """Run filebench in a separate process.
+
+    Optional params in kwargs
+    @param runtime the time to run filebench.
+    @param cpus the CPUs to run filebench on.
+    @param mems the NUMA nodes to bind the memory of filebench to.
+    @param interval if set, reads the output of filebench while it is running
+    and reports the results of each interval as a time series.
+    @param instance the id of this filebench instance.
+    @param disk the disk id of this filebench instance.
+    @param dir the directory id of this filebench instance.
+    @param barrier if set, the multiprocessing.Barrier to wait on after the
+    filesets are preallocated, so that all instances start the measured run
+    at the same time.
+    @param reuse if True, reuses the filesets already populated in testdir.
+    @param dirwidth if set, the mean directory width of the filesets.
+    @param filesize if set, the mean file size of the filesets.
+    @param steady if set, a dict of the params of mfsbase.SteadyState. The
+    run stops once the IOPS of the intervals reach the steady state, or after
+    the max runtime (default: runtime).
+    """
+    runtime = kwargs.get('runtime', 60)
+    cpus = kwargs.get('cpus', '')
+    mems = kwargs.get('mems', '')
+    interval = kwargs.get('interval', 0)
+    barrier = kwargs.get('barrier', None)
+    reuse = kwargs.get('reuse', False)
+    steady = kwargs.get('steady', None)
+
+    detector = None
+    if steady:
+        interval = interval or 1
+        detector = mfsbase.SteadyState(**dict({'max_time': runtime},
+                                              **steady))
+    conf = filebench_conf(workload, testdir, nfiles, nproc, nthread, iosize,
+                          runtime, interval, sync=barrier is not None,
+                          reuse=reuse, steady=detector is not None,
+                          dirwidth=kwargs.get('dirwidth', 0),
+                          filesize=kwargs.get('filesize', 0))
     print('Filebench confs: {}'.format(conf))
     cmd = 'filebench'
     if cpus:
         cmd = 'taskset -c %s filebench' % cpus
-    cmd = cmd.split()
-    p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = p.communicate(conf.encode('utf-8'))
-    output = stdout.decode('utf-8')
-    print(output)
-    for line in output.split('\n'):
-        if 'Summary:' not in line:
+    cmd = (topology.membind_command(mems) + cmd).split()
+    if interval or barrier:
+        ret = stream_filebench(cmd, conf, barrier, detector, interval)
+    else:
+        ret = None
+        flowops = {}
+        p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = p.communicate(conf.encode('utf-8'))
+        output = stdout.decode('utf-8')
+        print(output)
+        for line in output.split('\n'):
+            flowop = parse_flowop(line)
+            if flowop:
+                add_flowop(flowops, flowop)
+                continue
+            summary = parse_summary(line)
+            if summary:
+                ret = {'iops': summary['iops'],
+                       'throughput': summary['throughput'],
+                       'ops': summary['ops'],
+                       'flowops': flowops}
+                break
+    # Always report back, so that the failed instances can be told apart from
+    # the slow ones.
+    if not ret:
+        ret = {'failed': True}
+    ret['instance'] = kwargs.get('instance', 0)
+    ret['disk'] = kwargs.get('disk', 0)
+    ret['dir'] = kwargs.get('dir', 0)
+    ret['cpus'] = cpus
+    queue.put(ret)
+
+
+def stream_filebench(cmd, conf, barrier=None, steady=None, interval=0):
+    """Runs filebench and reads its output line by line.
+
+    @param cmd the filebench command.
+    @param conf the filebench script.
+    @param barrier if set, sends the script after READY_MARK to filebench
+    only after all instances have passed the barrier.
+    @param steady if set, the mfsbase.SteadyState to decide when to stop.
+    The script is sent one interval at a time, and filebench is shut down
+    once the IOPS reach the steady state. The runtime and whether the run
+    converged are added to the results.
+    @param interval the interval (in seconds) used with steady.
+
+    @return a dict of the averaged iops and throughput, the total ops, the
+    time series of
+    (time, iops, throughput, latency) of each interval, the per-operation
+    records and the start and stop time of the measured run, all times are
+    wall-clock seconds. None if filebench did not report any interval.
+    """
+    setup, run = conf, ''
+    if barrier:
+        ready_cmd = 'echo "{}"\n'.format(READY_MARK)
+        setup, _, run = conf.partition(ready_cmd)
+        setup += ready_cmd
+    interval_cmd = 'sleep {}\nstats snap\nstats clear\n'.format(interval)
+    p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+    if steady and not barrier:
+        setup += interval_cmd
+    p.stdin.write(setup.encode('utf-8'))
+    p.stdin.flush()
+    if not barrier and not steady:
+        p.stdin.close()
+    start = time.time()
+    ready = not barrier
+    series = []
+    flowops = {}
+    ops = 0
+    for raw_line in iter(p.stdout.readline, b''):
+        line = raw_line.decode('utf-8', 'replace')
+        print(line, end='')
+        if barrier and READY_MARK in line and not ready:
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                print('Other filebench instances failed to start.')
+                p.kill()
+                p.wait()
+                return None
+            start = time.time()
+            ready = True
+            if steady:
+                p.stdin.write((run + interval_cmd).encode('utf-8'))
+                p.stdin.flush()
+            else:
+                p.stdin.write(run.encode('utf-8'))
+                p.stdin.close()
+            continue
+        flowop = parse_flowop(line)
+        if flowop:
+            add_flowop(flowops, flowop)
             continue
-        fields = line.split()
-        iops = float(fields[6])
-        tp_num = re.search(r'\d+(\.\d+)?', fields[10]).group()
-        throughput = float(tp_num)
-        ret = {'iops': iops, 'throughput': throughput}
-        queue.put(ret)
-        break
+        summary = parse_summary(line)
+        if summary:
+            ops += summary['ops']
+            series.append((time.time(), summary['iops'],
+                           summary['throughput'], summary['latency']))
+            if steady and not p.stdin.closed:
+                steady.add(summary['iops'], len(series) * interval)
+                if steady.done():
+                    p.stdin.write(b'shutdown processes\nquit\n')
+                    p.stdin.close()
+                else:
+                    p.stdin.write(interval_cmd.encode('utf-8'))
+                    p.stdin.flush()
+    if not p.stdin.closed:
+        p.stdin.close()
+    p.wait()
+    if barrier and not ready:
+        # filebench exited before the filesets were ready.
+        barrier.abort()
+        return None
+    if not series:
+        return None
+    for record in flowops.values():
+        # ops/s and MB/s are accumulated over all intervals.
+        record['iops'] /= len(series)
+        record['throughput'] /= len(series)
+    ret = {'iops': sum(x[1] for x in series) / len(series),
+           'throughput': sum(x[2] for x in series) / len(series),
+           'ops': ops,
+           'series': series,
+           'flowops': flowops,
+           'start': start,
+           'stop': series[-1][0]}
+    if steady:
+        ret['runtime'] = steady.elapsed
+        ret['converged'] = steady.converged()
+    return ret
+
+
+def read_cpu_backend(output):
+    """Returns the CPU backend used by the run from '*_cpuset.txt', which may
+    differ from the requested one, e.g., cgroup falls back to affinity.
+    """
+    filepath = output + '_cpuset.txt'
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath) as fobj:
+        for line in fobj:
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == 'backend':
+                return fields[1]
+    return None
 
 
 def test_run(args):
     """Run a single filebench test.
     """
-    return start_filebench(workload=args.workload,
-                           ndisks=args.disks,
-                           ndirs=args.dirs,
-                           nprocs=args.process,
-                           nthreads=args.thread,
-                           basedir=args.basedir,
-                           output=args.output,
-                           timeout=args.timeout,
-                           affinity=args.affinity)
+    cpu_set = None
+    if args.cpuset:
+        # The filebench processes inherit the CPU set.
+        cpu_set = cpuset.CpuSet(args.cpuset, args.cpu_backend,
+                                mems=args.mems)
+        backend = cpu_set.confine()
+        if args.output:
+            with open(output_file(args.output, 'cpuset'), 'w') as fobj:
+                fobj.write('backend {}\n'.format(backend))
+    ret = start_filebench(workload=args.workload,
+                          ndisks=args.disks,
+                          ndirs=args.dirs,
+                          nprocs=args.process,
+                          nthreads=args.thread,
+                          iosize=args.iosize[0],
+                          runtime=args.run,
+                          basedir=args.basedir,
+                          output=args.output,
+                          timeout=args.timeout,
+                          affinity=args.affinity,
+                          interval=args.interval,
+                          sync=args.sync,
+                          reuse=args.reuse,
+                          contention=args.contention,
+                          nfiles=args.nfiles,
+                          dirwidth=args.dirwidth,
+                          filesize=args.filesize[0],
+                          steady=steady_options(args))
+    if cpu_set:
+        cpu_set.release()
+    return ret
+
+
+def output_file(output, name):
+    """Returns the path of an auxiliary output file next to the result file.
+
+    e.g., output_file('scale_ext4_..._0_results.txt', 'timeseries') returns
+    'scale_ext4_..._0_timeseries.txt'.
+    """
+    prefix = output
+    if prefix.endswith('_results.txt'):
+        prefix = prefix[:-len('_results.txt')]
+    return '{}_{}.txt'.format(prefix, name)
+
+
+def contention_layout(contention, ndisks, ndirs, nprocs):
+    """Returns the filebench instances of a contention topology.
+
+    All topologies run the same total number of processes, i.e., ndisks *
+    ndirs * nprocs, but share the directories differently:
+     - 'dir': one instance of nprocs processes in each of the ndirs
+       directories of each disk.
+     - 'disk': one instance of ndirs * nprocs processes on each disk.
+     - 'shared': one instance of all processes in a single directory.
+     - 'hashed:K': the processes are hashed over K directories, which are
+       spread over the disks.
+    The processes of one instance share the fileset, i.e., the directory,
+    of the instance, whose number of files is scaled by instance_nfiles(),
+    so that all topologies have the same total number of files.
+
+    @return a list of (disk, dir, nprocs) of each instance.
+    @exception ValueError if the topology is invalid.
+    """
+    total = ndisks * ndirs * nprocs
+    if contention == 'dir':
+        return [(disk, testdir, nprocs) for disk in range(ndisks)
+                for testdir in range(ndirs)]
+    if contention == 'disk':
+        return [(disk, 0, ndirs * nprocs) for disk in range(ndisks)]
+    if contention == 'shared':
+        return [(0, 0, total)]
+    name, _, num = contention.partition(':')
+    if name != 'hashed' or not num.isdigit() or not int(num):
+        raise ValueError('Unknown contention topology: {}'.format(
+            contention))
+    counts = Counter(zlib.crc32(str(proc).encode()) % int(num)
+                     for proc in range(total))
+    return [(idx % ndisks, idx // ndisks, counts[idx])
+            for idx in range(int(num)) if counts[idx]]
+
+
+def instance_nfiles(procs, nprocs, nfiles):
+    """Returns the number of files of an instance of procs processes in a
+    contention layout, i.e., nfiles for each nprocs processes it replaces.
+    e.g., the instance of the 'shared' topology has the files of all
+    directories of the 'dir' topology.
+    """
+    return max(1, nfiles * procs // nprocs)
+
+
+def layout_shape(layout):
+    """Returns the number of disks, and the number of directories in each
+    disk, used by the instances of a contention layout.
+    """
+    return (max(disk for disk, _, _ in layout) + 1,
+            max(testdir for _, testdir, _ in layout) + 1)
+
+
+def contention_list(value):
+    """Parses the comma separated contention topologies.
+    """
+    values = split_comma_fields(value)
+    for contention in values:
+        try:
+            contention_layout(contention, 1, 1, 1)
+        except ValueError as err:
+            raise argparse.ArgumentTypeError(str(err))
+    return values
+
+
+def concurrency_shape(concurrency, nprocs, nthreads=1):
+    """Returns the processes and threads of a concurrency model, which run
+    the same total number of threads, i.e., nprocs * nthreads:
+     - 'procs': nprocs processes of nthreads threads, as given.
+     - 'threads': one process of all threads.
+     - 'mixed': the processes and threads as balanced as possible, e.g.,
+       8 processes of 6 threads for 48 threads.
+     - 'mixed:T': processes of T threads.
+    The threads of one process share its mm and fd table.
+
+    @return a tuple of (nprocs, nthreads).
+    @exception ValueError if the model is invalid, or the total number of
+    threads is not a multiple of T.
+    """
+    total = nprocs * nthreads
+    if concurrency == 'procs':
+        return nprocs, nthreads
+    if concurrency == 'threads':
+        return 1, total
+    if concurrency == 'mixed':
+        threads = max(num for num in range(1, int(math.sqrt(total)) + 1)
+                      if total % num == 0)
+        return total // threads, threads
+    name, _, num = concurrency.partition(':')
+    if name != 'mixed' or not num.isdigit() or not int(num):
+        raise ValueError('Unknown concurrency model: {}'.format(concurrency))
+    if total % int(num):
+        raise ValueError('Can not split {} threads into processes of {} '
+                         'threads'.format(total, num))
+    return total // int(num), int(num)
+
+
+def concurrency_list(value):
+    """Parses the comma separated concurrency models.
+    """
+    values = split_comma_fields(value)
+    for concurrency in values:
+        num = concurrency.partition(':')[2]
+        try:
+            concurrency_shape(concurrency, int(num) if num.isdigit() else 1)
+        except ValueError as err:
+            raise argparse.ArgumentTypeError(str(err))
+    return values
 
 
 def start_filebench(**kwargs):
@@ -126,7 +933,37 @@ def start_filebench(**kwargs):
     @param ndirs the number of dirs in one disk.
     @param nprocs the number of processes running in one filebench.
     @param nthreads the number of threads running in one filebench process.
+    @param iosize the I/O size (in bytes) of the workload.
+    @param runtime the time (in seconds) to run filebench.
+    @param nfiles the number of files in the fileset of each instance.
+    @param dirwidth if set, the mean directory width of the filesets.
+    @param filesize if set, the mean file size of the filesets.
+    @param contention the contention topology, i.e., how the processes share
+    the directories (see contention_layout(), default: 'dir').
     @param timeout the time to wait sub filebench process to finish.
+    @param affinity if set, one of topology.PLACEMENTS to place the
+    instances on separate CPUs and bind their memory to the nodes of the
+    CPUs (True for 'compact'). The placement is written to
+    '*_instances.txt'.
+    @param interval if set, samples the results of every interval seconds and
+    writes the time series to '*_timeseries.txt' next to the output file.
+
+    @param sync if True, all instances wait on a barrier after preallocating
+    the filesets and start the measured run together. The measured window of
+    each instance is written to '*_window.txt', and the results are
+    aggregated from the time series only within the window where all
+    instances are running. The time series is sampled every second if
+    interval is not set.
+
+    The per-operation results of all instances are merged and written to
+    '*_flowops.txt' next to the output file. The results of each instance are
+    written to '*_instances.txt' and the skew among instances is written to
+    '*_skew.txt'.
+
+    @param steady if set, a dict of the params of mfsbase.SteadyState. Each
+    instance stops once its IOPS reach the steady state (see
+    filebench_task()). The runtime and whether it converged are written to
+    '*_instances.txt'.
 
     @return True if filebench successfully finished.
     """
@@ -137,53 +974,437 @@ def start_filebench(**kwargs):
     nthreads = kwargs.get('nthreads', 1)
     basedir = kwargs.get('basedir', 'ramdisks')
     output = kwargs.get('output', None)
-    iosize = kwargs.get('iosize', '4k')
+    iosize = kwargs.get('iosize', 4096)
+    runtime = kwargs.get('runtime', 60)
     # the process should finish in 20 minutes
     join_timeout = kwargs.get('timeout', 1200)
     affinity = kwargs.get('affinity', False)
+    interval = kwargs.get('interval', 0)
+    sync = kwargs.get('sync', False)
+    reuse = kwargs.get('reuse', False)
+    steady = kwargs.get('steady', None)
+    contention = kwargs.get('contention', 'dir')
+    nfiles = kwargs.get('nfiles', NFILES)
+    dirwidth = kwargs.get('dirwidth', 0)
+    filesize = kwargs.get('filesize', 0)
+    if sync and not interval:
+        # The overlapped window is aggregated from the time series.
+        interval = 1
+
+    layout = contention_layout(contention, ndisks, ndirs, nprocs)
+    # The disks and directories actually used by the instances.
+    ndisks, ndirs = layout_shape(layout)
+    placement = None
+    if affinity:
+        try:
+            # Only the CPUs of the cpuset, if the process is confined.
+            placement = topology.Topology().placement(
+                ndisks, ndirs, 'compact' if affinity is True else affinity,
+                allowed=os.sched_getaffinity(0))
+        except ValueError as err:
+            print(err)
+            return False
 
+    barrier = None
+    if sync:
+        barrier = Barrier(len(layout), timeout=join_timeout)
     q = Queue()
     tasks = []
-    i = 0
-    for disk in range(ndisks):
-        for testdir in range(ndirs):
-            testdir_path = os.path.join(basedir, 'ram{}'.format(disk),
-                                        'test{}'.format(testdir))
-            args = {'cpus': ''}
-            if affinity:
-                seg = 48 / ndisks / ndirs
-                args['cpus'] = '%s-%s' % (i % seg, (i + 1) % seg - 1)
-                i += 1
-            task = Process(target=filebench_task,
-                           args=(q, workload, testdir_path, 10000, nprocs,
-                                 nthreads, iosize, args))
-            task.start()
-            tasks.append(task)
+    instances = {}
+    for instance, (disk, testdir, procs) in enumerate(layout):
+        testdir_path = os.path.join(basedir, 'ram{}'.format(disk),
+                                    'test{}'.format(testdir))
+        args = {'cpus': '', 'mems': '', 'interval': interval,
+                'runtime': runtime, 'instance': instance, 'disk': disk,
+                'dir': testdir, 'nprocs': procs, 'barrier': barrier,
+                'reuse': reuse, 'dirwidth': dirwidth, 'filesize': filesize,
+                'nfiles': instance_nfiles(procs, nprocs, nfiles),
+                'steady': steady}
+        if placement:
+            args['cpus'], args['mems'] = placement[disk * ndirs + testdir]
+        task = Process(target=filebench_task,
+                       args=(q, workload, testdir_path, args['nfiles'], procs,
+                             nthreads, iosize, args))
+        task.start()
+        tasks.append(task)
+        instances[instance] = args
+    results = collect_results(q, tasks, join_timeout)
+    if results is None:
+        # Terminate all tasks and return the benchmark.
+        for t in tasks:
+            if t.is_alive():
+                t.terminate()
+        return False
     for task in tasks:
-        task.join(join_timeout)
-        if task.is_alive():
-            # Terminate all tasks and return the benchmark.
-            for t in tasks:
-                if t.is_alive():
-                    t.terminate()
-            return False
-
+        task.join()
+
+    failed = [rst for rst in results if rst.get('failed', False)]
+    results = [rst for rst in results if not rst.get('failed', False)]
+    num_missing = len(instances) - len(results)
+    if num_missing:
+        print('{} of {} filebench instances did not report results ({} '
+              'failed).'.format(num_missing, len(instances), len(failed)))
+
+    window = None
+    if sync and results:
+        window = overlapped_window(results)
     counters = Counter()
-    while not q.empty():
-        rst = q.get()
+    series = {}
+    flowops = {}
+    for rst in results:
         # print(rst)
-        counters['iops'] += rst['iops']
-        counters['throughput'] += rst['throughput']
+        iops, throughput = rst['iops'], rst['throughput']
+        if window:
+            iops, throughput = window_average(rst, window, interval)
+        rst['iops'], rst['throughput'] = iops, throughput
+        counters['iops'] += iops
+        counters['throughput'] += throughput
+        if 'series' in rst:
+            series[rst['instance']] = rst['series']
+        merge_flowops(flowops, rst.get('flowops', {}))
     print(counters)
+    skew = {measure: instance_skew([rst[measure] for rst in results])
+            for measure in ['iops', 'throughput']}
+    print('Skew: {}, missing instances: {}'.format(skew, num_missing))
     if output:
         with open(output, 'w+') as fobj:
             fobj.write('{} {}\n'.format(counters['iops'],
                                         counters['throughput']))
+        if series:
+            write_timeseries(output_file(output, 'timeseries'), series)
+        if flowops:
+            write_flowops(output_file(output, 'flowops'), flowops)
+        if window:
+            write_window(output_file(output, 'window'), results, window)
+        write_instances(output_file(output, 'instances'), instances, results)
+        write_skew(output_file(output, 'skew'), skew, num_missing)
     return True
 
 
+def collect_results(q, tasks, timeout):
+    """Collects the results of all filebench tasks from the queue.
+
+    The results are collected before joining the tasks, so that no result
+    is left in the queue.
+
+    @return a list of results, which has less results than tasks if some of
+    the tasks died without reporting. None if the tasks did not finish
+    within timeout seconds.
+    """
+    results = []
+    deadline = time.time() + timeout
+    while len(results) < len(tasks):
+        if time.time() > deadline:
+            return None
+        try:
+            results.append(q.get(timeout=1))
+        except Empty:
+            if not any(task.is_alive() for task in tasks):
+                break
+    return results
+
+
+def instance_skew(values):
+    """Calculates the skew of the results among filebench instances.
+
+    @return a dict of {min, max, mean, stddev, fairness}, where fairness is
+    the Jain's fairness index, which is 1 if all instances are equal and 1/n
+    if only one instance does all the work.
+    """
+    if not values:
+        return {'min': 0.0, 'max': 0.0, 'mean': 0.0, 'stddev': 0.0,
+                'fairness': 0.0}
+    num = len(values)
+    mean = sum(values) / num
+    square_sum = sum(x * x for x in values)
+    stddev = math.sqrt(max(square_sum / num - mean * mean, 0))
+    fairness = sum(values) ** 2 / (num * square_sum) if square_sum else 1.0
+    return {'min': min(values), 'max': max(values), 'mean': mean,
+            'stddev': stddev, 'fairness': fairness}
+
+
+def write_instances(filename, instances, results):
+    """Writes the results of each instance, missing ones are written as nan.
+    """
+    results_by_id = {rst['instance']: rst for rst in results}
+    with open(filename, 'w') as fobj:
+        fobj.write('# instance disk dir cpus iops throughput ops runtime '
+                   'converged mems nprocs nfiles\n')
+        for instance in sorted(instances):
+            args = instances[instance]
+            rst = results_by_id.get(instance, {})
+            converged = rst.get('converged', None)
+            fobj.write('{} {} {} {} {} {} {} {} {} {} {} {}\n'.format(
+                instance, args['disk'], args['dir'], args['cpus'] or '-',
+                rst.get('iops', 'nan'), rst.get('throughput', 'nan'),
+                rst.get('ops', 'nan'), rst.get('runtime', 'nan'),
+                'nan' if converged is None else int(converged),
+                args['mems'] or '-', args['nprocs'], args['nfiles']))
+
+
+def read_total_ops(filepath):
+    """Returns the total ops of all instances from the '*_instances.txt'.
+    """
+    total = 0
+    with open(filepath) as fobj:
+        for line in fobj:
+            fields = line.split()
+            if line.startswith('#') or len(fields) < 7 or fields[6] == 'nan':
+                continue
+            total += int(fields[6])
+    return total
+
+
+def read_steady_state(filepath):
+    """Returns the max runtime of all instances and whether all of them
+    converged from the '*_instances.txt', or None if the runs did not
+    detect the steady state.
+    """
+    runtimes = []
+    converged = []
+    with open(filepath) as fobj:
+        for line in fobj:
+            fields = line.split()
+            if line.startswith('#') or len(fields) < 9 or fields[8] == 'nan':
+                continue
+            runtimes.append(float(fields[7]))
+            converged.append(int(fields[8]))
+    if not runtimes:
+        return None
+    return max(runtimes), all(converged)
+
+
+def write_skew(filename, skew, num_missing):
+    """Writes the skew among instances.
+    """
+    with open(filename, 'w') as fobj:
+        fobj.write('# measure min max mean stddev fairness\n')
+        for measure in sorted(skew):
+            fobj.write('{} {min} {max} {mean} {stddev} {fairness}\n'.format(
+                measure, **skew[measure]))
+        fobj.write('missing {}\n'.format(num_missing))
+
+
+def overlapped_window(results):
+    """Returns the window (start, stop) where all instances are measured.
+    """
+    start = max(rst['start'] for rst in results)
+    stop = min(rst['stop'] for rst in results)
+    return (start, stop)
+
+
+def window_average(result, window, interval):
+    """Returns the (iops, throughput) of one instance averaged over the
+    intervals that are fully within the window.
+
+    It falls back to the results of the whole run if no interval fits in the
+    window, e.g., when the window is shorter than one interval.
+    """
+    # Allow a small slack for the time to read filebench output.
+    slack = 1.0
+    start, stop = window
+    samples = [x for x in result.get('series', [])
+               if interval and x[0] - interval >= start - slack and
+               x[0] <= stop + slack]
+    if not samples:
+        print('No interval of instance {} is within the overlapped window, '
+              'use the results of the whole run.'.format(result['instance']))
+        return result['iops'], result['throughput']
+    return (sum(x[1] for x in samples) / len(samples),
+            sum(x[2] for x in samples) / len(samples))
+
+
+def write_window(filename, results, window):
+    """Writes the measured window of each instance and the overlapped window.
+    """
+    with open(filename, 'w') as fobj:
+        fobj.write('# instance start stop\n')
+        for rst in sorted(results, key=lambda x: x['instance']):
+            fobj.write('{} {} {}\n'.format(rst['instance'], rst['start'],
+                                           rst['stop']))
+        fobj.write('overlap {} {}\n'.format(*window))
+
+
+def write_timeseries(filename, series):
+    """Writes the time series of all instances into one file.
+
+    @param series a dict of {instance: [(time, iops, throughput, latency)]}
+    """
+    with open(filename, 'w') as fobj:
+        fobj.write('# instance time iops throughput latency\n')
+        for instance in sorted(series):
+            for sample in series[instance]:
+                fobj.write('{} {} {} {} {}\n'.format(instance, *sample))
+
+
+def write_flowops(filename, flowops):
+    """Writes the merged per-operation results.
+
+    Each line has the operation name, the total ops, ops/s, MB/s, the mean,
+    min and max latency in ms, and the histogram buckets of the mean
+    latencies of the instances (or intervals), weighted by their ops. The
+    buckets show the spread of the means, not the tail latency.
+    """
+    with open(filename, 'w') as fobj:
+        fobj.write('# flowop ops iops throughput mean min max mean_buckets\n')
+        for name in sorted(flowops):
+            record = flowops[name]
+            hist = record['latency']
+            fobj.write('{} {} {} {} {} {} {} {}\n'.format(
+                name, record['ops'], record['iops'], record['throughput'],
+                hist.mean(), hist.min, hist.max,
+                ','.join(map(str, hist.buckets))))
+
+
+def read_skew_file(filepath):
+    """Reads the skew among instances written by write_skew().
+
+    @return a dict of {measure: {min, max, mean, stddev, fairness}} and the
+    number of missing instances.
+    """
+    skew = {}
+    num_missing = 0
+    with open(filepath) as fobj:
+        for line in fobj:
+            if line.startswith('#'):
+                continue
+            fields = line.split()
+            if fields[0] == 'missing':
+                num_missing = int(fields[1])
+                continue
+            skew[fields[0]] = dict(zip(
+                ['min', 'max', 'mean', 'stddev', 'fairness'],
+                map(float, fields[1:])))
+    return skew, num_missing
+
+
+def result_cell(output):
+    """Returns the cell of an output prefix, i.e., the output prefix without
+    the iteration, which is shared by all iterations of the same cell.
+    """
+    return re.sub(r'_\d+$', '', os.path.basename(output))
+
+
+def save_result(output, ci_level=0.95, **cell):
+    """Saves the result of one cell into the result store of the campaign,
+    which is in the same directory of the output files.
+
+    The confidence intervals of the IOPS and throughput over all iterations
+    of the cell are updated in the store as well.
+
+    @param output the output prefix of this cell.
+    @param ci_level the confidence level of the confidence intervals.
+    @param cell the configurations of this cell (see ResultStore).
+    """
+    result_file = output + '_results.txt'
+    if not os.path.exists(result_file):
+        return
+    with open(result_file) as fobj:
+        iops, throughput = map(float, fobj.readline().split())
+    record = dict(cell)
+    record.update({'iops': iops, 'throughput': throughput,
+                   'output': os.path.basename(output),
+                   'cell': result_cell(output)})
+    skew_file = output + '_skew.txt'
+    if os.path.exists(skew_file):
+        skew, num_missing = read_skew_file(skew_file)
+        record['iops_stddev'] = skew['iops']['stddev']
+        record['throughput_stddev'] = skew['throughput']['stddev']
+        record['fairness'] = skew['iops']['fairness']
+        record['missing'] = num_missing
+    instances_file = output + '_instances.txt'
+    steady = None
+    if os.path.exists(instances_file):
+        steady = read_steady_state(instances_file)
+    if steady:
+        record['runtime'], record['converged'] = steady[0], int(steady[1])
+    store = ResultStore(os.path.join(os.path.dirname(output) or '.',
+                                     RESULT_DB))
+    store.add(record)
+    update_confidence(store, record['cell'], ci_level)
+    store.close()
+
+
+def update_confidence(store, cell, level=0.95):
+    """Updates the relative half width of the confidence intervals of the
+    IOPS and throughput over all iterations of the cell.
+    """
+    rows = store.select(['iops', 'throughput'], cell=cell)
+    values = {}
+    for idx, measure in enumerate(['iops', 'throughput']):
+        mean, width = mfsbase.confidence_interval(
+            [row[idx] for row in rows if row[idx] is not None], level)
+        values[measure + '_ci'] = width / mean if width is not None and mean \
+            else None
+    store.update(values, cell=cell)
+
+
+def enough_iterations(output, iteration, args):
+    """Returns True if the cell of the output prefix needs no more
+    iterations, i.e., the confidence interval of the previous iterations is
+    narrower than --ci-width.
+
+    @param output the output prefix of this iteration.
+    @param iteration the number of the previous iterations.
+    """
+    if not args.ci_width or iteration < max(2, args.min_iteration):
+        return False
+    store = ResultStore(os.path.join(os.path.dirname(output) or '.',
+                                     RESULT_DB))
+    rows = store.select([args.ci_measure + '_ci'], cell=result_cell(output))
+    store.close()
+    if not rows or rows[0][0] is None:
+        return False
+    print('The {:.1%} confidence interval of {} is +/-{:.2%}'.format(
+        args.ci_level, args.ci_measure, rows[0][0]))
+    return rows[0][0] <= args.ci_width
+
+
 def run_filebench(workload, **kwargs):
     """Run filebench.
+
+    Optional params
+    @param test the name of the test, e.g., 'scale'.
+    @param fs the file system under test.
+    @param iteration the iteration of this run.
+    @param perf_jobs if not zero, 'perf report' is deferred to the
+    post-processing queue in the output directory (see run_post_process()).
+    @param perf_stat if True, counts the PMU events with 'perf stat' instead
+    of sampling them with 'perf record'.
+    @param cpu_interval if set, samples the per-CPU /proc/stat on every
+    cpu_interval seconds.
+    @param reuse if True, the disks are restored from a golden image and
+    filebench reuses the populated filesets.
+    @param steady if set, a dict of the params of mfsbase.SteadyState to stop
+    each run once it reaches the steady state.
+    @param ci_level the confidence level of the confidence intervals over
+    the iterations (see save_result()).
+    @param disk_jobs the max number of disks to unmount at the same time
+    after the test, 0 to unmount all disks at once.
+    @param sys_interval if set, samples the memory, slab, RAM disk, scheduler
+    and softirq statistics on every sys_interval seconds.
+    @param sys_sources the list of sources to sample with sys_interval.
+    @param cpuset if set, confines filebench to these CPUs (e.g., '0-3')
+    with cpu_backend, instead of hotplugging the other CPUs. The share of
+    the kernel time outside the set is written to '*_cpuset.txt'.
+    @param cpu_backend the backend of cpuset, one of cpuset.BACKENDS.
+    @param affinity if set, one of topology.PLACEMENTS to place the
+    filebench instances on separate CPUs (see start_filebench()).
+    @param contention the contention topology (see contention_layout()).
+    @param concurrency the concurrency model, which splits nprocs * nthreads
+    into processes and threads (see concurrency_shape()).
+    @param nfiles the number of files of each filebench instance.
+    @param dirwidth if set, the mean directory width of the filesets.
+    @param iosize the I/O size (in bytes) of the workload.
+    @param filesize if set, the mean file size of the filesets.
+    @param runtime the time (in seconds) to run filebench.
+    @param keep_disks if True, the disks are left mounted after the run,
+    e.g., for the next cell to reuse the filesets.
+    @param mems if set, binds the memory of filebench to these NUMA nodes
+    (e.g., '0-1') with numactl, and with the cgroup cpuset if cpu_backend is
+    'cgroup'.
+
+    The result is added to the result store in the output directory.
     """
     ndisks = kwargs.get('ndisks', 4)
     ndirs = kwargs.get('ndirs', 1)
@@ -194,17 +1415,57 @@ def run_filebench(workload, **kwargs):
     output = kwargs.get('output', 'filebench')
     no_profile = kwargs.get('no_profile', False)
     affinity = kwargs.get('affinity', False)
+    if affinity is True:
+        affinity = 'compact'
+    interval = kwargs.get('interval', 0)
+    sync = kwargs.get('sync', False)
+    reuse = kwargs.get('reuse', False)
+    disk_jobs = kwargs.get('disk_jobs', 0)
+    steady = kwargs.get('steady', None)
+    perf_jobs = kwargs.get('perf_jobs', 0)
+    perf_stat = kwargs.get('perf_stat', False)
+    cpu_interval = kwargs.get('cpu_interval', 0)
+    sys_interval = kwargs.get('sys_interval', 0)
+    sys_sources = kwargs.get('sys_sources', None)
+    cpu_set = kwargs.get('cpuset', '')
+    cpu_backend = kwargs.get('cpu_backend', 'cgroup')
+    mems = kwargs.get('mems', '')
+    contention = kwargs.get('contention', 'dir')
+    concurrency = kwargs.get('concurrency', 'procs')
+    nfiles = kwargs.get('nfiles', NFILES)
+    dirwidth = kwargs.get('dirwidth', 0)
+    iosize = kwargs.get('iosize', 4096)
+    filesize = kwargs.get('filesize', 0)
+    runtime = kwargs.get('runtime', 60)
+    keep_disks = kwargs.get('keep_disks', False)
+    nprocs, nthreads = concurrency_shape(concurrency, nprocs, nthreads)
 
     if cpus:
         set_cpus.set_cpus(cpus)
+    online_cpus = osutil.get_online_cpus()
 
     lockstat = None
     procstat = None
     perf = None
+    cpusampler = mfsbase.NonProfiler()
+    syssampler = mfsbase.NonProfiler()
     if not no_profile:
         lockstat = mfsbase.LockstatProfiler()
         procstat = mfsbase.ProcStatProfiler()
-        perf = mfsbase.PerfProfiler(perf=PERF, **kwargs)
+        if cpu_interval:
+            cpusampler = mfsbase.ProcStatSampler(interval=cpu_interval)
+        if sys_interval:
+            syssampler = mfsbase.SystemSampler(sources=sys_sources,
+                                               interval=sys_interval)
+        if perf_stat:
+            perf = mfsbase.PerfStatProfiler(perf=PERF, **kwargs)
+        elif perf_jobs:
+            perf_queue = mfsbase.PostProcessQueue(os.path.join(
+                os.path.dirname(output) or '.', POST_PROCESS_JOBS))
+            perf = mfsbase.PerfProfiler(perf=PERF, data=output + '_perf.data',
+                                        queue=perf_queue, **kwargs)
+        else:
+            perf = mfsbase.PerfProfiler(perf=PERF, **kwargs)
     else:
         lockstat = mfsbase.NonProfiler()
         procstat = mfsbase.NonProfiler()
@@ -212,38 +1473,191 @@ def run_filebench(workload, **kwargs):
 
     lockstat.start()
     procstat.start()
+    cpusampler.start()
+    syssampler.start()
 
     result_file = output + '_results.txt'
-    cmd = '{} run -w {} --disks {} --dirs {} -b {} -p {} -t {} -o {}' \
-          .format(__file__, workload, ndisks, ndirs, basedir, nprocs, nthreads,
-                  result_file)
+    cmd = '{} -s {} --filesize {} -r {} run -w {} --disks {} --dirs {} ' \
+          '-b {} -p {} -t {} -o {}'.format(__file__, iosize, filesize,
+                                           runtime, workload, ndisks, ndirs,
+                                           basedir, nprocs, nthreads,
+                                           result_file)
     if affinity:
-        cmd += ' --affinity'
+        cmd += ' --affinity {}'.format(affinity)
+    if interval:
+        cmd += ' --interval {}'.format(interval)
+    if sync:
+        cmd += ' --sync'
+    if reuse:
+        cmd += ' --reuse'
+    if contention != 'dir':
+        cmd += ' --contention {}'.format(contention)
+    if nfiles != NFILES:
+        cmd += ' --nfiles {}'.format(nfiles)
+    if dirwidth:
+        cmd += ' --dirwidth {}'.format(dirwidth)
+    if steady:
+        cmd += ' --steady-cv {cv} --steady-window {window} ' \
+               '--min-runtime {min_time} --max-runtime {max_time}' \
+               .format(**steady)
+    if cpu_set:
+        cmd += ' --cpuset {} --cpu-backend {}'.format(cpu_set, cpu_backend)
+        if mems:
+            cmd += ' --mems {}'.format(mems)
+    cmd = topology.membind_command(mems) + cmd
     print(cmd)
 
+    cpu_times = cpuset.read_cpu_times()
     perf.start(cmd)
+    syssampler.stop()
+    cpusampler.stop()
     procstat.stop()
     lockstat.stop()
 
     # Move PerfProfile.stop() to the last because it generates hunders of MBs
     # logs, which has significant impact to procstat and lockstat accuracy.
+    # If perf_jobs is set, the report is generated after all tests finished.
     perf.stop()
 
     if cpus:
         set_cpus.reset()
 
+    metrics = {}
+    if cpu_set:
+        kernel = cpuset.outside_kernel_share(
+            cpu_times, cpuset.read_cpu_times(), cpu_set)
+        with open(output + '_cpuset.txt', 'a') as fobj:
+            fobj.write('# inside outside share\n')
+            fobj.write('{inside} {outside} {share}\n'.format(**kernel))
+        metrics['outside_kernel'] = kernel['share']
+    else:
+        cpu_backend = 'hotplug'
     procstat.dump(output + '_cpustat.txt')
+    cpusampler.dump(output + '_cpusamples.txt')
+    syssampler.dump(output + '_sysstat.txt')
     lockstat.dump(output + '_lockstat.txt')
-    perf.dump(output + '_perf.txt')
-
-    osutil.umount_all('ramdisks')
+    if isinstance(perf, mfsbase.PerfStatProfiler):
+        instances_file = output + '_instances.txt'
+        if os.path.exists(instances_file):
+            perf.set_ops(read_total_ops(instances_file))
+        perf.dump(output + '_perfstat.txt')
+        metrics.update(perf.metrics())
+    else:
+        perf.dump(output + '_perf.txt')
+    metrics.update(write_slab_usage(output + '_slab.txt'))
+
+    save_result(output, test=kwargs.get('test', ''), fs=kwargs.get('fs', ''),
+                workload=workload, ndisks=ndisks, ndirs=ndirs, nprocs=nprocs,
+                nthreads=nthreads,
+                cpus=cpu_set or cpus or set_cpus.shorten_cores(online_cpus),
+                ncpus=len(osutil.parse_cpus(cpu_set)) if cpu_set
+                else len(online_cpus),
+                cpu_backend=read_cpu_backend(output) or cpu_backend,
+                mems=mems or None,
+                placement=affinity or None, contention=contention,
+                concurrency=concurrency, nfiles=nfiles,
+                dirwidth=dirwidth or None, iosize=iosize,
+                filesize=filesize or None,
+                iteration=kwargs.get('iteration', 0),
+                ci_level=kwargs.get('ci_level', 0.95), **metrics)
+
+    if not keep_disks:
+        write_disk_timings(output + '_disks.txt',
+                           teardown_disks(basedir, disk_jobs), mode='a')
     return True
 
 
+def write_slab_usage(filename):
+    """Writes the memory used by the dentry and inode caches after a run,
+    which grows with the number of files.
+
+    @return a dict of the 'dentry_slab' and 'inode_slab' metrics in bytes.
+    """
+    usage = mfsbase.read_slab_usage()
+    with open(filename, 'w') as fobj:
+        fobj.write('# cache objects bytes\n')
+        for cache in sorted(usage):
+            fobj.write('{} {} {}\n'.format(cache, *usage[cache]))
+    return {'dentry_slab': usage.get('dentry', (0, 0))[1],
+            'inode_slab': sum(usage[cache][1] for cache in usage
+                              if 'inode' in cache)}
+
+
+def run_options(args):
+    """Returns the options of run_filebench() from the command line, e.g.,
+    the profiling options.
+    """
+    return {
+        'events': args.events,
+        'vmlinux': args.vmlinux,
+        'kallsyms': args.kallsyms,
+        'no_profile': args.no_profile,
+        'perf_jobs': args.perf_jobs,
+        'perf_stat': args.perf_stat,
+        'stat_events': args.stat_events,
+        'cpu_interval': args.cpu_interval,
+        'sys_interval': args.sys_interval,
+        'sys_sources': args.sys_sources.split(',') if args.sys_sources
+        else None,
+        'interval': args.interval,
+        'sync': args.sync,
+        'disk_jobs': args.disk_jobs,
+        'steady': steady_options(args),
+        'ci_level': args.ci_level,
+        'runtime': args.run,
+    }
+
+
+def steady_options(args):
+    """Returns the params of mfsbase.SteadyState from the command line, or
+    None if the steady state detection is disabled.
+    """
+    if not args.steady_cv:
+        return None
+    return {'cv': args.steady_cv, 'window': args.steady_window,
+            'min_time': args.min_runtime, 'max_time': args.max_runtime}
+
+
+def run_post_process(outdir, processes):
+    """Runs the deferred post-processing jobs (e.g., 'perf report') of one
+    test in parallel.
+
+    @param outdir the output directory of the test.
+    @param processes the number of worker processes, 0 to do nothing.
+    @return True if all jobs succeeded.
+    """
+    if not processes:
+        return True
+    jobs = mfsbase.PostProcessQueue(os.path.join(outdir, POST_PROCESS_JOBS))
+    num_failed = jobs.run(processes)
+    if num_failed:
+        print('{} post-processing jobs failed, see {}'.format(
+            num_failed, jobs.path))
+    return num_failed == 0
+
+
+def test_post_process(args):
+    """Runs the pending post-processing jobs of a test directory.
+    """
+    return run_post_process(args.dir, args.perf_jobs or cpu_count())
+
+
 def split_comma_fields(value):
     return value.split(',')
 
 
+def size_list(value):
+    """Parses the comma separated sizes, e.g., '4k,64k,1m'.
+
+    @return a list of sizes in bytes.
+    """
+    try:
+        return [mfsbase.parse_size(size) for size in
+                split_comma_fields(value)]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid sizes: {}'.format(value))
+
+
 class SplitCommaAction(argparse.Action):
     """Split the comma separated values and returns as int list.
     """
@@ -270,6 +1684,248 @@ def create_checkpoint(filename, outdir_pre):
     return check_point
 
 
+def system_fingerprint():
+    """Returns the fingerprint of the system under test, so that the cached
+    results are only reused on the same system.
+    """
+    return {'kernel': platform.release(), 'host': platform.node(),
+            'possible_cpus': len(set_cpus.POSSIBLE_CPUS)}
+
+
+def cell_config(args, cell, conf):
+    """Returns the full configuration of a cell, which identifies its result
+    in the result cache.
+
+    @param cell the cell of the experiment matrix.
+    @param conf the params of run_filebench() of the cell.
+    """
+    config = {key: value for key, value in conf.items()
+              if key not in CACHE_IGNORED}
+    workload_file = os.path.join('workloads', cell['workload'] + '.f')
+    with open(workload_file, 'rb') as fobj:
+        workload_digest = hashlib.sha1(fobj.read()).hexdigest()
+    config.update({
+        'fs': cell['fs'],
+        'workload': cell['workload'],
+        'workload_digest': workload_digest,
+        'iteration': cell['iteration'],
+        'mount_options': mount_options(cell['fs']),
+        'no_journal': args.no_journal,
+        'image_cache': bool(args.image_cache),
+        'cpus': set_cpus.shorten_cores(osutil.get_online_cpus()),
+        'nfiles': conf.get('nfiles', NFILES),
+        'runtime': args.run,
+    })
+    config.update(system_fingerprint())
+    return config
+
+
+def restore_cached_result(cache, key, output, ci_level=0.95, **cell):
+    """Reuses the cached result of a cell in the current campaign.
+
+    @param cache the ResultCache.
+    @param key the key of the cell.
+    @param output the output prefix of the cell in the current campaign.
+    @param ci_level the confidence level of the confidence intervals.
+    @param cell the configurations of the cell that differ between
+    campaigns, e.g., test and iteration.
+    @return True if the result is found in the cache.
+    """
+    record = cache.restore(key, output)
+    if record is None:
+        return False
+    print('Reuse the cached result {} for {}'.format(key, output))
+    record.update(cell)
+    record.update({'output': os.path.basename(output),
+                   'cell': result_cell(output)})
+    store = ResultStore(os.path.join(os.path.dirname(output) or '.',
+                                     RESULT_DB))
+    store.add(record)
+    update_confidence(store, record['cell'], ci_level)
+    store.close()
+    return True
+
+
+def cache_result(cache, key, config, output):
+    """Adds the result of a cell to the result cache, if all instances of the
+    cell reported results.
+    """
+    store = ResultStore(os.path.join(os.path.dirname(output) or '.',
+                                     RESULT_DB))
+    record = store.record(output=os.path.basename(output))
+    store.close()
+    if not record or record.get('missing'):
+        return
+    for column in ['output', 'cell', 'iops_ci', 'throughput_ci']:
+        record.pop(column, None)
+    cache.put(key, config, output, record)
+
+
+def cpuset_params(args, cpus):
+    """Returns the params of run_filebench() to restrict the benchmark to
+    cpus with --cpu-backend, or nothing if the CPUs are hotplugged.
+    """
+    if args.cpu_backend == 'hotplug':
+        return {}
+    return {'cpuset': cpus, 'cpu_backend': args.cpu_backend}
+
+
+def common_dimensions(args):
+    """Returns the dimensions shared by all tests: the file systems, the
+    workloads, the contention topologies, the concurrency models, the I/O
+    sizes and the mean file sizes.
+    """
+    return [Dimension('fs', args.formats.split(','),
+                      cost=TRANSITION_COSTS['fs']),
+            Dimension('workload', args.workloads.split(','),
+                      cost=TRANSITION_COSTS['workload']),
+            Dimension('contention', args.contention),
+            Dimension('concurrency', args.concurrency),
+            Dimension('filesize', args.filesize),
+            Dimension('iosize', args.iosize)]
+
+
+def prepare_cell_disks(args, cell, conf, output):
+    """Prepares the disks of a cell, with the directories needed by its
+    contention topology.
+
+    @param cell the cell of the experiment matrix.
+    @param conf the params of run_filebench() of the cell.
+    @param output the output prefix of the cell.
+    @return True if the filesets are restored from a golden image.
+    @exception IOError if any disk failed to be prepared.
+    @exception ValueError if the concurrency model does not fit the cell.
+    """
+    nprocs, _ = concurrency_shape(conf.get('concurrency', 'procs'),
+                                  conf['nprocs'], conf.get('nthreads', 1))
+    layout = contention_layout(conf.get('contention', 'dir'), conf['ndisks'],
+                               conf['ndirs'], nprocs)
+    ndisks, ndirs = layout_shape(layout)
+    # The golden image has the same fileset in every directory. filebench
+    # creates the missing files of the larger instances.
+    nfiles = min(instance_nfiles(procs, nprocs, conf.get('nfiles', NFILES))
+                 for _, _, procs in layout)
+    return prepare_disks('ramdisks', ndisks, ndirs, fs=cell['fs'],
+                         workload=cell['workload'], nfiles=nfiles,
+                         dirwidth=conf.get('dirwidth', 0),
+                         filesize=conf.get('filesize', 0), output=output,
+                         **disk_options(args))
+
+
+def run_matrix(args, test, check_point, dimensions, params, **kwargs):
+    """Runs the experiment matrix of a test.
+
+    Each cell prepares the disks and runs filebench once. The output prefix
+    of a cell is '{test}_{fs}_{workload}_{ndisks}_{ndirs}_{label}_{iter}',
+    where the values of CELL_PARAMS other than the defaults are appended to
+    the label in the formats of CELL_LABELS, e.g., '48-shared-io64k'.
+
+    @param test the name of the test, e.g., 'scale'.
+    @param check_point the checkpoint of the test.
+    @param dimensions a list of matrix.Dimension, which must include 'fs' and
+    'workload' (see common_dimensions()).
+    @param params the function that returns the params of run_filebench()
+    of a cell, which must include 'ndisks', 'ndirs' and 'label', the value to
+    tell the cell apart in the output prefix.
+
+    The cells whose concurrency model does not fit their processes and
+    threads are skipped (see concurrency_shape()).
+
+    If --result-cache is set, a cell is identified by its full configuration
+    (see cell_config()), and its result is reused from the cache if any
+    campaign has run the same cell on the same system. The cells whose perf
+    reports are deferred (see --perf-jobs) are cached after their reports
+    are generated.
+
+    Optional params
+    @param retry the number of tries of each cell (default: 1).
+    @param reset if set, it is called after all cells or a failed cell.
+    @param prepare the function to prepare the disks of a cell (default:
+    prepare_cell_disks()).
+    @param snake see matrix.Matrix (default: True).
+
+    @return True if all cells are finished.
+    """
+    outdir = check_point.outdir
+    prepare = kwargs.get('prepare', prepare_cell_disks)
+    cache = ResultCache(args.result_cache) if args.result_cache else None
+    # The (key, config, output) of the cells whose 'perf report' is
+    # deferred, which are cached after the post-processing, so that the
+    # cache keeps their reports.
+    deferred = []
+
+    def _output(cell):
+        conf = params(cell)
+        label = '-'.join([str(conf['label'])] + [
+            CELL_LABELS.get(name, str)(cell[name])
+            for name in sorted(CELL_PARAMS)
+            if cell.get(name, CELL_PARAMS[name]) != CELL_PARAMS[name]])
+        return '{}/{}_{}_{}_{}_{}_{}_{}'.format(
+            outdir, test, cell['fs'], cell['workload'], conf['ndisks'],
+            conf['ndirs'], label, cell['iteration'])
+
+    def _fits(cell):
+        # A concurrency model that does not fit the cell skips the cell,
+        # e.g., 'mixed:8' with 4 processes.
+        conf = params(cell)
+        try:
+            concurrency_shape(cell.get('concurrency', 'procs'),
+                              conf['nprocs'], conf.get('nthreads', 1))
+        except ValueError as err:
+            print('Skip {}: {}'.format(os.path.basename(_output(cell)), err))
+            return False
+        return True
+
+    def _run(cell):
+        output_prefix = _output(cell)
+        conf = run_options(args)
+        conf.update(params(cell))
+        conf.update({name: cell[name] for name in CELL_PARAMS
+                     if name in cell})
+        del conf['label']
+        if cache:
+            config = cell_config(args, cell, conf)
+            key = ResultCache.key(config)
+            if restore_cached_result(cache, key, output_prefix,
+                                     ci_level=args.ci_level, test=test,
+                                     iteration=cell['iteration']):
+                return True
+        try:
+            reuse = prepare(args, cell, conf, output_prefix)
+        except (IOError, ValueError) as err:
+            # Fails this try of the cell, which Matrix.run() retries.
+            print('Failed to prepare the disks of {}: {}'.format(
+                os.path.basename(output_prefix), err))
+            return False
+        if not run_filebench(cell['workload'], output=output_prefix,
+                             test=test, fs=cell['fs'],
+                             iteration=cell['iteration'], reuse=reuse,
+                             **conf):
+            return False
+        if cache:
+            if conf['perf_jobs'] and not (conf['no_profile'] or
+                                          conf['perf_stat']):
+                deferred.append((key, config, output_prefix))
+            else:
+                cache_result(cache, key, config, output_prefix)
+        return True
+
+    test_matrix = Matrix(dimensions, iterations=args.iteration, outdir=outdir,
+                         default_cost=args.run,
+                         snake=kwargs.get('snake', True))
+    if not test_matrix.run(
+            _run, check_point, retry=kwargs.get('retry', 1),
+            skip=lambda cell: not _fits(cell) or enough_iterations(
+                _output(cell), cell['iteration'], args),
+            reset=kwargs.get('reset', None)):
+        return False
+    run_post_process(outdir, args.perf_jobs)
+    for key, config, output_prefix in deferred:
+        if os.path.exists(output_prefix + '_perf.txt'):
+            cache_result(cache, key, config, output_prefix)
+    return True
+
+
 def test_scalability(args):
     """Test scalability of manycore
 
@@ -277,20 +1933,8 @@ def test_scalability(args):
     """
     ndisks = 1
     ndirs = 1
-    no_journal = args.no_journal
-
-    check_point = checkpoint.Checkpoint('scale_checkpoint.log')
-    output_dir = ''
-    if check_point.outdir:
-        output_dir = check_point.outdir
-    else:
-        now = datetime.now()
-        output_dir = 'filebench_scale_' + now.strftime('%Y_%m_%d_%H_%M')
-        if os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
-        os.makedirs(output_dir)
-        check_point.set_outdir(output_dir)
 
+    check_point = create_checkpoint('scale_checkpoint.log', 'filebench_scale')
     test_conf = {
         'test': 'scale',
         'filesystems': args.formats,
@@ -301,34 +1945,15 @@ def test_scalability(args):
         'ndirs': ndirs,
         'mount_options': 'noatime,nodirtime',
     }
-    mfsbase.dump_configure(test_conf, os.path.join(output_dir, 'testmeta.txt'))
-
-    steps = 0
-    for fs in args.formats.split(','):
-        for wl in args.workloads.split(','):
-            for nproc in map(int, args.nproc):
-                for i in range(args.iteration):
-                    steps += 1
-                    if check_point.steps >= steps:
-                        continue
-                    check_point.start()
-                    print('Run scalability test')
-                    output_prefix = '{}/scale_{}_{}_{}_{}_{}_{}'.format(
-                        output_dir, fs, wl, ndisks, ndirs, nproc, i)
-                    prepare_disks('ramdisks', ndisks, ndirs, fs=fs,
-                                  no_journal=no_journal)
-                    if not run_filebench(wl, ndisks=ndisks, ndirs=ndirs,
-                                         nprocs=nproc,
-                                         threads=1, output=output_prefix,
-                                         events=args.events,
-                                         vmlinux=args.vmlinux,
-                                         kallsyms=args.kallsyms,
-                                         no_profile=args.no_profile):
-                        print('Failed to execute run_filebench')
-                        return False
-                    check_point.done()
+    mfsbase.dump_configure(test_conf,
+                           os.path.join(check_point.outdir, 'testmeta.txt'))
 
-    return True
+    dimensions = common_dimensions(args) + [
+        Dimension('nproc', map(int, args.nproc))]
+    return run_matrix(args, 'scale', check_point, dimensions,
+                      lambda cell: {'ndisks': ndisks, 'ndirs': ndirs,
+                                    'nprocs': cell['nproc'], 'nthreads': 1,
+                                    'label': cell['nproc']})
 
 
 def test_cpu_scale(args):
@@ -336,20 +1961,9 @@ def test_cpu_scale(args):
     """
     ndisks = 1
     ndirs = 1
-    no_journal = args.no_journal
-
-    check_point = checkpoint.Checkpoint('cpu_checkpoint.log')
-    output_dir = ''
-    if check_point.outdir:
-        output_dir = check_point.outdir
-    else:
-        now = datetime.now()
-        output_dir = 'filebench_cpuscale_' + now.strftime('%Y_%m_%d_%H_%M')
-        if os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
-        os.makedirs(output_dir)
-        check_point.set_outdir(output_dir)
 
+    check_point = create_checkpoint('cpu_checkpoint.log',
+                                    'filebench_cpuscale')
     test_conf = {
         'test': 'cpu_scale',
         'filesystems': args.formats,
@@ -360,58 +1974,53 @@ def test_cpu_scale(args):
         'ndirs': ndirs,
         'mount_options': 'noatime,nodirtime',
     }
-    mfsbase.dump_configure(test_conf, os.path.join(output_dir, 'testmeta.txt'))
+    mfsbase.dump_configure(test_conf,
+                           os.path.join(check_point.outdir, 'testmeta.txt'))
+
+    def _set_cpus(ncpus):
+        cpus = "0-{}".format(ncpus - 1)
+        print('CPU scale test: cpus: {}'.format(cpus))
+        set_cpus.set_cpus(cpus)
+
+    def _params(cell):
+        params = {'ndisks': ndisks, 'ndirs': ndirs, 'nprocs': nproc,
+                  'nthreads': args.thread, 'label': cell['ncpus']}
+        params.update(cpuset_params(args, "0-{}".format(cell['ncpus'] - 1)))
+        return params
 
-    steps = 0
     nproc = args.process
-    for fs in args.formats.split(','):
-        for wl in args.workloads.split(','):
-            for ncpus in map(int, args.cpus):
-                cpus = "0-{}".format(ncpus - 1)
-                print('CPU scale test: cpus: {}, fs: {}, workload: {}'.format(
-                    cpus, fs, wl))
-                set_cpus.set_cpus(cpus)
-                for i in range(args.iteration):
-                    steps += 1
-                    if check_point.should_skip(steps):
-                        continue
-                    check_point.start()
-                    retry = args.retry
-                    print('Run CPU scalability test')
-                    output_prefix = '{}/cpuscale_{}_{}_{}_{}_{}_{}'.format(
-                        output_dir, fs, wl, ndisks, ndirs, ncpus, i)
-                    while retry:
-                        prepare_disks('ramdisks', ndisks, ndirs, fs=fs,
-                                      no_journal=no_journal)
-                        if not run_filebench(wl, ndisks=ndisks, ndirs=ndirs,
-                                             nprocs=nproc,
-                                             threads=1, output=output_prefix,
-                                             events=args.events,
-                                             vmlinux=args.vmlinux,
-                                             kallsyms=args.kallsyms,
-                                             no_profile=args.no_profile):
-                            # set_cpus.reset()
-                            print('Failed to execute run_filebench')
-                            retry -= 1
-                            continue
-                        break
-                    if retry > 0:
-                        check_point.done()
-                    else:
-                        set_cpus.reset()
-                        return False
-                set_cpus.reset()
-    return True
+    hotplug = args.cpu_backend == 'hotplug'
+    dimensions = common_dimensions(args) + [
+        Dimension('ncpus', map(int, args.cpus),
+                  cost=TRANSITION_COSTS['cpus'] if hotplug else 0,
+                  setup=_set_cpus if hotplug else None)]
+    return run_matrix(args, 'cpuscale', check_point, dimensions, _params,
+                      retry=args.retry,
+                      reset=set_cpus.reset if hotplug else None)
 
 
 def test_numa(args):
     """Test how NUMA architecture affects the filebench performance.
+
+    The CPU sets of the same size are spread over 1 to N NUMA nodes of this
+    machine (see topology.Topology.numa_configs()), and the memory of
+    filebench is bound to the same nodes.
     """
-    CPU_CONFS = ['0-23', '0-11,24-35', '0-5,12-17,24-29,36-41',
-                 '0-2,6-8,12-14,18-20,24-26,30-32,36-38,42-44']
     ndisks = args.disks
     ndirs = args.dirs
-    nproc = 48
+
+    hotplug = args.cpu_backend == 'hotplug'
+    if hotplug:
+        # The topology of the offline CPUs is not available.
+        set_cpus.reset()
+    topo = topology.Topology()
+    cpu_confs = topo.numa_configs(args.ncpus, siblings=args.siblings)
+    if not cpu_confs:
+        print('Can not spread {} CPUs over the NUMA nodes.'.format(
+            args.ncpus))
+        return False
+    mems = dict(cpu_confs)
+    nproc = args.process or len(topo.cpus())
 
     # Prepare output disk
     check_point = create_checkpoint('numa_checkpoint.log', 'filebench_numa')
@@ -422,45 +2031,27 @@ def test_numa(args):
         'iteration': args.iteration,
         'ndisks': ndisks,
         'ndirs': ndirs,
+        'nprocs': nproc,
+        'cpu_confs': cpu_confs,
         'mount_options': 'noatime,nodirtime',
     }
     mfsbase.dump_configure(test_conf,
                            os.path.join(check_point.outdir, 'testmeta.txt'))
 
-    steps = 0
-    for fs in args.formats.split(','):
-        for wl in args.workloads.split(','):
-            for cpus in CPU_CONFS:
-                set_cpus.set_cpus(cpus)
-                for i in range(args.iteration):
-                    steps += 1
-                    if check_point.should_skip(steps):
-                        continue
-                    check_point.start()
-                    output_prefix = '{}/numa_{}_{}_{}_{}_{}_{}'.format(
-                        check_point.outdir, fs, wl, ndisks, ndirs, cpus, i)
-                    print('Run NUMA test on CPUs {} for iteration {}'
-                          .format(cpus, i))
-                    retry = args.retry
-                    while retry:
-                        prepare_disks('ramdisks', ndisks, ndirs, fs=fs,
-                                      no_journal=args.no_journal)
-                        if run_filebench(wl, ndisks=ndisks, ndirs=ndirs,
-                                         nprocs=nproc,
-                                         threads=1, output=output_prefix,
-                                         events=args.events,
-                                         vmlinux=args.vmlinux,
-                                         kallsyms=args.kallsyms,
-                                         no_profile=args.no_profile):
-                            break
-                        print('Failed to execute run_filebench')
-                        retry -= 1
-                    if not retry:
-                        set_cpus.reset()
-                        return False
-                    check_point.done()
-            set_cpus.reset()
-    return True
+    def _params(cell):
+        params = {'ndisks': ndisks, 'ndirs': ndirs, 'nprocs': nproc,
+                  'nthreads': 1, 'mems': mems[cell['cpus']],
+                  'label': cell['cpus']}
+        params.update(cpuset_params(args, cell['cpus']))
+        return params
+
+    dimensions = common_dimensions(args) + [
+        Dimension('cpus', [cpus for cpus, _ in cpu_confs],
+                  cost=TRANSITION_COSTS['cpus'] if hotplug else 0,
+                  setup=set_cpus.set_cpus if hotplug else None)]
+    return run_matrix(args, 'numa', check_point, dimensions, _params,
+                      retry=args.retry,
+                      reset=set_cpus.reset if hotplug else None)
 
 
 def test_multi_filesystem(args):
@@ -478,48 +2069,101 @@ def test_multi_filesystem(args):
         'iteration': args.iteration,
         'ndisks': args.ndisks,
         'ndirs': ndirs,
+        'placement': args.placement,
         'mount_options': 'noatime,nodirtime',
     }
     mfsbase.dump_configure(test_conf,
                            os.path.join(check_point.outdir, 'testmeta.txt'))
 
-    steps = 0
-    for fs in args.formats.split(','):
-        for wl in args.workloads.split(','):
-            for num_disks in args.ndisks:
-                for num_dirs in range(1, ndirs + 1):
-                    for i in range(args.iteration):
-                        steps += 1
-                        if check_point.should_skip(steps):
-                            continue
-                        check_point.start()
-                        retry = args.retry
-                        print("Run multi-filesystem test: " +
-                              "{} disk {} dirs".format(num_disks, num_dirs))
-                        output_prefix = '{}/multifs_{}_{}_{}_{}_{}_{}'.format(
-                            check_point.outdir, fs, wl, num_disks, ndirs,
-                            nprocs, i)
-                        while retry:
-                            prepare_disks('ramdisks', num_disks, num_dirs,
-                                          fs=fs, no_journal=args.no_journal)
-                            if not run_filebench(
-                                    wl, ndisks=num_disks, ndirs=num_dirs,
-                                    nprocs=int(nprocs / num_disks), threads=1,
-                                    output=output_prefix,
-                                    events=args.events,
-                                    vmlinux=args.vmlinux,
-                                    kallsyms=args.kallsyms,
-                                    no_profile=args.no_profile,
-                                    affinity=True):
-                                print('Failed to execute run_filebench')
-                                retry -= 1
-                                continue
-                            break
-                        if retry > 0:
-                            check_point.done()
-                        else:
-                            return False
-    return True
+    dimensions = common_dimensions(args) + [
+        Dimension('ndisks', map(int, args.ndisks),
+                  cost=TRANSITION_COSTS['ndisks']),
+        Dimension('ndirs', range(1, ndirs + 1))]
+    return run_matrix(args, 'multifs', check_point, dimensions,
+                      lambda cell: {'ndisks': cell['ndisks'],
+                                    'ndirs': cell['ndirs'],
+                                    'nprocs': int(nprocs / cell['ndisks']),
+                                    'nthreads': 1,
+                                    'affinity': args.placement,
+                                    'label': nprocs},
+                      retry=args.retry)
+
+
+def test_dataset(args):
+    """Scales the number of files and the directory width, to expose the
+    scaling of the dcache and the hash tables.
+
+    The points of the same file system, workload and directory width run
+    in the increasing order of the number of files on the same disks, so
+    that each point reuses the filesets of the previous one and only creates
+    the new files. The iterations of the same point do not reuse the
+    filesets, which the previous iteration has changed. The points that do
+    not fit in the RAM disks or the memory are skipped.
+    """
+    ndisks = 1
+    ndirs = 1
+    nproc = args.process or len(osutil.get_online_cpus())
+    dirwidths = list(args.dirwidth)
+    nfiles = [num for num in sorted(set(args.nfiles))
+              if all(check_capacity(wl, num, ndisks, ndirs, filesize)
+                     for wl in args.workloads.split(',')
+                     for filesize in args.filesize)]
+    if not nfiles:
+        print('None of the datasets fits in the memory.')
+        return False
+
+    check_point = create_checkpoint('dataset_checkpoint.log',
+                                    'filebench_dataset')
+    test_conf = {
+        'test': 'dataset',
+        'filesystems': args.formats,
+        'workloads': args.workloads,
+        'iteration': args.iteration,
+        'nfiles': nfiles,
+        'dirwidth': dirwidths,
+        'nprocs': nproc,
+        'ndisks': ndisks,
+        'ndirs': ndirs,
+        'mount_options': 'noatime,nodirtime',
+    }
+    mfsbase.dump_configure(test_conf,
+                           os.path.join(check_point.outdir, 'testmeta.txt'))
+
+    # The filesets on the mounted disks, and the number of files of the last
+    # point that ran on them.
+    populated = {}
+
+    def _prepare(args, cell, conf, output):
+        filesets = (cell['fs'], cell['workload'], cell['dirwidth'],
+                    cell['filesize'], cell['contention'],
+                    cell['concurrency'])
+        if populated.get('filesets') == filesets and \
+                populated['nfiles'] < cell['nfiles'] and \
+                mounted_disks('ramdisks'):
+            populated['nfiles'] = cell['nfiles']
+            return True
+        populated.clear()
+        reuse = prepare_cell_disks(args, cell, conf, output)
+        populated.update({'filesets': filesets, 'nfiles': cell['nfiles']})
+        return reuse
+
+    def _params(cell):
+        label = cell['nfiles']
+        if cell['dirwidth']:
+            label = '{}w{}'.format(cell['nfiles'], cell['dirwidth'])
+        return {'ndisks': ndisks, 'ndirs': ndirs, 'nprocs': nproc,
+                'nthreads': 1, 'nfiles': cell['nfiles'],
+                'dirwidth': cell['dirwidth'], 'keep_disks': True,
+                'label': label}
+
+    dimensions = common_dimensions(args) + [
+        Dimension('dirwidth', dirwidths,
+                  cost=TRANSITION_COSTS['dirwidth']),
+        Dimension('nfiles', nfiles)]
+    return run_matrix(args, 'dataset', check_point, dimensions, _params,
+                      retry=args.retry, prepare=_prepare, snake=False,
+                      reset=lambda: teardown_disks('ramdisks',
+                                                   args.disk_jobs))
 
 
 def main():
@@ -535,9 +2179,34 @@ def main():
                         help='set workloads, separated by comma. (default: {})'
                         .format(','.join(WORKLOADS)))
     parser.add_argument('-i', '--iteration', metavar='NUM', type=int,
-                        default=1, help='set iteration, default: 1')
-    parser.add_argument('-s', '--iosize', metavar='NUM', type=int,
-                        default=1024, help='set IOSIZE (default: 1024)')
+                        default=1, help='set iteration, or the max iteration '
+                                        'with --ci-width, default: 1')
+    parser.add_argument('--ci-width', type=float, metavar='WIDTH', default=0,
+                        help='stop iterating a test once the confidence '
+                             'interval is within +/-WIDTH of the mean, e.g., '
+                             '0.05 (default: disabled)')
+    parser.add_argument('--ci-level', type=float, default=0.95,
+                        choices=sorted(mfsbase.T_QUANTILES),
+                        help='set the confidence level (default: '
+                             '%(default)s)')
+    parser.add_argument('--ci-measure', default='iops',
+                        choices=['iops', 'throughput'],
+                        help='set the measure of the confidence interval '
+                             '(default: %(default)s)')
+    parser.add_argument('--min-iteration', metavar='NUM', type=int,
+                        default=3, help='the min iteration with --ci-width '
+                                        '(default: %(default)d)')
+    parser.add_argument('-s', '--iosize', metavar='SIZE,..', type=size_list,
+                        default=[4096],
+                        help='set the I/O sizes, e.g., 4k,64k, separated by '
+                             'comma. The run command uses the first one '
+                             '(default: 4k)')
+    parser.add_argument('--filesize', metavar='SIZE,..', type=size_list,
+                        default=[0],
+                        help='set the mean file sizes, e.g., 4k,1m, 0 for '
+                             'the default of the workload, separated by '
+                             'comma. The run command uses the first one '
+                             '(default: 0)')
     parser.add_argument('-r', '--run', metavar='NUM', type=int,
                         default=60, help='set run time (default: 60)')
     parser.add_argument('--no_profile', action='store_true', default=False,
@@ -553,6 +2222,100 @@ def main():
                         help='set vmlinux pathname for perf (optional)')
     parser.add_argument('-S', '--kallsyms', default=None, metavar='FILE',
                         help='set kallsyms pathname for perf (optional)')
+    parser.add_argument('--interval', type=int, metavar='SEC', default=0,
+                        help='sample filebench results every SEC seconds '
+                             'as a time series (default: disabled)')
+    parser.add_argument('--sync', action='store_true', default=False,
+                        help='start the measured runs of all filebench '
+                             'instances together after preallocation, and '
+                             'aggregate the results within the window where '
+                             'all instances are running (sampled every '
+                             '--interval, or every second)')
+    parser.add_argument('--perf-jobs', type=int, metavar='NUM',
+                        default=cpu_count(),
+                        help='generate perf reports with NUM processes after '
+                             'all tests finished, 0 to generate each report '
+                             'right after its test (default: %(default)d)')
+    parser.add_argument('--perf-stat', action='store_true', default=False,
+                        help='count PMU events with "perf stat" instead of '
+                             'sampling with "perf record"')
+    parser.add_argument('--stat-events', default='', metavar='EVT,..',
+                        help='set the events to count by "perf stat" '
+                             '(default: {})'.format(
+                                 mfsbase.PerfStatProfiler.EVENTS))
+    parser.add_argument('--cpu-interval', type=float, metavar='SEC',
+                        default=0,
+                        help='sample the per-CPU usage in /proc/stat every '
+                             'SEC seconds (default: disabled)')
+    parser.add_argument('--sys-interval', type=float, metavar='SEC',
+                        default=0,
+                        help='sample the memory, slab, RAM disk, scheduler '
+                             'and softirq statistics every SEC seconds '
+                             '(default: disabled)')
+    parser.add_argument('--sys-sources', default='', metavar='SRC,..',
+                        help='set the sources to sample with --sys-interval '
+                             '(default: {})'.format(','.join(sorted(
+                                 mfsbase.SystemSampler.SOURCES))))
+    parser.add_argument('--image-cache', metavar='DIR', default='',
+                        help='restore the disks from the golden images '
+                             'cached in DIR instead of formatting them on '
+                             'every run (default: disabled)')
+    parser.add_argument('--verify-images', action='store_true',
+                        default=False,
+                        help='verify the checksum of every disk restored '
+                             'from --image-cache, instead of only the disks '
+                             'restored right after building the image')
+    parser.add_argument('--disk-jobs', type=int, metavar='NUM', default=0,
+                        help='prepare and unmount up to NUM disks in '
+                             'parallel, 0 for all disks at once '
+                             '(default: %(default)d)')
+    parser.add_argument('--steady-cv', type=float, metavar='CV',
+                        default=0,
+                        help='stop each run once the coefficient of variation '
+                             'of the IOPS over the last --steady-window '
+                             'intervals is not larger than CV (default: '
+                             'disabled)')
+    parser.add_argument('--steady-window', type=int, metavar='NUM',
+                        default=5,
+                        help='the number of intervals to check the steady '
+                             'state (default: %(default)d)')
+    parser.add_argument('--min-runtime', type=int, metavar='SEC',
+                        default=10,
+                        help='the min runtime before the steady state '
+                             '(default: %(default)d)')
+    parser.add_argument('--max-runtime', type=int, metavar='SEC',
+                        default=60,
+                        help='the max runtime to wait for the steady state '
+                             '(default: %(default)d)')
+    parser.add_argument('--result-cache', metavar='DIR', default='',
+                        help='reuse the results of the same tests cached in '
+                             'DIR, and cache the new results there '
+                             '(default: disabled)')
+    parser.add_argument('--cpu-backend', default='hotplug',
+                        choices=['hotplug'] + cpuset.BACKENDS,
+                        help='set how cpuscale and numa tests restrict the '
+                             'CPUs: hotplug the other CPUs, or confine the '
+                             'benchmark with a cgroup cpuset or CPU affinity '
+                             '(default: %(default)s)')
+    parser.add_argument('--contention', metavar='TOPO,..', default=['dir'],
+                        type=contention_list,
+                        help='set how the processes share the directories: '
+                             'dir (one instance in each directory), disk '
+                             '(one instance on each disk), shared (all '
+                             'processes in one directory) or hashed:K (hash '
+                             'the processes over K directories), separated '
+                             'by comma (default: dir)')
+    parser.add_argument('--concurrency', metavar='MODEL,..',
+                        default=['procs'], type=concurrency_list,
+                        help='set how the tasks of each instance run: procs '
+                             '(processes), threads (one process of threads), '
+                             'mixed (balanced processes and threads) or '
+                             'mixed:T (processes of T threads), separated by '
+                             'comma (default: procs)')
+    parser.add_argument('--placement', default='node-per-disk',
+                        choices=topology.PLACEMENTS,
+                        help='set how the multifs test places the filebench '
+                             'instances on the CPUs (default: %(default)s)')
     parser.add_argument('-R', '--retry', type=int, metavar='NUM', default=5,
                         help='Retry hanging benchmark (default: %(default)d)')
 
@@ -587,8 +2350,37 @@ def main():
     parser_numa.add_argument(
         '-N', '--dirs', type=int, metavar='NUM', default=1,
         help='set the number of directories in each disk.')
+    parser_numa.add_argument(
+        '-c', '--ncpus', type=int, metavar='NUM', default=0,
+        help='set the number of CPUs in each CPU set, 0 for the CPUs of one '
+             'NUMA node (default: %(default)d)')
+    parser_numa.add_argument(
+        '-p', '--process', type=int, metavar='NUM', default=0,
+        help='set the number of processes, 0 for the number of CPUs '
+             '(default: %(default)d)')
+    parser_numa.add_argument(
+        '--siblings', action='store_true', default=False,
+        help='fill up the SMT siblings of a core before using the next core')
     parser_numa.set_defaults(func=test_numa)
 
+    parser_dataset = subs.add_parser(
+        'dataset', help='Test with different numbers of files and directory '
+        'widths.')
+    parser_dataset.add_argument(
+        '--nfiles', metavar='NUM,..', action=SplitCommaAction,
+        default=[1000, 10000, 100000, 1000000, 10000000],
+        help='set the numbers of files of each instance')
+    parser_dataset.add_argument(
+        '--dirwidth', metavar='NUM,..', action=SplitCommaAction,
+        default=[0],
+        help='set the mean directory widths, 0 for the default of the '
+             'workload (default: 0)')
+    parser_dataset.add_argument(
+        '-p', '--process', type=int, metavar='NUM', default=0,
+        help='set the number of processes, 0 for the number of CPUs '
+             '(default: %(default)d)')
+    parser_dataset.set_defaults(func=test_dataset)
+
     parser_multifs = subs.add_parser('multifs', help='Test multi-filesystem.')
     parser_multifs.add_argument('--ndisks', metavar='NUM',
                                 action=SplitCommaAction, default=range(1, 5),
@@ -618,10 +2410,62 @@ def main():
         '--timeout', metavar='SEC', type=int, default=600,
         help="set the timeout of waiting process to finish, "
              "default: %(default)d seconds.")
-    parser_run.add_argument('--affinity', action='store_true', default=False,
-                            help='set CPU affinity for each group of threads')
+    parser_run.add_argument('--affinity', nargs='?', const='compact',
+                            default=None, choices=topology.PLACEMENTS,
+                            help='place each filebench instance on separate '
+                                 'CPUs with the policy (default: compact)')
+    parser_run.add_argument('--interval', type=int, metavar='SEC', default=0,
+                            help='sample the results every SEC seconds '
+                                 '(default: disabled)')
+    parser_run.add_argument('--sync', action='store_true', default=False,
+                            help='start the measured runs of all instances '
+                                 'together after preallocation')
+    parser_run.add_argument('--steady-cv', type=float, metavar='CV',
+                            default=0,
+                            help='stop once the coefficient of variation of '
+                                 'the IOPS is not larger than CV')
+    parser_run.add_argument('--steady-window', type=int, metavar='NUM',
+                            default=5,
+                            help='the number of intervals to check the '
+                                 'steady state (default: %(default)d)')
+    parser_run.add_argument('--min-runtime', type=int, metavar='SEC',
+                            default=10,
+                            help='the min runtime before the steady state '
+                                 '(default: %(default)d)')
+    parser_run.add_argument('--max-runtime', type=int, metavar='SEC',
+                            default=60,
+                            help='the max runtime to wait for the steady '
+                                 'state (default: %(default)d)')
+    parser_run.add_argument('--cpuset', metavar='CPUS', default='',
+                            help='confine filebench to CPUS, e.g., 0-3')
+    parser_run.add_argument('--cpu-backend', default='cgroup',
+                            choices=cpuset.BACKENDS,
+                            help='set the backend of --cpuset (default: '
+                                 '%(default)s)')
+    parser_run.add_argument('--mems', metavar='NODES', default='',
+                            help='bind the memory of the cgroup cpuset to '
+                                 'NODES, e.g., 0-1')
+    parser_run.add_argument('--contention', default='dir',
+                            help='set how the processes share the '
+                                 'directories (default: %(default)s)')
+    parser_run.add_argument('--nfiles', type=int, metavar='NUM',
+                            default=NFILES,
+                            help='set the number of files of each instance '
+                                 '(default: %(default)d)')
+    parser_run.add_argument('--dirwidth', type=int, metavar='NUM', default=0,
+                            help='set the mean directory width of the '
+                                 'filesets (default: of the workload)')
+    parser_run.add_argument('--reuse', action='store_true', default=False,
+                            help='reuse the filesets populated in the disks')
     parser_run.set_defaults(func=test_run)
 
+    parser_post = subs.add_parser(
+        'postprocess', help='Run the pending post-processing jobs (e.g., perf '
+        'report) of a test.')
+    parser_post.add_argument('dir', metavar='DIR',
+                             help='the output directory of the test.')
+    parser_post.set_defaults(func=test_post_process)
+
     args = parser.parse_args()
     if 'func' not in args:
         parser.print_help()
@@ -31,8 +31,9 @@ set $nthreads=50
 set $nprocesses=1
 set $iosize=1m
 set $meanappendsize=16k
+set $reuse=false
 
-define fileset name=bigfileset,path=$dir,size=$meanfilesize,entries=$nfiles,dirwidth=$meandirwidth,prealloc=80
+define fileset name=bigfileset,path=$dir,size=$meanfilesize,entries=$nfiles,dirwidth=$meandirwidth,prealloc=80,reuse=$reuse
 
 define process name=filereader,instances=$nprocesses
 {
@@ -31,9 +31,10 @@ set $nprocesses=1
 set $nthreads=100
 set $iosize=1m
 set $meanappendsize=16k
+set $reuse=false
 
-define fileset name=bigfileset,path=$dir,size=$meanfilesize,entries=$nfiles,dirwidth=$meandirwidth,prealloc=100
-define fileset name=logfiles,path=$dir,size=$meanfilesize,entries=1,dirwidth=$meandirwidth,prealloc
+define fileset name=bigfileset,path=$dir,size=$meanfilesize,entries=$nfiles,dirwidth=$meandirwidth,prealloc=100,reuse=$reuse
+define fileset name=logfiles,path=$dir,size=$meanfilesize,entries=1,dirwidth=$meandirwidth,prealloc,reuse=$reuse
 
 define process name=filereader,instances=$nprocesses
 {
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Runs an experiment matrix, i.e., the cartesian product of the dimensions
+of a test (file systems, workloads, CPUs and etc.).
+
+The cells are ordered so that the expensive transitions (e.g., hotplugging
+CPUs or switching file systems) happen as rarely as possible, and the time
+of the whole campaign is estimated from the costs measured so far.
+"""
+
+from __future__ import print_function
+from collections import Counter
+import os
+import time
+
+# The file of the measured costs in the output directory.
+COST_LOG = 'matrix_costs.txt'
+
+
+class Dimension:
+    """One dimension of an experiment matrix.
+    """
+    def __init__(self, name, values, cost=0, setup=None):
+        """Constructs a Dimension.
+
+        @param name the name of the dimension, which is also the key of the
+        cells.
+        @param values the list of values.
+        @param cost the estimated cost (in seconds) to change the value, used
+        to order the cells before the real cost is measured.
+        @param setup if set, it is called with the new value before running a
+        cell whose value is different from the previous cell, e.g., to
+        hotplug CPUs.
+        """
+        self.name = name
+        self.values = list(values)
+        self.cost = cost
+        self.setup = setup
+
+
+class Matrix:
+    """An experiment matrix.
+
+    The dimensions are nested by their costs, i.e., the most expensive one is
+    the outermost loop, and the inner loops go back and forth ("snake"
+    order) so that two adjacent cells share as many values as possible. The
+    iterations are always the innermost loop.
+    """
+    def __init__(self, dimensions, iterations=1, outdir='.',
+                 default_cost=60, snake=True):
+        """Constructs a Matrix.
+
+        @param dimensions a list of Dimension, in the order of preference
+        when two dimensions have the same cost.
+        @param iterations the number of iterations of each cell.
+        @param outdir the directory to log the measured costs.
+        @param default_cost the estimated time (in seconds) of running one
+        cell, before any cell is measured.
+        @param snake if False, the inner loops always run in the order of the
+        values, e.g., when a cell reuses the state left by a smaller cell.
+        """
+        self.dimensions = sorted(dimensions, key=lambda dim: -dim.cost)
+        self.iterations = iterations
+        self.outdir = outdir
+        self.default_cost = default_cost
+        self.snake = snake
+        self.cell_costs = {}
+        self.setup_costs = {}
+
+    def cells(self):
+        """Returns all cells in the running order.
+
+        @return a list of dicts of {dimension name: value}, with the
+        'iteration'.
+        """
+        def _snake(dims):
+            if not dims:
+                return [()]
+            inner = _snake(dims[1:])
+            values = []
+            for idx, value in enumerate(dims[0].values):
+                block = inner
+                if self.snake and idx % 2:
+                    block = list(reversed(inner))
+                values += [(value,) + rest for rest in block]
+            return values
+
+        names = [dim.name for dim in self.dimensions]
+        cells = []
+        for values in _snake(self.dimensions):
+            for iteration in range(self.iterations):
+                cell = dict(zip(names, values))
+                cell['iteration'] = iteration
+                cells.append(cell)
+        return cells
+
+    def transitions(self, cells):
+        """Counts the changes of each dimension along the cells.
+
+        @return a Counter of {dimension name: number of changes}.
+        """
+        changes = Counter()
+        for before, after in zip(cells, cells[1:]):
+            for dim in self.dimensions:
+                if before[dim.name] != after[dim.name]:
+                    changes[dim.name] += 1
+        return changes
+
+    @staticmethod
+    def key(cell):
+        """Returns the key of a cell without the iteration.
+        """
+        return ','.join('{}={}'.format(name, cell[name]) for name in
+                        sorted(cell) if name != 'iteration')
+
+    def load_costs(self):
+        """Loads the costs measured in the output directory, e.g., before
+        the test was interrupted.
+        """
+        self.cell_costs = {}
+        self.setup_costs = {}
+        path = os.path.join(self.outdir, COST_LOG)
+        if not os.path.exists(path):
+            return
+        with open(path) as fobj:
+            for line in fobj:
+                fields = line.split()
+                if len(fields) != 3:
+                    continue
+                costs = self.cell_costs if fields[0] == 'cell' else \
+                    self.setup_costs
+                costs.setdefault(fields[1], []).append(float(fields[2]))
+
+    def log_cost(self, kind, key, seconds):
+        """Logs one measured cost.
+
+        @param kind 'cell' for running a cell, or 'setup' for changing the
+        value of a dimension.
+        """
+        costs = self.cell_costs if kind == 'cell' else self.setup_costs
+        costs.setdefault(key, []).append(seconds)
+        with open(os.path.join(self.outdir, COST_LOG), 'a') as fobj:
+            fobj.write('{} {} {:.3f}\n'.format(kind, key, seconds))
+
+    def cell_cost(self, cell):
+        """Estimates the time of running a cell from the measured costs of
+        the same cell, or of all cells.
+        """
+        def _mean(values):
+            return sum(values) / len(values)
+
+        measured = self.cell_costs.get(self.key(cell))
+        if measured:
+            return _mean(measured)
+        if self.cell_costs:
+            return _mean([_mean(x) for x in self.cell_costs.values()])
+        return self.default_cost
+
+    def setup_cost(self, dim):
+        """Estimates the cost of changing the value of a dimension.
+        """
+        measured = self.setup_costs.get(dim.name)
+        if measured:
+            return sum(measured) / len(measured)
+        return dim.cost
+
+    def estimate(self, cells):
+        """Estimates the time (in seconds) of running the cells.
+        """
+        total = sum(self.cell_cost(cell) for cell in cells)
+        changes = self.transitions(cells)
+        for dim in self.dimensions:
+            if dim.setup:
+                total += changes[dim.name] * self.setup_cost(dim)
+        return total
+
+    def run(self, run_cell, check_point, **kwargs):
+        """Runs all cells of the matrix.
+
+        @param run_cell the function to run one cell. It is called with the
+        dict of the cell, and returns True if it succeeded.
+        @param check_point the checkpoint.Checkpoint of the test. The cells
+        finished before are skipped.
+
+        Optional params
+        @param retry the number of tries of each cell (default: 1).
+        @param skip if set, it is called with the dict of a cell and returns
+        True if the cell should be skipped, e.g., enough iterations are done.
+        @param reset if set, it is called after all cells or a failed cell,
+        e.g., to bring all CPUs online.
+
+        @return True if all cells succeeded.
+        """
+        retry = kwargs.get('retry', 1)
+        skip = kwargs.get('skip', None)
+        reset = kwargs.get('reset', None)
+
+        cells = self.cells()
+        self.load_costs()
+        changes = self.transitions(cells)
+        print('Run {} cells, {} transitions ({}), estimated time: {:.0f}s'
+              .format(len(cells), sum(changes.values()),
+                      ', '.join('{}: {}'.format(dim.name, changes[dim.name])
+                                for dim in self.dimensions),
+                      self.estimate(cells)))
+
+        current = {}
+        for step, cell in enumerate(cells, 1):
+            if check_point.should_skip(step):
+                continue
+            check_point.start()
+            if skip and skip(cell):
+                check_point.done()
+                continue
+            for dim in self.dimensions:
+                if dim.setup and current.get(dim.name) != cell[dim.name]:
+                    start = time.time()
+                    dim.setup(cell[dim.name])
+                    current[dim.name] = cell[dim.name]
+                    self.log_cost('setup', dim.name, time.time() - start)
+            start = time.time()
+            tries = retry
+            while tries and not run_cell(cell):
+                print('Failed to run {}'.format(self.key(cell)))
+                tries -= 1
+            if not tries:
+                if reset:
+                    reset()
+                return False
+            self.log_cost('cell', self.key(cell), time.time() - start)
+            check_point.done()
+            print('Finished {} of {} cells, estimated remaining time: '
+                  '{:.0f}s'.format(step, len(cells),
+                                   self.estimate(cells[step:])))
+        if reset:
+            reset()
+        return True
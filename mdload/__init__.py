@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""A metadata load generator that does not depend on filebench.
+
+Usage: python3 -m mdload -w mixed -d ramdisks/ram0 -p 1,2,4,8 -o out/mdload
+
+The results of each run are written to out/mdload_{workload}_{nprocs}_0_*.
+"""
+
+from mdload.spec import OPS, WORKLOADS, Workload, parse_spec
+from mdload.engine import run_workload, write_result
+
+__all__ = ['OPS', 'WORKLOADS', 'Workload', 'parse_spec', 'run_workload',
+           'write_result']
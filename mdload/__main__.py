@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Runs a metadata workload with different numbers of workers, and adds the
+results to the result store in the output directory.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pyro'))
+from mdload import WORKLOADS, parse_spec, run_workload, write_result
+from pyro import osutil
+from resultstore import ResultStore, RESULT_DB
+
+
+def main():
+    """Runs the metadata load generator.
+    """
+    parser = argparse.ArgumentParser(prog='mdload')
+    parser.add_argument('-w', '--workload', metavar='SPEC', default='mixed',
+                        help='set the workload, a preset ({}) or a spec, '
+                             'e.g., create=1,unlink=1,nfiles=1000 '
+                             '(default: %(default)s)'.format(
+                                 ','.join(sorted(WORKLOADS))))
+    parser.add_argument('-d', '--dir', metavar='DIR', default='.',
+                        help='set the directory to create the directory of '
+                             'each run in (default: %(default)s)')
+    parser.add_argument('-p', '--nprocs', metavar='NUM,..', default='1',
+                        help='set the numbers of workers to run, separated '
+                             'by comma (default: %(default)s)')
+    parser.add_argument('-c', '--cpus', metavar='CPUS', default='',
+                        help='pin the workers on CPUS, e.g., 0-3 '
+                             '(default: the CPUs of this process)')
+    parser.add_argument('--no-pin', action='store_true', default=False,
+                        help='do not pin the workers on CPUs')
+    parser.add_argument('--keep', action='store_true', default=False,
+                        help='keep the files after each run')
+    parser.add_argument('--fs', default='',
+                        help='set the file system to record in the results')
+    parser.add_argument('-o', '--output', metavar='PREFIX', default='mdload',
+                        help='set the prefix of the output files '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+
+    workload = parse_spec(args.workload)
+    cpus = osutil.parse_cpus(args.cpus) if args.cpus else None
+    outdir = os.path.dirname(args.output) or '.'
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    with open(args.output + '_workload.txt', 'w') as fobj:
+        fobj.write(workload.spec() + '\n')
+
+    for nprocs in [int(x) for x in args.nprocs.split(',')]:
+        output = '{}_{}_{}_0'.format(args.output, workload.name, nprocs)
+        result = run_workload(workload, args.dir, nprocs, cpus=cpus,
+                              pin=not args.no_pin, cleanup=not args.keep)
+        write_result(output, result)
+        print('{} workers: {:.1f} IOPS, {:.2f} MB/s'.format(
+            nprocs, result['iops'], result['throughput']))
+        if args.keep:
+            print('The files are kept in {}'.format(result['dir']))
+        store = ResultStore(os.path.join(outdir, RESULT_DB))
+        store.add({'test': 'mdload', 'fs': args.fs,
+                   'workload': workload.name, 'nprocs': nprocs,
+                   'nthreads': 1, 'iteration': 0,
+                   'iops': result['iops'],
+                   'throughput': result['throughput'],
+                   'runtime': result['runtime'],
+                   'output': os.path.basename(output),
+                   'cell': os.path.basename(output)[:-len('_0')]})
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Runs a metadata workload with a pool of worker processes.
+
+Each worker is pinned to one CPU and owns a table of file paths built before
+the run, so the measured loop only calls os.open(), os.stat() and etc. The
+latency of each op is added to a log2 histogram in shared memory, which the
+parent merges after all workers exit.
+"""
+
+from __future__ import print_function
+from multiprocessing import Barrier, Process, RawArray
+from threading import BrokenBarrierError
+from mdload.spec import OPS
+import os
+import shutil
+import tempfile
+import time
+import mfsbase
+
+CREATE, OPEN, STAT, RENAME, UNLINK, READDIR, APPEND = range(len(OPS))
+NUM_BUCKETS = mfsbase.LatencyHistogram.NUM_BUCKETS
+CREATE_FLAGS = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+APPEND_FLAGS = os.O_WRONLY | os.O_APPEND
+
+
+class SharedCounters:
+    """The per-op counters of all workers in shared memory.
+    """
+    def __init__(self, nworkers):
+        size = nworkers * len(OPS)
+        # The latency histograms, in [worker][op][bucket].
+        self.buckets = RawArray('Q', size * NUM_BUCKETS)
+        # The total, min and max latency (in ns), in [worker][op].
+        self.total = RawArray('Q', size)
+        self.min = RawArray('Q', size)
+        self.max = RawArray('Q', size)
+        # The ops skipped because no file is in the right state, e.g., a
+        # create when all files exist.
+        self.misses = RawArray('Q', size)
+        self.nworkers = nworkers
+
+    def histogram(self, op):
+        """Merges the latencies of one op from all workers.
+
+        @return a mfsbase.LatencyHistogram.
+        """
+        hist = mfsbase.LatencyHistogram()
+        for worker in range(self.nworkers):
+            idx = worker * len(OPS) + op
+            start = idx * NUM_BUCKETS
+            other = mfsbase.LatencyHistogram()
+            other.buckets = list(self.buckets[start:start + NUM_BUCKETS])
+            other.count = sum(other.buckets)
+            other.total = self.total[idx] / 1e6
+            other.min = self.min[idx] / 1e6
+            other.max = self.max[idx] / 1e6
+            hist.merge(other)
+        return hist
+
+    def num_misses(self, op):
+        return sum(self.misses[worker * len(OPS) + op]
+                   for worker in range(self.nworkers))
+
+
+def worker_dirs(basedir, worker, workload):
+    """Returns the directories of a worker.
+    """
+    owner = 'shared' if workload.shared else 'w{}'.format(worker)
+    return [os.path.join(basedir, owner, 'd{}'.format(idx))
+            for idx in range(workload.ndirs)]
+
+
+def build_files(worker, workload, basedir):
+    """Builds the path table of a worker and creates the prefilled files.
+
+    The files are spread over the dirs. A file is absent (state 0), or
+    exists with its first (1) or second (2) name, which rename switches.
+
+    @return a tuple of (dirs, paths, state, used, free), where paths[s][i]
+    is the path of the file i in the state s, and used and free are the
+    lists of the existing and absent files.
+    """
+    dirs = [os.fsencode(path)
+            for path in worker_dirs(basedir, worker, workload)]
+    for path in dirs:
+        os.makedirs(path, exist_ok=True)
+
+    nfiles = workload.nfiles
+    names = [os.path.join(dirs[slot % len(dirs)], b'f%d.%d' % (worker, slot))
+             for slot in range(nfiles)]
+    paths = (None, names, [name + b'.r' for name in names])
+    state = bytearray(nfiles)
+    used = []
+    free = list(range(nfiles - 1, -1, -1))
+    for _ in range(int(nfiles * workload.prefill)):
+        slot = free.pop()
+        os.close(os.open(names[slot], CREATE_FLAGS, 0o644))
+        state[slot] = 1
+        used.append(slot)
+    return dirs, paths, state, used, free
+
+
+def run_worker(worker, workload, basedir, cpu, barrier, counters):
+    """The main function of a worker process.
+
+    @param worker the index of this worker.
+    @param cpu if not None, the CPU to pin this worker on.
+    @param barrier the barrier to start the measured run with the others.
+    @param counters the SharedCounters.
+    """
+    if cpu is not None:
+        os.sched_setaffinity(0, [cpu])
+    try:
+        dirs, paths, state, used, free = build_files(worker, workload,
+                                                     basedir)
+    except Exception:
+        # Releases the parent and the other workers.
+        barrier.abort()
+        raise
+    names = paths[1]
+    buf = b'\0' * workload.iosize
+    ops = workload.schedule(worker)
+    nops = len(ops)
+    ndirs = len(dirs)
+
+    buckets = counters.buckets
+    total = counters.total
+    min_latency = counters.min
+    max_latency = counters.max
+    misses = counters.misses
+    base = worker * len(OPS)
+    max_bucket = NUM_BUCKETS - 1
+    for op in range(len(OPS)):
+        min_latency[base + op] = 2 ** 63
+    clock = time.perf_counter_ns
+    pos = 0
+    cursor = 0
+
+    barrier.wait()
+    now = clock()
+    deadline = now + int(workload.runtime * 1e9)
+    while now < deadline:
+        op = ops[pos]
+        pos += 1
+        if pos == nops:
+            pos = 0
+        if (op == CREATE and not free) or (op != CREATE and op != READDIR and
+                                           not used):
+            misses[base + op] += 1
+            now = clock()
+            continue
+        cursor += 1
+        begin = clock()
+        if op == CREATE:
+            slot = free.pop()
+            os.close(os.open(names[slot], CREATE_FLAGS, 0o644))
+            state[slot] = 1
+            used.append(slot)
+        elif op == STAT:
+            slot = used[cursor % len(used)]
+            os.stat(paths[state[slot]][slot])
+        elif op == OPEN:
+            slot = used[cursor % len(used)]
+            os.close(os.open(paths[state[slot]][slot], os.O_RDONLY))
+        elif op == RENAME:
+            slot = used[cursor % len(used)]
+            old = state[slot]
+            os.rename(paths[old][slot], paths[3 - old][slot])
+            state[slot] = 3 - old
+        elif op == UNLINK:
+            idx = cursor % len(used)
+            slot = used[idx]
+            os.unlink(paths[state[slot]][slot])
+            state[slot] = 0
+            used[idx] = used[-1]
+            used.pop()
+            free.append(slot)
+        elif op == READDIR:
+            os.listdir(dirs[cursor % ndirs])
+        else:
+            slot = used[cursor % len(used)]
+            fd = os.open(paths[state[slot]][slot], APPEND_FLAGS)
+            os.write(fd, buf)
+            os.fsync(fd)
+            os.close(fd)
+        now = clock()
+        latency = now - begin
+        idx = base + op
+        bucket = (latency // 1000).bit_length()
+        buckets[idx * NUM_BUCKETS + min(bucket, max_bucket)] += 1
+        total[idx] += latency
+        if latency < min_latency[idx]:
+            min_latency[idx] = latency
+        if latency > max_latency[idx]:
+            max_latency[idx] = latency
+
+
+def run_workload(workload, basedir, nprocs, **kwargs):
+    """Runs a workload.
+
+    The files are created in a new directory 'mdload.*' under basedir, so
+    that the cleanup only removes the files of this run.
+
+    @param workload the spec.Workload.
+    @param basedir the directory to run the workload in.
+    @param nprocs the number of worker processes.
+
+    Optional params
+    @param cpus the CPUs to pin the workers on, one CPU for each worker in
+    turn (default: the CPU affinity of this process).
+    @param pin if False, the workers are not pinned (default: True).
+    @param cleanup if True, removes the directory of this run after the run
+    (default: True).
+
+    @return a dict of the total 'ops', 'iops', append 'throughput' (MB/s),
+    'runtime', the 'dir' of this run, and the 'latency'
+    (mfsbase.LatencyHistogram) and 'misses' of each op.
+    """
+    cpus = sorted(kwargs.get('cpus', None) or os.sched_getaffinity(0))
+    pin = kwargs.get('pin', True)
+    cleanup = kwargs.get('cleanup', True)
+
+    rundir = tempfile.mkdtemp(prefix='mdload.', dir=basedir)
+    counters = SharedCounters(nprocs)
+    barrier = Barrier(nprocs + 1)
+    workers = []
+    for worker in range(nprocs):
+        cpu = cpus[worker % len(cpus)] if pin else None
+        proc = Process(target=run_worker,
+                       args=(worker, workload, rundir, cpu, barrier,
+                             counters))
+        proc.start()
+        workers.append(proc)
+    try:
+        # Waits for all workers to build their files.
+        barrier.wait()
+    except BrokenBarrierError:
+        pass
+    start = time.time()
+    for proc in workers:
+        proc.join()
+    runtime = time.time() - start
+    failed = [proc for proc in workers if proc.exitcode]
+    if cleanup:
+        shutil.rmtree(rundir, ignore_errors=True)
+    if failed:
+        raise RuntimeError('{} of {} workers failed'.format(
+            len(failed), nprocs))
+
+    latency = {}
+    misses = {}
+    for code, op in enumerate(OPS):
+        if workload.mix.get(op):
+            latency[op] = counters.histogram(code)
+            misses[op] = counters.num_misses(code)
+    ops = sum(hist.count for hist in latency.values())
+    appended = latency['append'].count if 'append' in latency else 0
+    return {'ops': ops, 'iops': ops / workload.runtime,
+            'throughput': appended * workload.iosize / workload.runtime /
+            (1024 * 1024),
+            'runtime': runtime, 'dir': rundir, 'latency': latency,
+            'misses': misses}
+
+
+def write_result(output, result):
+    """Writes the result next to the filebench results, i.e., the IOPS and
+    throughput to '{output}_results.txt', and the latencies of each op to
+    '{output}_latency.txt'.
+    """
+    with open(output + '_results.txt', 'w') as fobj:
+        fobj.write('{} {}\n'.format(result['iops'], result['throughput']))
+    with open(output + '_latency.txt', 'w') as fobj:
+        fobj.write('# op ops mean(ms) p50(ms) p95(ms) p99(ms) max(ms) '
+                   'misses\n')
+        for op in OPS:
+            if op not in result['latency']:
+                continue
+            hist = result['latency'][op]
+            fobj.write('{} {} {} {} {} {} {} {}\n'.format(
+                op, hist.count, hist.mean(), hist.percentile(50),
+                hist.percentile(95), hist.percentile(99), hist.max or 0,
+                result['misses'][op]))
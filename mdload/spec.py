@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""The specification of a metadata workload.
+
+A workload is a comma separated list of 'name=value'. The names in OPS set
+the weights of the operations in the mix, and the others set the params of
+the workload, e.g., 'create=1,stat=4,unlink=1,nfiles=100000,runtime=30'. The
+spec can also start with the name of a preset in WORKLOADS, followed by the
+values to override, e.g., 'mixed,ndirs=16'.
+"""
+
+import random
+
+# The operations, whose indices are the op codes used by the workers.
+OPS = ['create', 'open', 'stat', 'rename', 'unlink', 'readdir', 'append']
+
+# The params of a workload and their types.
+PARAMS = {
+    # The number of files of each worker.
+    'nfiles': int,
+    # The number of directories to spread the files over.
+    'ndirs': int,
+    # The time (in seconds) to run the workload.
+    'runtime': float,
+    # The size (in bytes) of each append.
+    'iosize': int,
+    # The fraction of the files created before the run.
+    'prefill': float,
+    # If not zero, all workers share the same directories.
+    'shared': int,
+    'seed': int,
+}
+
+WORKLOADS = {
+    'create': 'create=1,nfiles=1000000,prefill=0',
+    'stat': 'stat=1,prefill=1',
+    'createunlink': 'create=1,unlink=1',
+    'rename': 'rename=1,prefill=1',
+    'mixed': 'create=1,open=4,stat=8,rename=1,unlink=1,readdir=1',
+    'appendsync': 'append=1,prefill=1',
+}
+
+
+class Workload:
+    """A mix of metadata operations and the params to run it.
+    """
+    def __init__(self, name='custom', mix=None, **kwargs):
+        """Constructs a Workload.
+
+        @param name the name of the workload.
+        @param mix a dict of {op: weight}.
+        @param kwargs the params in PARAMS.
+        """
+        self.name = name
+        self.mix = dict(mix or {})
+        self.nfiles = kwargs.get('nfiles', 10000)
+        self.ndirs = kwargs.get('ndirs', 1)
+        self.runtime = kwargs.get('runtime', 30)
+        self.iosize = kwargs.get('iosize', 4096)
+        self.prefill = kwargs.get('prefill', 0.5)
+        self.shared = kwargs.get('shared', 0)
+        self.seed = kwargs.get('seed', 0)
+
+    def spec(self):
+        """Returns the full spec of this workload.
+        """
+        fields = ['{}={}'.format(op, self.mix[op]) for op in OPS
+                  if self.mix.get(op)]
+        fields += ['{}={}'.format(name, getattr(self, name))
+                   for name in sorted(PARAMS)]
+        return ','.join(fields)
+
+    def schedule(self, worker=0, length=1000):
+        """Returns the sequence of op codes a worker cycles through.
+
+        Each op shows up in proportion to its weight, in a shuffled order
+        that differs between workers but is the same across runs.
+
+        @param worker the index of the worker.
+        @param length the approximate length of the sequence.
+        @return a bytes of op codes (indices of OPS).
+        """
+        total = float(sum(self.mix.values()))
+        if not total:
+            raise ValueError('The workload {} has no operation'.format(
+                self.name))
+        codes = []
+        for code, op in enumerate(OPS):
+            weight = self.mix.get(op, 0)
+            if weight:
+                codes += [code] * max(1, int(round(weight / total * length)))
+        random.Random(self.seed * 1000003 + worker).shuffle(codes)
+        return bytes(codes)
+
+
+def parse_spec(text):
+    """Parses a workload spec.
+
+    @param text the spec, e.g., 'mixed,runtime=10'.
+    @return a Workload.
+    @exception ValueError if the spec is invalid.
+    """
+    fields = [field.strip() for field in text.split(',') if field.strip()]
+    name = 'custom'
+    if fields and '=' not in fields[0]:
+        name = fields.pop(0)
+        if name not in WORKLOADS:
+            raise ValueError('Unknown workload: {}'.format(name))
+        fields = WORKLOADS[name].split(',') + fields
+    mix = {}
+    params = {}
+    for field in fields:
+        key, sep, value = field.partition('=')
+        if not sep:
+            raise ValueError('Invalid field: {}'.format(field))
+        if key in OPS:
+            mix[key] = float(value)
+        elif key in PARAMS:
+            params[key] = PARAMS[key](value)
+        else:
+            raise ValueError('Unknown field: {}'.format(key))
+    return Workload(name, mix, **params)
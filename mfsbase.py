@@ -6,8 +6,15 @@
 """
 
 from __future__ import print_function
+from array import array
+import math
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pool
 from subprocess import call, check_output
 sys.path.append(os.path.join(os.path.dirname(__file__), 'pyro'))
 
@@ -32,6 +39,188 @@ def dump_configure(test_confs, outfile):
             fobj.write("{}: {}\n".format(k, v))
 
 
+class LatencyHistogram:
+    """A latency histogram with log2-scaled buckets.
+
+    The bucket i holds the latencies in [2^(i-1), 2^i) microseconds, so that
+    the histograms from different processes can be merged by simply adding
+    up the buckets.
+    """
+    NUM_BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, latency, count=1):
+        """Adds count samples of the latency (in ms).
+        """
+        if not count:
+            return
+        bucket = min(int(latency * 1000).bit_length(), self.NUM_BUCKETS - 1)
+        self.buckets[bucket] += count
+        self.count += count
+        self.total += latency * count
+        self.update_range(latency, latency)
+
+    def update_range(self, min_latency, max_latency):
+        """Updates the observed min and max latency (in ms).
+        """
+        if self.min is None or min_latency < self.min:
+            self.min = min_latency
+        if self.max is None or max_latency > self.max:
+            self.max = max_latency
+
+    def merge(self, other):
+        """Merges another LatencyHistogram into this one.
+        """
+        self.buckets = [x + y for x, y in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.update_range(other.min, other.max)
+
+    def mean(self):
+        """Returns the average latency in ms.
+        """
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """Returns the upper bound (in ms) of the bucket that holds the pct-th
+        percentile latency.
+        """
+        if not self.count:
+            return 0.0
+        threshold = self.count * pct / 100.0
+        accumulated = 0
+        for bucket, num in enumerate(self.buckets):
+            accumulated += num
+            if accumulated >= threshold:
+                return min((1 << bucket) / 1000.0, self.max)
+        return self.max
+
+
+class SteadyState:
+    """Detects the steady state of a time series, e.g., the IOPS of each
+    interval.
+
+    The series is in the steady state when the coefficient of variation
+    (stddev / mean) of the last 'window' values is not larger than 'cv'.
+    """
+    def __init__(self, window=5, cv=0.05, min_time=0, max_time=60):
+        """Constructs a SteadyState.
+
+        @param window the number of the latest values to check.
+        @param cv the max coefficient of variation in the steady state.
+        @param min_time the min time (in seconds) before the steady state.
+        @param max_time the max time (in seconds) to wait for the steady
+        state, 0 to wait forever.
+        """
+        self.window = window
+        self.max_cv = cv
+        self.min_time = min_time
+        self.max_time = max_time
+        self.values = []
+        self.elapsed = 0
+
+    def add(self, value, elapsed):
+        """Adds a value measured at elapsed seconds.
+        """
+        self.values.append(value)
+        self.elapsed = elapsed
+
+    def cv(self):
+        """Returns the coefficient of variation over the last window, or None
+        if there are not enough values.
+        """
+        if len(self.values) < max(self.window, 2):
+            return None
+        values = self.values[-self.window:]
+        mean = sum(values) / len(values)
+        if not mean:
+            return float('inf')
+        stddev = math.sqrt(sum((x - mean) ** 2 for x in values) /
+                           len(values))
+        return stddev / mean
+
+    def converged(self):
+        """Returns True if the series is in the steady state.
+        """
+        cv = self.cv()
+        return self.elapsed >= self.min_time and cv is not None and \
+            cv <= self.max_cv
+
+    def done(self):
+        """Returns True if the series is in the steady state or reaches the
+        max time.
+        """
+        return self.converged() or \
+            bool(self.max_time and self.elapsed >= self.max_time)
+
+
+# The two-sided critical values of Student's t-distribution for 1 to 30
+# degrees of freedom, and the normal distribution for more.
+T_QUANTILES = {
+    0.90: ([6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833,
+            1.812, 1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734,
+            1.729, 1.725, 1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703,
+            1.701, 1.699, 1.697], 1.645),
+    0.95: ([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+            2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+            2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+            2.048, 2.045, 2.042], 1.960),
+    0.99: ([63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250,
+            3.169, 3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878,
+            2.861, 2.845, 2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771,
+            2.763, 2.756, 2.750], 2.576),
+}
+
+
+def confidence_interval(values, level=0.95):
+    """Calculates the confidence interval of the mean of the values.
+
+    @param values a list of measurements, e.g., the IOPS of each iteration.
+    @param level the confidence level, one of T_QUANTILES.
+    @return (mean, half width) of the confidence interval. The half width is
+    None if there are less than two values.
+    """
+    if not values:
+        return None, None
+    mean = float(sum(values)) / len(values)
+    if len(values) < 2:
+        return mean, None
+    stddev = math.sqrt(sum((x - mean) ** 2 for x in values) /
+                       (len(values) - 1))
+    table, normal = T_QUANTILES[level]
+    dof = len(values) - 1
+    quantile = table[dof - 1] if dof <= len(table) else normal
+    return mean, quantile * stddev / math.sqrt(len(values))
+
+
+def parse_size(value):
+    """Parses a size in the filebench workloads, e.g., '16k'.
+
+    @return the size in bytes.
+    """
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_size(size):
+    """Formats a size in bytes, e.g., 65536 as '64k'.
+    """
+    for unit, scale in (('g', 1024 ** 3), ('m', 1024 ** 2), ('k', 1024)):
+        if size >= scale and size % scale == 0:
+            return '{}{}'.format(size // scale, unit)
+    return str(size)
+
+
 class Profiler:
     """The interface of Profiler.
     """
@@ -72,11 +261,86 @@ class NonProfiler(Profiler):
         pass
 
 
+def iter_lockstat(fobj):
+    """Iterates the lock classes in a lock_stat file, line by line.
+
+    @param fobj the file object of /proc/lock_stat or its copy.
+    @return a generator of (columns, name, values), where columns are the
+    names of the values from the lock_stat header.
+    """
+    columns = None
+    for line in fobj:
+        if columns is None:
+            if 'class name' in line:
+                columns = line.split()[2:]
+            continue
+        name, sep, tail = line.rpartition(':')
+        if not sep:
+            continue
+        values = tail.split()
+        if len(values) != len(columns):
+            continue
+        try:
+            values = [float(x) for x in values]
+        except ValueError:
+            continue
+        yield columns, name.strip(), values
+
+
+def parse_lockstat(filename):
+    """Parses a lock_stat file into a NumPy structured array.
+
+    The array has one row per lock class, with a 'name' column and one
+    float column for each lock_stat column, e.g., 'contentions' and
+    'waittime-total'.
+    """
+    import numpy as np
+    names = []
+    values = array('d')
+    columns = []
+    with open(filename) as fobj:
+        for columns, name, row in iter_lockstat(fobj):
+            names.append(name.encode('utf-8'))
+            values.extend(row)
+    name_len = max([len(x) for x in names] + [1])
+    dtype = [('name', 'S{}'.format(name_len))] + \
+        [(column, 'f8') for column in columns]
+    data = np.zeros(len(names), dtype=dtype)
+    data['name'] = names
+    matrix = np.frombuffer(values, dtype='f8').reshape(len(names),
+                                                       len(columns))
+    for idx, column in enumerate(columns):
+        data[column] = matrix[:, idx]
+    return data
+
+
+def lockstat_cache(filename):
+    """Returns the path of the parsed lock_stat array of a lock_stat file.
+    """
+    return os.path.splitext(filename)[0] + '.npy'
+
+
+def load_lockstat(filename):
+    """Loads the lock_stat data as a NumPy structured array.
+
+    The parsed array is cached next to the lock_stat file, so that it is
+    memory-mapped instead of parsing the text again next time.
+    """
+    import numpy as np
+    cache = lockstat_cache(filename)
+    if os.path.exists(cache) and \
+            os.path.getmtime(cache) >= os.path.getmtime(filename):
+        return np.load(cache, mmap_mode='r')
+    data = parse_lockstat(filename)
+    np.save(cache, data)
+    return data
+
+
 class LockstatProfiler(Profiler):
     """The Profiler to get /proc/lock_stat data
     """
     def __init__(self):
-        self.report_ = ""
+        self.lockstat_file = None
 
     def clear_lockstat(self):
         """Clear the statistics data of kernel lock
@@ -91,12 +355,38 @@ class LockstatProfiler(Profiler):
 
     def stop(self):
         """Stops to monitor lock stats and gather the results.
+
+        The lock_stat data is copied to a temporary file, instead of being
+        held in memory.
         """
+        self.lockstat_file = tempfile.TemporaryFile('w+')
         with open('/proc/lock_stat', 'r') as fobj:
-            self.report_ = fobj.read()
+            shutil.copyfileobj(fobj, self.lockstat_file)
 
     def report(self):
-        return self.report_
+        if not self.lockstat_file:
+            return ''
+        self.lockstat_file.seek(0)
+        return self.lockstat_file.read()
+
+    def dump(self, outfile):
+        """Dumps the lock_stat data to the outfile, and caches the parsed
+        array next to it if NumPy is available.
+        """
+        if not self.lockstat_file:
+            return
+        self.lockstat_file.seek(0)
+        if type(outfile) != str:
+            shutil.copyfileobj(self.lockstat_file, outfile)
+            return
+        with open(outfile, 'w') as fobj:
+            shutil.copyfileobj(self.lockstat_file, fobj)
+        self.lockstat_file.close()
+        self.lockstat_file = None
+        try:
+            load_lockstat(outfile)
+        except ImportError:
+            pass
 
 
 class ProcStatProfiler(Profiler):
@@ -121,6 +411,434 @@ class ProcStatProfiler(Profiler):
         return 'cpu ' + ' '.join(return_fields) + '\n'
 
 
+class PeriodicSampler(Profiler):
+    """The base of the Profilers that sample in a background thread.
+
+    The samples are stored in a ring buffer allocated in advance, so that
+    the memory of the samples does not grow with the runtime. Reading one
+    sample still creates short-lived objects, e.g., the parsed lines of
+    /proc/stat. The subclasses implement open(), read() and close() to take
+    the samples.
+    """
+    TYPECODE = 'd'
+
+    def __init__(self, interval=1.0, capacity=3600):
+        """Constructs a PeriodicSampler.
+
+        @param interval the sampling interval in seconds.
+        @param capacity the max number of samples to keep. The oldest
+        samples are overwritten when the buffer is full.
+        """
+        self.interval = interval
+        self.capacity = capacity
+        self.width = 0
+        self.times = None
+        self.buffer = None
+        self.num_samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def open(self):
+        """Opens the sources to sample.
+
+        @return the number of values in one sample, 0 for none.
+        """
+        return 0
+
+    def read(self, buffer, offset):
+        """Reads one sample into buffer[offset:offset + width].
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def sample(self):
+        """Takes one sample into the ring buffer.
+        """
+        slot = self.num_samples % self.capacity
+        self.times[slot] = time.time()
+        self.read(self.buffer, slot * self.width)
+        self.num_samples += 1
+
+    def run(self):
+        """The loop of the sampling thread.
+        """
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        """Starts the sampling thread.
+        """
+        self.width = self.open()
+        self.times = array('d', [0.0]) * self.capacity
+        self.buffer = array(self.TYPECODE, [0]) * (self.capacity * self.width)
+        self.num_samples = 0
+        self.stop_event.clear()
+        self.sample()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stops the sampling thread and takes the last sample.
+        """
+        self.stop_event.set()
+        self.thread.join()
+        self.sample()
+        self.close()
+
+    def samples(self):
+        """Returns the samples in time order.
+
+        @return a list of (time, values).
+        """
+        first = max(0, self.num_samples - self.capacity)
+        samples = []
+        for num in range(first, self.num_samples):
+            slot = num % self.capacity
+            base = slot * self.width
+            samples.append((self.times[slot],
+                            self.buffer[base:base + self.width]))
+        return samples
+
+
+class ProcStatSampler(PeriodicSampler):
+    """Samples the per-CPU lines of /proc/stat periodically in a background
+    thread.
+    """
+    TYPECODE = 'q'
+    # The columns of the cpuN lines in /proc/stat.
+    FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+              'steal']
+
+    def __init__(self, interval=1.0, capacity=3600):
+        super(ProcStatSampler, self).__init__(interval, capacity)
+        self.cpus = []
+        self.fobj = None
+
+    def read_stat(self):
+        """Reads the per-CPU counters from /proc/stat.
+
+        @return a dict of {cpu: [counters]}.
+        """
+        self.fobj.seek(0)
+        counters = {}
+        for line in self.fobj.read().split('\n'):
+            if not line.startswith('cpu') or line.startswith('cpu '):
+                continue
+            fields = line.split()
+            counters[int(fields[0][3:])] = \
+                [int(x) for x in fields[1:len(self.FIELDS) + 1]]
+        return counters
+
+    def open(self):
+        self.fobj = open('/proc/stat', 'r')
+        self.cpus = sorted(self.read_stat().keys())
+        return len(self.cpus) * len(self.FIELDS)
+
+    def read(self, buffer, offset):
+        counters = self.read_stat()
+        nfields = len(self.FIELDS)
+        for idx, cpu in enumerate(self.cpus):
+            values = counters.get(cpu, [])
+            base = offset + idx * nfields
+            for field in range(nfields):
+                buffer[base + field] = \
+                    values[field] if field < len(values) else 0
+
+    def close(self):
+        self.fobj.close()
+
+    def timeline(self):
+        """Returns the per-CPU utilization on each interval.
+
+        @return a list of (time, cpu, {field: percentage}).
+        """
+        nfields = len(self.FIELDS)
+        samples = self.samples()
+        rows = []
+        for (_, before), (now, after) in zip(samples, samples[1:]):
+            elapsed = now - samples[0][0]
+            for idx, cpu in enumerate(self.cpus):
+                deltas = [after[idx * nfields + field] -
+                          before[idx * nfields + field]
+                          for field in range(nfields)]
+                total = float(sum(deltas)) or 1.0
+                rows.append((elapsed, cpu, {
+                    field: 100.0 * delta / total
+                    for field, delta in zip(self.FIELDS, deltas)}))
+        return rows
+
+    def imbalance(self):
+        """Calculates the imbalance of CPU busy time among cores.
+
+        @return a dict of the mean, stddev, min and max of the busy
+        percentage of each core over the whole run, and the average stddev
+        of the busy percentage across cores on each interval.
+        """
+        busy_by_cpu = {}
+        busy_by_time = {}
+        for elapsed, cpu, usage in self.timeline():
+            busy = 100.0 - usage['idle'] - usage['iowait']
+            busy_by_cpu.setdefault(cpu, []).append(busy)
+            busy_by_time.setdefault(elapsed, []).append(busy)
+
+        def _stddev(values):
+            mean = sum(values) / len(values)
+            return math.sqrt(sum((x - mean) ** 2 for x in values) /
+                             len(values))
+
+        if not busy_by_cpu:
+            return {}
+        per_cpu = [sum(x) / len(x) for x in busy_by_cpu.values()]
+        return {'mean': sum(per_cpu) / len(per_cpu),
+                'stddev': _stddev(per_cpu),
+                'min': min(per_cpu),
+                'max': max(per_cpu),
+                'interval_stddev': sum(_stddev(x) for x in
+                                       busy_by_time.values()) /
+                len(busy_by_time)}
+
+    def report(self):
+        """Reports the per-CPU user/sys/iowait/softirq timeline and the
+        imbalance among cores.
+        """
+        lines = ['# time cpu user system iowait softirq idle']
+        for elapsed, cpu, usage in self.timeline():
+            lines.append('{:.2f} {} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f}'.format(
+                elapsed, cpu, usage['user'] + usage['nice'], usage['system'],
+                usage['iowait'], usage['softirq'], usage['idle']))
+        imbalance = self.imbalance()
+        if imbalance:
+            lines.append('# imbalance: mean stddev min max interval_stddev')
+            lines.append('imbalance {mean:.2f} {stddev:.2f} {min:.2f} '
+                         '{max:.2f} {interval_stddev:.2f}'.format(**imbalance))
+        return '\n'.join(lines)
+
+
+class SampleSource:
+    """The interface of a data source of SystemSampler.
+
+    A source reads one procfs file and returns a fixed list of columns on
+    every sample.
+    """
+    PATH = ''
+
+    def __init__(self):
+        self.fobj = None
+        self.columns = []
+
+    def content(self):
+        """Returns the current content of the source file.
+        """
+        self.fobj.seek(0)
+        return self.fobj.read()
+
+    def parse(self, content):
+        """Parses the content into a dict of {column: value}.
+        """
+        return {}
+
+    def open(self):
+        """Opens the source file and decides the columns.
+
+        @return the list of column names.
+        """
+        self.fobj = open(self.PATH, 'r')
+        self.columns = sorted(self.parse(self.content()).keys())
+        return self.columns
+
+    def read(self, buffer, offset):
+        """Reads the values of all columns into buffer[offset:].
+        """
+        values = self.parse(self.content())
+        for idx, column in enumerate(self.columns):
+            buffer[offset + idx] = values.get(column, 0)
+
+    def close(self):
+        self.fobj.close()
+
+
+class MemInfoSource(SampleSource):
+    """Samples the memory usage (in kB) from /proc/meminfo.
+    """
+    PATH = '/proc/meminfo'
+    FIELDS = ['MemFree', 'Cached', 'Dirty', 'Slab', 'SReclaimable',
+              'SUnreclaim']
+
+    def parse(self, content):
+        values = {}
+        for line in content.split('\n'):
+            fields = line.split()
+            if len(fields) >= 2 and fields[0].rstrip(':') in self.FIELDS:
+                values['meminfo.' + fields[0].rstrip(':')] = int(fields[1])
+        return values
+
+
+class SlabInfoSource(SampleSource):
+    """Samples the active and total objects of the dentry and inode caches
+    from /proc/slabinfo.
+    """
+    PATH = '/proc/slabinfo'
+    CACHES = ['dentry', 'inode_cache', 'ext4_inode_cache', 'xfs_inode',
+              'btrfs_inode', 'filp']
+
+    def parse(self, content):
+        values = {}
+        for line in content.split('\n'):
+            fields = line.split()
+            if len(fields) >= 3 and fields[0] in self.CACHES:
+                values['slab.{}.active_objs'.format(fields[0])] = \
+                    int(fields[1])
+                values['slab.{}.num_objs'.format(fields[0])] = int(fields[2])
+        return values
+
+
+def read_slab_usage(caches=SlabInfoSource.CACHES):
+    """Reads the memory used by the slab caches from /proc/slabinfo.
+
+    @param caches the names of the caches.
+    @return a dict of {cache: (number of objects, bytes)}.
+    """
+    usage = {}
+    with open(SlabInfoSource.PATH) as fobj:
+        for line in fobj:
+            fields = line.split()
+            if len(fields) >= 4 and fields[0] in caches:
+                usage[fields[0]] = (int(fields[2]),
+                                    int(fields[2]) * int(fields[3]))
+    return usage
+
+
+class DiskStatsSource(SampleSource):
+    """Samples the I/O statistics of the RAM disks from /proc/diskstats.
+    """
+    PATH = '/proc/diskstats'
+    DEVICE_PREFIX = 'ram'
+    # (column, index in the line of /proc/diskstats)
+    FIELDS = [('reads', 3), ('sectors_read', 5), ('writes', 7),
+              ('sectors_written', 9), ('io_ticks', 12)]
+
+    def parse(self, content):
+        values = {}
+        for line in content.split('\n'):
+            fields = line.split()
+            if len(fields) < 14 or \
+                    not fields[2].startswith(self.DEVICE_PREFIX):
+                continue
+            for name, idx in self.FIELDS:
+                values['disk.{}.{}'.format(fields[2], name)] = \
+                    int(fields[idx])
+        return values
+
+
+class SchedStatSource(SampleSource):
+    """Samples the time spent on running and waiting on the run-queue (in
+    ns), summed over all CPUs, from /proc/schedstat.
+    """
+    PATH = '/proc/schedstat'
+
+    def parse(self, content):
+        run_time = 0
+        wait_time = 0
+        timeslices = 0
+        for line in content.split('\n'):
+            fields = line.split()
+            if len(fields) < 10 or not fields[0].startswith('cpu'):
+                continue
+            run_time += int(fields[7])
+            wait_time += int(fields[8])
+            timeslices += int(fields[9])
+        return {'sched.run_time': run_time, 'sched.wait_time': wait_time,
+                'sched.timeslices': timeslices}
+
+
+class SoftirqsSource(SampleSource):
+    """Samples the number of each softirq, summed over all CPUs, from
+    /proc/softirqs.
+    """
+    PATH = '/proc/softirqs'
+
+    def parse(self, content):
+        values = {}
+        for line in content.split('\n')[1:]:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            values['softirq.' + fields[0].rstrip(':')] = \
+                sum(int(x) for x in fields[1:])
+        return values
+
+
+class SystemSampler(PeriodicSampler):
+    """Samples several procfs sources in one background thread.
+
+    The report is a table with one column per source value, and one row per
+    sample.
+    """
+    SOURCES = {
+        'meminfo': MemInfoSource,
+        'slabinfo': SlabInfoSource,
+        'diskstats': DiskStatsSource,
+        'schedstat': SchedStatSource,
+        'softirqs': SoftirqsSource,
+    }
+
+    def __init__(self, sources=None, interval=1.0, capacity=3600):
+        """Constructs a SystemSampler.
+
+        @param sources a list of source names in SOURCES, or SampleSource
+        instances. Default: all sources in SOURCES.
+        """
+        super(SystemSampler, self).__init__(interval, capacity)
+        if sources is None:
+            sources = sorted(self.SOURCES.keys())
+        self.sources = [self.SOURCES[x]() if type(x) == str else x
+                        for x in sources]
+        self.columns = []
+        self.offsets = []
+
+    def open(self):
+        """Opens all available sources, the unreadable ones are skipped.
+        """
+        opened = []
+        self.columns = []
+        self.offsets = []
+        for source in self.sources:
+            try:
+                columns = source.open()
+            except (IOError, OSError) as err:
+                print('SystemSampler: skip {}: {}'.format(source.PATH, err))
+                continue
+            opened.append(source)
+            self.offsets.append(len(self.columns))
+            self.columns += columns
+        self.sources = opened
+        return len(self.columns)
+
+    def read(self, buffer, offset):
+        for source, source_offset in zip(self.sources, self.offsets):
+            source.read(buffer, offset + source_offset)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+    def report(self):
+        """Reports the samples as a table of the time and all columns.
+        """
+        samples = self.samples()
+        lines = ['time ' + ' '.join(self.columns)]
+        if not samples:
+            return lines[0]
+        start = samples[0][0]
+        for now, values in samples:
+            lines.append('{:.2f} '.format(now - start) +
+                         ' '.join('%d' % x for x in values))
+        return '\n'.join(lines)
+
+
 class PerfProfiler(Profiler):
     """Use linux's perf utility to measure the PMU.
     """
@@ -136,11 +854,17 @@ class PerfProfiler(Profiler):
         @param events the events to be recorded.
         @param vmlinux the kernel image to find symbols.
         @param kallsyms the kallsyms file.
+        @param data the perf.data file to record into.
+        @param queue a PostProcessQueue. If set, 'perf report' is deferred to
+        this queue instead of running in stop().
         """
         self.perf = perf
         self.check_avail(perf)
         self.vmlinux = kwargs.get('vmlinux', '')
         self.kallsyms = kwargs.get('kallsyms', '')
+        self.data = kwargs.get('data', 'perf.data')
+        self.queue = kwargs.get('queue', None)
+        self.report_ = ''
         if kwargs.get('events', ''):
             self.EVENTS = '-e ' + kwargs.get('events')
 
@@ -154,20 +878,205 @@ class PerfProfiler(Profiler):
         """Start recording perf events.
         """
         print("Perf record events: {}".format(self.EVENTS))
-        return call('{} record {} -a {}'.format(self.perf, self.EVENTS, cmd),
-                    shell=True)
+        return call('{} record {} -a -o {} {}'.format(
+            self.perf, self.EVENTS, self.data, cmd), shell=True)
 
-    def stop(self):
+    def report_command(self):
+        """Returns the command to generate the report from perf.data.
         """
-        """
-        options = ''
+        options = ' -i {}'.format(self.data)
         if self.vmlinux:
             options += ' -k {}'.format(self.vmlinux)
         if self.kallsyms:
             options += ' --kallsyms={}'.format(self.kallsyms)
-        self.report_ = check_output(
-            '{} report {} --stdio'.format(self.perf, options),
-            shell=True).decode('utf-8')
+        return '{} report {} --stdio'.format(self.perf, options)
+
+    def stop(self):
+        """Stops recording and generates the report, unless the report is
+        deferred to the queue.
+        """
+        if self.queue:
+            return
+        self.report_ = check_output(self.report_command(),
+                                    shell=True).decode('utf-8')
 
     def report(self):
         return self.report_
+
+    def dump(self, outfile):
+        """Dumps the report to the outfile.
+
+        If the report is deferred, it puts a job into the queue to generate
+        the report into outfile and then remove the perf.data.
+        """
+        if self.queue and type(outfile) == str:
+            self.queue.put('{} > {} && rm -f {}'.format(
+                self.report_command(), outfile, self.data))
+            return
+        super(PerfProfiler, self).dump(outfile)
+
+
+class PerfStatProfiler(Profiler):
+    """Use 'perf stat' to count PMU events on each CPU.
+
+    Unlike PerfProfiler, it only counts the events instead of sampling them,
+    which has much lower overhead and outputs a small report.
+    """
+    EVENTS = 'cycles,instructions,cache-references,cache-misses,' \
+             'LLC-load-misses'
+
+    def __init__(self, perf='perf', **kwargs):
+        """Constructs a PerfStatProfiler
+
+        @param perf the exective of 'perf'
+
+        Optional parameters:
+        @param stat_events the events to be counted.
+        """
+        self.perf = perf
+        PerfProfiler.check_avail(perf)
+        self.events = kwargs.get('stat_events', '') or self.EVENTS
+        self.ops = 0
+        self.counters = {}
+        self.stat_file = None
+
+    def start(self, cmd):
+        """Runs the command and counts the events on each CPU.
+        """
+        self.stat_file = tempfile.NamedTemporaryFile('w+', suffix='.csv')
+        print("Perf stat events: {}".format(self.events))
+        return call('{} stat -a -A -x, -e {} -o {} {}'.format(
+            self.perf, self.events, self.stat_file.name, cmd), shell=True)
+
+    def stop(self):
+        """Parses the counters of 'perf stat'.
+        """
+        self.stat_file.seek(0)
+        self.counters = self.parse_stat(self.stat_file, self.events)
+        self.stat_file.close()
+
+    @staticmethod
+    def parse_stat(fobj, events):
+        """Parses the CSV output of 'perf stat -A -x,'.
+
+        @return a dict of {event: {cpu: value}}.
+        """
+        events = events.split(',')
+        counters = {}
+        for line in fobj:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.strip().split(',')
+            if len(fields) < 3 or not fields[0].startswith('CPU'):
+                continue
+            try:
+                value = float(fields[1])
+            except ValueError:
+                # <not counted> or <not supported>
+                continue
+            # Newer perf prints 'CPU,value,unit,event', older ones print
+            # 'CPU,value,event'.
+            event = fields[3] if len(fields) > 3 and not fields[2] else \
+                fields[2]
+            for name in fields[2:4]:
+                if name in events:
+                    event = name
+            counters.setdefault(event, {})[int(fields[0][3:])] = value
+        return counters
+
+    def set_ops(self, ops):
+        """Sets the number of operations to normalize the counters.
+        """
+        self.ops = ops
+
+    def total(self, event):
+        """Returns the sum of one event on all CPUs.
+        """
+        return sum(self.counters.get(event, {}).values())
+
+    def metrics(self):
+        """Returns the derived metrics, e.g., IPC and cache-miss rate.
+        """
+        def _ratio(x, y):
+            return x / y if y else 0.0
+
+        return {
+            'ipc': _ratio(self.total('instructions'), self.total('cycles')),
+            'cache_miss_rate': _ratio(self.total('cache-misses'),
+                                      self.total('cache-references')),
+            'cycles_per_op': _ratio(self.total('cycles'), self.ops),
+            'llc_misses_per_op': _ratio(self.total('LLC-load-misses'),
+                                        self.ops),
+        }
+
+    def report(self):
+        """Reports the total and per-CPU counters and the derived metrics.
+        """
+        cpus = sorted(set(cpu for values in self.counters.values()
+                          for cpu in values))
+        lines = ['# event total ' + ' '.join('cpu%d' % x for x in cpus)]
+        for event in sorted(self.counters):
+            values = self.counters[event]
+            lines.append('{} {} {}'.format(
+                event, self.total(event),
+                ' '.join(str(values.get(cpu, 0)) for cpu in cpus)))
+        lines.append('ops {}'.format(self.ops))
+        metrics = self.metrics()
+        for name in sorted(metrics):
+            lines.append('{} {}'.format(name, metrics[name]))
+        return '\n'.join(lines)
+
+
+def _run_shell(cmd):
+    """Runs a shell command in the worker of PostProcessQueue.
+    """
+    return cmd, call(cmd, shell=True)
+
+
+class PostProcessQueue:
+    """A queue of shell commands to post-process the results, e.g., the
+    'perf report' of each test.
+
+    The queue is persisted in a file, so that the commands can be run in
+    parallel after all measurements finished, or later if the test was
+    interrupted.
+    """
+    def __init__(self, path):
+        """@param path the file to store the queued commands.
+        """
+        self.path = path
+
+    def put(self, cmd):
+        """Puts a shell command into the queue.
+        """
+        with open(self.path, 'a') as fobj:
+            fobj.write(cmd + '\n')
+
+    def pending(self):
+        """Returns all pending commands.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as fobj:
+            return [line.rstrip('\n') for line in fobj if line.strip()]
+
+    def run(self, processes=None):
+        """Runs all pending commands in a process pool.
+
+        @param processes the number of worker processes (default: the number
+        of CPUs).
+        @return the number of failed commands, which are kept in the queue.
+        """
+        cmds = self.pending()
+        if not cmds:
+            return 0
+        print('Post-processing {} jobs...'.format(len(cmds)))
+        pool = Pool(processes)
+        failed = [cmd for cmd, ret in pool.imap_unordered(_run_shell, cmds)
+                  if ret]
+        pool.close()
+        pool.join()
+        with open(self.path, 'w') as fobj:
+            for cmd in failed:
+                fobj.write(cmd + '\n')
+        return len(failed)
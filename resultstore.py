@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Stores the results of one test campaign in a single SQLite database, and
+caches the results of cells across campaigns.
+"""
+
+from __future__ import print_function
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+RESULT_DB = 'results.db'
+# The index of the result cache.
+CACHE_DB = 'cache.db'
+
+
+class ResultStore:
+    """An indexed store of benchmark results.
+
+    Each row is one measured cell, with typed columns of the test
+    configurations and the measured metrics.
+    """
+    CONFIG_COLUMNS = [
+        ('test', 'TEXT'),
+        ('fs', 'TEXT'),
+        ('workload', 'TEXT'),
+        ('ndisks', 'INTEGER'),
+        ('ndirs', 'INTEGER'),
+        ('nprocs', 'INTEGER'),
+        ('nthreads', 'INTEGER'),
+        ('cpus', 'TEXT'),
+        ('ncpus', 'INTEGER'),
+        # How the CPUs are restricted: hotplug, cgroup or affinity.
+        ('cpu_backend', 'TEXT'),
+        # The NUMA nodes the memory is bound to.
+        ('mems', 'TEXT'),
+        # The placement policy of the filebench instances.
+        ('placement', 'TEXT'),
+        # How the processes share the directories (see contention_layout()).
+        ('contention', 'TEXT'),
+        # How nprocs * nthreads is split (see concurrency_shape()).
+        ('concurrency', 'TEXT'),
+        ('nfiles', 'INTEGER'),
+        ('dirwidth', 'INTEGER'),
+        # The I/O size and the mean file size (in bytes) of the workload.
+        ('iosize', 'INTEGER'),
+        ('filesize', 'INTEGER'),
+        ('iteration', 'INTEGER'),
+        # The output prefix of the cell without the iteration.
+        ('cell', 'TEXT'),
+    ]
+    METRIC_COLUMNS = [
+        ('iops', 'REAL'),
+        ('throughput', 'REAL'),
+        ('iops_stddev', 'REAL'),
+        ('throughput_stddev', 'REAL'),
+        ('fairness', 'REAL'),
+        ('missing', 'INTEGER'),
+        ('ipc', 'REAL'),
+        ('cache_miss_rate', 'REAL'),
+        ('cycles_per_op', 'REAL'),
+        ('llc_misses_per_op', 'REAL'),
+        ('runtime', 'REAL'),
+        ('converged', 'INTEGER'),
+        ('iops_ci', 'REAL'),
+        ('throughput_ci', 'REAL'),
+        # The share of the kernel time outside the CPU set.
+        ('outside_kernel', 'REAL'),
+        # The memory (in bytes) of the dentry and inode caches after the run.
+        ('dentry_slab', 'INTEGER'),
+        ('inode_slab', 'INTEGER'),
+        ('output', 'TEXT'),
+    ]
+
+    def __init__(self, path):
+        """Opens (or creates) a result store.
+
+        @param path the path of the database file.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.create_table()
+
+    def columns(self):
+        """Returns all (name, type) columns.
+        """
+        return self.CONFIG_COLUMNS + self.METRIC_COLUMNS
+
+    def create_table(self):
+        """Creates the result table, or adds the missing columns to the table
+        created by an older version.
+        """
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results ({})'.format(
+            ', '.join('{} {}'.format(name, sqltype)
+                      for name, sqltype in self.columns())))
+        existing = set(row[1] for row in
+                       self.conn.execute('PRAGMA table_info(results)'))
+        for name, sqltype in self.columns():
+            if name not in existing:
+                self.conn.execute('ALTER TABLE results ADD COLUMN {} {}'
+                                  .format(name, sqltype))
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_cell ON '
+                          'results (test, fs, workload)')
+        self.conn.commit()
+
+    def add(self, record):
+        """Adds the result of one cell. It replaces the previous result of
+        the same cell, e.g., from a retry.
+
+        @param record a dict of {column: value}.
+        """
+        names = [name for name, _ in self.columns()]
+        unknown = set(record) - set(names)
+        if unknown:
+            raise ValueError('Unknown result columns: {}'.format(
+                ', '.join(sorted(unknown))))
+        config = [name for name, _ in self.CONFIG_COLUMNS]
+        self.conn.execute(
+            'DELETE FROM results WHERE {}'.format(
+                ' AND '.join('{} IS ?'.format(name) for name in config)),
+            [record.get(name) for name in config])
+        keys = sorted(record)
+        self.conn.execute(
+            'INSERT INTO results ({}) VALUES ({})'.format(
+                ', '.join(keys), ', '.join('?' * len(keys))),
+            [record[key] for key in keys])
+        self.conn.commit()
+
+    def update(self, values, **where):
+        """Updates the results.
+
+        @param values a dict of {column: new value}.
+        @param where the column values to match.
+        """
+        keys = sorted(values)
+        sql = 'UPDATE results SET {}'.format(
+            ', '.join('{} = ?'.format(key) for key in keys))
+        params = [values[key] for key in keys]
+        if where:
+            sql += ' WHERE ' + ' AND '.join(
+                '{} IS ?'.format(name) for name in sorted(where))
+            params += [where[name] for name in sorted(where)]
+        self.conn.execute(sql, params)
+        self.conn.commit()
+
+    def select(self, columns, **where):
+        """Queries the results.
+
+        @param columns a list of column names to return.
+        @param where the column values to match.
+        @return a list of tuples in the order of columns.
+        """
+        sql = 'SELECT {} FROM results'.format(', '.join(columns))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(
+                '{} IS ?'.format(name) for name in sorted(where))
+        return self.conn.execute(
+            sql, [where[name] for name in sorted(where)]).fetchall()
+
+    def record(self, **where):
+        """Returns the first matched result as a dict of {column: value}, or
+        None if there is no matched result.
+        """
+        names = [name for name, _ in self.columns()]
+        rows = self.select(names, **where)
+        if not rows:
+            return None
+        return {name: value for name, value in zip(names, rows[0])
+                if value is not None}
+
+    def close(self):
+        self.conn.close()
+
+
+class ResultCache:
+    """A content-addressed cache of the results of cells, which is shared by
+    campaigns.
+
+    A cell is identified by the hash of its full configuration, including
+    the system fingerprint (e.g., the kernel release), so that a result is
+    only reused on the same system. The output files of a cell are kept in
+    a sub-directory named by the hash.
+    """
+    # The output files that are too large to keep, e.g., 'perf record' data.
+    IGNORED_SUFFIXES = ['.data']
+
+    def __init__(self, path):
+        """Opens (or creates) a result cache.
+
+        @param path the directory of the cache.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.conn = sqlite3.connect(os.path.join(path, CACHE_DB))
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cells (key TEXT '
+                          'PRIMARY KEY, config TEXT, record TEXT, '
+                          'created REAL)')
+        self.conn.commit()
+
+    @staticmethod
+    def key(config):
+        """Returns the key of a cell.
+
+        @param config a dict of the full configuration of the cell.
+        """
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode(
+            'utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the result record of a cell, or None if it is not cached.
+        """
+        row = self.conn.execute('SELECT record FROM cells WHERE key = ?',
+                                [key]).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, config, output, record):
+        """Adds the result of a cell into the cache.
+
+        @param output the output prefix of the cell.
+        @param record the result record of the cell (see ResultStore).
+        """
+        celldir = os.path.join(self.path, key)
+        if os.path.exists(celldir):
+            shutil.rmtree(celldir)
+        os.makedirs(celldir)
+        for filename in glob.glob(output + '_*'):
+            if any(filename.endswith(x) for x in self.IGNORED_SUFFIXES):
+                continue
+            shutil.copy(filename, os.path.join(
+                celldir, filename[len(output):]))
+        self.conn.execute('INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?)',
+                          [key, json.dumps(config, sort_keys=True),
+                           json.dumps(record), time.time()])
+        self.conn.commit()
+
+    def restore(self, key, output):
+        """Copies the output files of a cached cell to a new output prefix.
+
+        @return the result record of the cell, or None if it is not cached.
+        """
+        record = self.get(key)
+        if record is None:
+            return None
+        celldir = os.path.join(self.path, key)
+        for filename in os.listdir(celldir):
+            shutil.copy(os.path.join(celldir, filename), output + filename)
+        return record
+
+    def close(self):
+        self.conn.close()
@@ -6,13 +6,16 @@
 """
 
 from __future__ import print_function
+from multiprocessing.pool import ThreadPool
 import optparse
 import os
 import sys
+import time
 sys.path.append(os.path.join(os.path.dirname(__file__), 'pyro'))
 from pyro import osutil
 
 POSSIBLE_CPUS = osutil.get_all_cpus()
+ONLINE_MASK = '/sys/devices/system/cpu/online'
 
 
 def find_max_continous_sequence(array, start):
@@ -65,14 +68,61 @@ def set_cpu(core, online, **kwargs):
     if 'dry' in kwargs and kwargs['dry']:
         print("DRY-RUN: write %d to %s" % (online, online_path))
         return
-    os.system('echo %d > %s' % (online, online_path))
+    with open(online_path, 'w') as fobj:
+        fobj.write('%d' % online)
 
 
-def reset():
+def read_online_cpus():
+    """Returns the set of online CPUs from the online mask in sysfs.
+    """
+    with open(ONLINE_MASK) as fobj:
+        return osutil.parse_cpus(fobj.read().strip())
+
+
+def procs_running():
+    """Returns the number of runnable tasks in /proc/stat.
+    """
+    with open('/proc/stat') as fobj:
+        for line in fobj:
+            if line.startswith('procs_running'):
+                return int(line.split()[1])
+    return 0
+
+
+def wait_settle(baseline, timeout=5, interval=0.1, rounds=3):
+    """Waits until the system settles after hotplugging CPUs, i.e., the
+    online mask does not change and there are no more runnable tasks than
+    before the hotplug (e.g., the migrated tasks and kworkers are done) for
+    rounds consecutive checks.
+
+    @param baseline the number of runnable tasks before the hotplug, see
+    procs_running().
+    @param timeout the max time (in seconds) to wait.
+    @return the time (in seconds) waited.
+    """
+    start = time.time()
+    mask = read_online_cpus()
+    stable = 0
+    while stable < rounds:
+        if time.time() - start >= timeout:
+            print('The system did not settle in {} seconds after '
+                  'hotplugging CPUs ({} runnable tasks, {} before)'.format(
+                      timeout, procs_running(), baseline))
+            break
+        time.sleep(interval)
+        current = read_online_cpus()
+        if current == mask and procs_running() <= baseline:
+            stable += 1
+        else:
+            stable = 0
+        mask = current
+    return time.time() - start
+
+
+def reset(**kwargs):
     """Reset all POSSIBLE_CPUS cpu online
     """
-    for cpu_id in POSSIBLE_CPUS:
-        set_cpu(cpu_id, True)
+    set_cpus(shorten_cores(POSSIBLE_CPUS), **kwargs)
 
 
 def list_cpus():
@@ -85,16 +135,50 @@ def list_cpus():
 
 
 def set_cpus(core_str, **kwargs):
-    """Sets the CPU cores online.
+    """Sets the CPU cores online, and the other cores offline.
+
+    Only the cores whose states change are written. The cores are brought
+    online before the others are taken offline.
 
     @param core_str a comma separated string, e.g., '3,4-5,12-17'.
+
+    Optional params
+    @param dry if True, only prints the changes.
+    @param jobs the max number of cores to change at the same time, 0 to
+    change all cores at once (default: 0).
+    @param settle if True, waits until the system settles after the changes
+    (default: True).
+    @return the time (in seconds) spent on hotplugging and settling.
+    @exception IOError if the online cores do not match core_str afterwards.
     """
-    online_cores = osutil.parse_cpus(core_str)
-    offline_cores = POSSIBLE_CPUS - online_cores
-    for online in online_cores:
-        set_cpu(online, True, **kwargs)
-    for offline in offline_cores:
-        set_cpu(offline, False, **kwargs)
+    start = time.time()
+    dry = kwargs.get('dry', False)
+    jobs = kwargs.get('jobs', 0)
+    online_cores = set(osutil.parse_cpus(core_str))
+    current = read_online_cpus()
+    to_online = sorted(online_cores - current)
+    to_offline = sorted((POSSIBLE_CPUS - online_cores) & current)
+    if 0 in to_offline:
+        raise ValueError("Can not set cpu0 offline")
+    baseline = procs_running()
+
+    for cores, online in [(to_online, True), (to_offline, False)]:
+        if not cores:
+            continue
+        pool = ThreadPool(min(jobs or len(cores), len(cores)))
+        pool.map(lambda core: set_cpu(core, online, dry=dry), cores)
+        pool.close()
+        pool.join()
+    if dry or not (to_online or to_offline):
+        return time.time() - start
+
+    current = read_online_cpus()
+    if current != online_cores:
+        raise IOError('Failed to set CPUs {}, online CPUs: {}'.format(
+            core_str, shorten_cores(current)))
+    if kwargs.get('settle', True):
+        wait_settle(baseline)
+    return time.time() - start
 
 
 def main():
@@ -108,6 +192,9 @@ def main():
                       help='reset all cores to be online')
     parser.add_option('-l', '--list', action='store_true', default=False,
                       help='list all online and offline cpus')
+    parser.add_option('-j', '--jobs', type='int', default=0,
+                      help='set the number of cores to change at the same '
+                           'time, 0 for all cores (default: %default)')
     options, args = parser.parse_args()
 
     if os.getuid() != 0:
@@ -115,14 +202,14 @@ def main():
         sys.exit(1)
 
     if options.reset:
-        reset()
+        reset(jobs=options.jobs)
     elif options.list:
         list_cpus()
     elif not args:
         parser.print_help()
         sys.exit(1)
     else:
-        set_cpus(args[0], dry=options.dry)
+        set_cpus(args[0], dry=options.dry, jobs=options.jobs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# Author: Lei Xu <eddyxu@gmail.com>
+
+"""Reads the CPU and NUMA topology of the machine from sysfs, and derives the
+CPU sets of the NUMA tests from it.
+"""
+
+from __future__ import print_function
+import os
+import shutil
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'pyro'))
+from pyro import osutil
+import set_cpus
+
+NODE_ROOT = '/sys/devices/system/node'
+CPU_ROOT = '/sys/devices/system/cpu'
+# The policies to place the filebench instances on the CPUs:
+#  - 'compact': packs the instances onto as few nodes as possible.
+#  - 'scatter': spreads each instance over all nodes.
+#  - 'node-per-disk': places the instances of one disk on one node.
+#  - 'no-smt': like 'compact', but uses one CPU of each physical core.
+PLACEMENTS = ['compact', 'scatter', 'node-per-disk', 'no-smt']
+
+
+def read_cpulist(path):
+    """Reads a CPU list file in sysfs, e.g., '0-5,12-17'.
+
+    @return a set of CPUs, or an empty set if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path) as fobj:
+        value = fobj.read().strip()
+    return set(osutil.parse_cpus(value)) if value else set()
+
+
+def read_int(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as fobj:
+        return int(fobj.read())
+
+
+class Topology:
+    """The NUMA nodes, physical cores and SMT siblings of the online CPUs.
+
+    The offline CPUs do not show up in sysfs, so all CPUs must be online
+    (e.g., set_cpus.reset()) before reading the topology.
+    """
+    def __init__(self, node_root=NODE_ROOT, cpu_root=CPU_ROOT):
+        """Reads the topology.
+
+        @param node_root the sysfs directory of the NUMA nodes.
+        @param cpu_root the sysfs directory of the CPUs.
+        """
+        online = read_cpulist(os.path.join(cpu_root, 'online'))
+        # {node: set of CPUs}
+        self.nodes = {}
+        # {node: distance from node 0}
+        self.distances = {}
+        if os.path.isdir(node_root):
+            for name in os.listdir(node_root):
+                if not name.startswith('node') or not name[4:].isdigit():
+                    continue
+                node = int(name[4:])
+                cpus = read_cpulist(os.path.join(node_root, name, 'cpulist'))
+                if online:
+                    cpus &= online
+                if not cpus:
+                    # e.g., a memory-only node.
+                    continue
+                self.nodes[node] = cpus
+                distance_file = os.path.join(node_root, name, 'distance')
+                if os.path.exists(distance_file):
+                    with open(distance_file) as fobj:
+                        self.distances[node] = int(fobj.read().split()[0])
+        if not self.nodes:
+            # The kernel is built without NUMA.
+            self.nodes[0] = online or set(osutil.get_online_cpus())
+
+        # {cpu: (package, core)}
+        self.cores = {}
+        for node, cpus in self.nodes.items():
+            for cpu in cpus:
+                topo_dir = os.path.join(cpu_root, 'cpu{}'.format(cpu),
+                                        'topology')
+                package = read_int(
+                    os.path.join(topo_dir, 'physical_package_id'), node)
+                core = read_int(os.path.join(topo_dir, 'core_id'), cpu)
+                self.cores[cpu] = (package, core)
+
+    def cpus(self):
+        """Returns the set of all CPUs.
+        """
+        return set(self.cores)
+
+    def node_of(self, cpu):
+        """Returns the NUMA node of a CPU.
+        """
+        for node, cpus in self.nodes.items():
+            if cpu in cpus:
+                return node
+        raise ValueError('Unknown CPU: {}'.format(cpu))
+
+    def node_order(self):
+        """Returns the nodes ordered by their distances from node 0, so that
+        the nodes of a spread CPU set are as close as possible.
+        """
+        return sorted(self.nodes,
+                      key=lambda node: (self.distances.get(node, 0), node))
+
+    def physical_cores(self, node):
+        """Returns the physical cores of a node.
+
+        @return a list of the sorted lists of SMT siblings, ordered by their
+        first CPUs.
+        """
+        siblings = {}
+        for cpu in self.nodes[node]:
+            siblings.setdefault(self.cores[cpu], []).append(cpu)
+        return sorted((sorted(cpus) for cpus in siblings.values()),
+                      key=lambda cpus: cpus[0])
+
+    def node_cpus(self, node, ncpus, siblings=False):
+        """Picks CPUs from one node.
+
+        @param ncpus the number of CPUs to pick.
+        @param siblings if True, fills up the SMT siblings of a core before
+        moving to the next core, otherwise uses one CPU of each core before
+        the other siblings.
+        @return a list of ncpus CPUs, or None if the node has fewer CPUs.
+        """
+        cores = self.physical_cores(node)
+        if siblings:
+            cpus = [cpu for core in cores for cpu in core]
+        else:
+            width = max(len(core) for core in cores)
+            cpus = [core[thread] for thread in range(width) for core in cores
+                    if thread < len(core)]
+        if len(cpus) < ncpus:
+            return None
+        return sorted(cpus[:ncpus])
+
+    def spread(self, ncpus, nnodes, siblings=False):
+        """Spreads ncpus CPUs equally over nnodes nodes.
+
+        @param siblings see node_cpus().
+        @return a tuple of (cpus, mems), i.e., the sets of the CPUs and the
+        memory nodes, or None if the CPUs can not be spread equally.
+        """
+        nodes = self.node_order()
+        if nnodes > len(nodes) or ncpus % nnodes:
+            return None
+        cpus = set()
+        for node in nodes[:nnodes]:
+            picked = self.node_cpus(node, ncpus // nnodes, siblings)
+            if picked is None:
+                return None
+            cpus.update(picked)
+        return cpus, set(nodes[:nnodes])
+
+    def numa_configs(self, ncpus=0, siblings=False):
+        """Returns the CPU sets of the same size spread over 1 to N nodes.
+
+        @param ncpus the number of CPUs in each set, 0 for the number of CPUs
+        of the smallest node.
+        @param siblings see node_cpus().
+        @return a list of (cpus, mems) strings, e.g., ('0-5,12-17', '0-1'),
+        ordered by the number of nodes.
+        """
+        if not ncpus:
+            ncpus = min(len(cpus) for cpus in self.nodes.values())
+        configs = []
+        for nnodes in range(1, len(self.nodes) + 1):
+            config = self.spread(ncpus, nnodes, siblings)
+            if config:
+                configs.append(tuple(set_cpus.shorten_cores(x)
+                                     for x in config))
+        return configs
+
+    def placement(self, ndisks, ndirs, policy='compact', allowed=None):
+        """Plans the CPUs and the memory nodes of each filebench instance.
+
+        The instances get the same number of CPUs, and no CPU is shared by
+        two instances. The memory of an instance is bound to the nodes of
+        its CPUs.
+
+        @param ndisks the number of disks.
+        @param ndirs the number of directories (instances) in each disk.
+        @param policy one of PLACEMENTS.
+        @param allowed if set, only places the instances on these CPUs, e.g.,
+        the CPU affinity of the current process.
+        @return a list of (cpus, mems) strings, where the instance of the
+        directory j on the disk i is at i * ndirs + j.
+        @exception ValueError if there are fewer CPUs than the instances.
+        """
+        if policy not in PLACEMENTS:
+            raise ValueError('Unknown placement policy: {}'.format(policy))
+        allowed = set(allowed) if allowed else self.cpus()
+        ninstances = ndisks * ndirs
+        # The CPUs of each node, with the siblings of a core next to each
+        # other.
+        node_cpus = {}
+        for node in self.node_order():
+            cores = [[cpu for cpu in core if cpu in allowed]
+                     for core in self.physical_cores(node)]
+            if policy == 'no-smt':
+                cores = [core[:1] for core in cores]
+            cpus = [cpu for core in cores for cpu in core]
+            if cpus:
+                node_cpus[node] = cpus
+        nodes = [node for node in self.node_order() if node in node_cpus]
+
+        def _split(cpus, num):
+            size = len(cpus) // num
+            if not size:
+                raise ValueError('Can not place {} instances on {} {} CPUs'
+                                 .format(num, len(cpus), policy))
+            return [cpus[i * size:(i + 1) * size] for i in range(num)]
+
+        if policy == 'node-per-disk':
+            disk_nodes = [nodes[disk % len(nodes)] for disk in range(ndisks)]
+            # The disks sharing a node split its CPUs.
+            size = min(len(node_cpus[node]) // (disk_nodes.count(node) * ndirs)
+                       for node in set(disk_nodes))
+            if not size:
+                node = min(set(disk_nodes), key=lambda node: len(
+                    node_cpus[node]) // disk_nodes.count(node))
+                raise ValueError(
+                    'Can not place {} instances on the {} CPUs of node {}'
+                    .format(disk_nodes.count(node) * ndirs,
+                            len(node_cpus[node]), node))
+            groups = []
+            for disk, node in enumerate(disk_nodes):
+                start = disk_nodes[:disk].count(node) * ndirs
+                chunks = _split(node_cpus[node][:size * (start + ndirs)],
+                                start + ndirs)
+                groups += [(chunk, [node]) for chunk in chunks[start:]]
+        else:
+            if policy == 'scatter':
+                # Takes the CPUs from all nodes in turn.
+                width = max(len(cpus) for cpus in node_cpus.values())
+                cpus = [node_cpus[node][idx] for idx in range(width)
+                        for node in nodes if idx < len(node_cpus[node])]
+            else:
+                cpus = [cpu for node in nodes for cpu in node_cpus[node]]
+            groups = [(chunk, set(self.node_of(cpu) for cpu in chunk))
+                      for chunk in _split(cpus, ninstances)]
+        return [(set_cpus.shorten_cores(cpus), set_cpus.shorten_cores(mems))
+                for cpus, mems in groups]
+
+
+def membind_command(mems):
+    """Returns the command prefix to bind the memory of a command to the
+    NUMA nodes with numactl, or an empty string if numactl is not installed.
+
+    @param mems the memory nodes, e.g., '0-1'.
+    """
+    if not mems:
+        return ''
+    if not shutil.which('numactl'):
+        print('numactl is not installed, the memory is not bound to nodes {}.'
+              .format(mems))
+        return ''
+    return 'numactl --membind={} '.format(mems)